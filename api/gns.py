@@ -1,25 +1,21 @@
 import queue
 import socket
 
-from api.gnscontext import GNSContext, SendingHUDPPacket, RecvingHUDPPacket
-from api.gnslogger import GNSLogger
-from api.states.gnssclosewait import GNSStateCloseWait
-from api.states.gnssfinwait1 import GNSStateFinWait1
-from api.states.gnssinitial import GNSStateInitial
-from api.states.gnssbound import GNSStateBound
-from api.states.gnsslastack import GNSStateLastAck
+from api.gnsconnection import GNSConnection
+from batchrecv import DatagramReceiver, DATAGRAM_RECEIVERS, DEFAULT_DATAGRAM_RECEIVER
 from api.states.gnsslisten import GNSStateListen
 from api.states.gnssaccept import GNSStateAccept
+from api.states.gnssbound import GNSStateBound
 from api.states.gnsssynsent import GNSStateSynSent
-from api.states.gnsstate import GNSState
 from api.states.gnssterminated import GNSStateTerminated
-from common import AddrPort, IllegalStateChangeException, SocketTimeoutException, MAX_RETRY
-from hudp import HUDPPacket
+from common import AddrPort, IllegalStateChangeException, SocketTimeoutException, StreamMessage, \
+    PRIORITY_REALTIME, RECV_SLOT_SIZE
+from snapshot import Snapshot
 from threading import Thread
 import time
 
 
-class GameNetSocket:
+class GameNetSocket(GNSConnection):
     """
     Socket-like API for the GameNet protocol.
     The way to use it is really similar to using a TCP socket.
@@ -32,30 +28,20 @@ class GameNetSocket:
     """
 
     def __init__(self):
-        self.context = GNSContext()
-        """
-        Information to be kept track of and share across all states.
-        """
+        super().__init__()
 
-        self.state: GNSState = GNSStateInitial()
+        self.receiver: DatagramReceiver = DATAGRAM_RECEIVERS[DEFAULT_DATAGRAM_RECEIVER]()
         """
-        Current state of the socket.
+        Reads datagrams from the UDP socket in batches for the receiving thread.
         """
 
-        self.logger: GNSLogger = GNSLogger()
+    def setDatagramReceiver(self, name: str, slotSize: int = RECV_SLOT_SIZE):
         """
-        Logging utility for the socket.
+        Select how the receiving thread reads datagrams by name, one of batchrecv.DATAGRAM_RECEIVERS:
+        "recvmmsg" (default on Linux), "poll" (default elsewhere) or "single". Must be called before listen() or connect().
+        Datagrams are received into slots of 'slotSize' bytes, which should hold the MTU of remote's packets.
         """
-
-    def bind(self, addrPort: AddrPort):
-        """
-        Bind this socket to a specific address and port number.
-        """
-        if not isinstance(self.state, GNSStateInitial):
-            raise IllegalStateChangeException("Can only bind() an INITIAL socket")
-        self.context.sendAddrPort = addrPort
-        self.context.sock.bind(addrPort)
-        self.__transition(GNSStateBound())
+        self.receiver = DATAGRAM_RECEIVERS[name](slotSize=slotSize)
 
     def listen(self):
         """
@@ -65,7 +51,7 @@ class GameNetSocket:
             raise IllegalStateChangeException("Can only listen() on a BOUND socket")
         # Start the thread to receive packets from remotes
         Thread(target=self.__recv).start()
-        self.__transition(GNSStateListen())
+        self._transition(GNSStateListen())
 
     def accept(self):
         """
@@ -74,7 +60,7 @@ class GameNetSocket:
         """
         if not isinstance(self.state, GNSStateListen):
             raise IllegalStateChangeException("Can only accept() on a LISTEN socket")
-        self.__transition(GNSStateAccept())
+        self._transition(GNSStateAccept())
         # Start the thread to process incoming and outgoing packets.
         Thread(target=self.__routine).start()
         # Start the thread to send packets to remote.
@@ -99,14 +85,11 @@ class GameNetSocket:
             raise IllegalStateChangeException("Can only connect() on a BOUND socket")
 
         # Send the first SYN packet to initiate the 3-way handshake.
-        self.context.destAddrPort = addrPort
-        syn = HUDPPacket.create(self.context.seq, 0, isReliable=True, isSyn=True)
-        self.context.seq += 1
-        self.context.sendBuffer.put(SendingHUDPPacket(syn))
+        self._queueSyn(addrPort)
 
         # Transition to a transient state
         self.context.stateSemaphore.acquire()
-        self.__transition(GNSStateSynSent())
+        self._transition(GNSStateSynSent())
         self.context.stateSemaphore.release()
 
         # Start all threads to manage operations of the socket
@@ -116,22 +99,42 @@ class GameNetSocket:
 
         self.context.connectSemaphore.acquire()
 
-    def send(self, data: bytes, isReliable: bool):
+    def send(self, data: bytes, isReliable: bool, stream: int = 0, priority: int = PRIORITY_REALTIME):
         """
         Send data to remote. A connection must be established before this.
         :param data: Information to be sent to remote.
         :param isReliable: True if Reliable channel is to be used. False otherwise.
+        :param stream: Stream to send on, from 0 to MAX_STREAMS - 1. Reliable data is delivered in order of its
+                       stream only, so a packet lost on one stream does not hold back the others.
+        :param priority: Priority class, PRIORITY_CRITICAL, PRIORITY_REALTIME or PRIORITY_BULK. Reliable packets
+                         held back by the congestion window are sent by class, see setScheduling(), and other
+                         packets sent at once go out most important class first.
         :return:
         """
-        packet = HUDPPacket.create(self.context.seq, self.context.ack, data, isReliable=isReliable, isAck=isReliable)
-        # Only increment sequence number if packet is reliable
-        if not packet.isUnreliable():
-            self.context.seq += len(data)
-        self.context.sendBuffer.put(SendingHUDPPacket(packet))
+        self._queueData(data, isReliable, stream, priority)
 
-    def recv(self, timeout=1.000) -> bytes:
+    def sendKeyed(self, key: int, data: bytes):
+        """
+        Send the latest state of 'key', e.g. the position of an entity, on the unreliable channel.
+        Remote drops the updates of a key that arrive after a newer one, and an update not sent yet is replaced
+        by the next one of its key.
+        :param key: ID of the state, from 0 to 2^32 - 1.
+        :param data: Latest state to be sent to remote.
+        """
+        self._queueKeyed(key, data)
+
+    def sendSnapshot(self, snapshot: Snapshot):
+        """
+        Send the state of the world on the unreliable channel, delta-encoded against the latest snapshot that
+        remote acknowledged, so that only the entities that changed since then are sent.
+        :param snapshot: Encoded state of each entity, keyed by entity ID.
         """
-        Return data sent from remote. This function will block until there is data to receive.
+        self._queueSnapshot(snapshot)
+
+    def recv(self, timeout=1.000) -> StreamMessage:
+        """
+        Return data sent from remote, with the stream it was sent on in its 'stream' attribute.
+        This function will block until there is data to receive.
         A connection must be established before this.
         """
         try:
@@ -140,145 +143,74 @@ class GameNetSocket:
         except queue.Empty:
             raise SocketTimeoutException()
 
+    def recvSnapshot(self, timeout=1.000) -> Snapshot:
+        """
+        Return the next snapshot sent from remote, rebuilt in full. This function will block until there is one.
+        Snapshots that arrive after a newer one are dropped.
+        """
+        try:
+            return self.context.snapshotBuffer.get(timeout=timeout)
+        except queue.Empty:
+            raise SocketTimeoutException()
+
     def close(self):
         """
         Close the connection. A connection must be established before this.
         """
-        fin = HUDPPacket.create(self.context.seq, self.context.ack, isReliable=True, isFin=True)
-        self.context.seq += 1
-        self.context.sendBuffer.put(SendingHUDPPacket(fin))
-
-        # Semaphore is needed to prevent race-conditions from multiple threads trying to change states.
-        self.context.stateSemaphore.acquire()
-        if isinstance(self.state, GNSStateCloseWait):
-            self.__transition(GNSStateLastAck())
-        else:
-            self.__transition(GNSStateFinWait1())
-        self.context.stateSemaphore.release()
+        self._queueFin()
         self.context.closeSemaphore.acquire()
         return
 
-    def setEnableLogSend(self, newValue: bool):
-        """
-        Turn on logging for sent packets
-        """
-        self.logger.setEnableLogSend(newValue)
-
-    def setEnableLogRecv(self, newValue: bool):
-        """
-        Turn on logging for received packets
-        """
-        self.logger.setEnableLogRecv(newValue)
-
-    def setEnableLogMetrics(self, newValue: bool):
-        """
-        Turn on logging for performance metrics
-        """
-        self.logger.setEnableLogMetrics(newValue)
-
-    def __transition(self, newState: GNSState):
-        """
-        Transition the socket's state to a new one.
-        :param newState: The new state to be changed to.
-        """
-        self.logger.logInfo(f"State changed from {self.state.__class__.__name__} to {newState.__class__.__name__}")
-        self.state = newState
-
     def __routine(self):
         """
-        Retrieves incoming and outgoing packets and process them accordingly.
-        This function is executed once every 10 milliseconds to ensure low latency.
+        Retrieves incoming packets and process them accordingly. This function is executed in its own thread.
+        It sleeps until a packet arrives, the user changes the state or the deadline of the current state is reached.
         """
         while True:
             # If state becomes TERMINATED, terminates this thread
             if isinstance(self.state, GNSStateTerminated):
                 self.logger.logMetrics()
+                # Wake up the sending thread so that it terminates too
+                self.context.sendEvent.set()
                 break
 
-            # Repeatedly process packets until the state does not change anymore
-            self.context.stateSemaphore.acquire()
-            newState = self.state.process(self.context)
-            while type(self.state) is not type(newState):
-                self.__transition(newState)
-                newState = self.state.process(self.context)
-            self.context.stateSemaphore.release()
+            self.context.routineEvent.clear()
+            self._runStateMachine()
 
-            # Send back Pure ACK if needed
-            if self.context.shouldSendAck:
-                self.context.shouldSendAck = False
-                self.context.sendWindow.put(
-                    SendingHUDPPacket(HUDPPacket.createPureAck(self.context.seq, self.context.ack)))
-
-            time.sleep(0.001)
+            # Sleep until a packet arrives, the user changes the state or the state's deadline is reached
+            if not isinstance(self.state, GNSStateTerminated):
+                deadline = self.state.deadline(self.context)
+                self.context.routineEvent.wait(None if deadline is None else max(0.0, deadline - time.time()))
 
     def __send(self):
         """
-        Sends all packets in 'sendWindow'. This function is executed in its own thread.
+        Sends all packets in 'sendWindow' and 'newPackets' and the packets in 'sendBuffer' that timed out.
+        This function is executed in its own thread. It sleeps until a packet is queued
+        or the first packet in 'sendBuffer' times out.
         """
         while True:
             # If state becomes TERMINATED, terminates this thread
             if isinstance(self.state, GNSStateTerminated):
                 break
 
-            currentTime = time.time()
-
-            # Put queued packets into 'sendWindow'
-            sendBufferLen = self.context.sendBuffer.qsize()
-            for _ in range(sendBufferLen):
-                sendingPacket = self.context.sendBuffer.get()
-                packet = sendingPacket.packet
-
-                # If this packet is reliable and has already been sent and ACKed by remote
-                if packet.isReliable() and sendingPacket.retryLeft < MAX_RETRY and sendingPacket.packet.seq < self.context.rec:
-                    continue
-
-                if sendingPacket.retryAt < currentTime:
-                    self.context.sendWindow.put(sendingPacket)
-                else:
-                    self.context.sendBuffer.put(sendingPacket)
-                if packet.isUnreliable():
-                    pass
-
-            sendWindowLen = self.context.sendWindow.qsize()
-            for _ in range(sendWindowLen):
-                sendingPacket = self.context.sendWindow.get()
-                packet = sendingPacket.packet
-
-                # If this packet is reliable and has already been sent and ACKed by remote
-                if packet.isReliable() and sendingPacket.retryLeft < MAX_RETRY and sendingPacket.packet.seq < self.context.rec:
-                    continue
-
-                packetBytes = sendingPacket.packet.toBytes()
-                if self.context.destAddrPort:
-                    self.logger.logSend(sendingPacket)
-                    self.context.sock.sendto(packetBytes, self.context.destAddrPort)
-                else:
-                    raise RuntimeError("This branch is not supposed to be matched")
-                sendingPacket.decrementRetry()
+            self.context.sendEvent.clear()
+            self._sendPackets(self.context.sock.sendto, time.time())
 
-                # If there are still retries left, put it back into the buffer
-                if sendingPacket.retryLeft > 0:
-                    self.context.sendBuffer.put(sendingPacket)
+            # Sleep until a new packet is queued or the first packet in 'sendBuffer' times out
+            nextRetryAt = self._nextRetryAt()
+            self.context.sendEvent.wait(None if nextRetryAt is None else max(0.0, nextRetryAt - time.time()))
 
     def __recv(self):
         """
         Receives packets in from socket. This function is executed in its own thread.
+        Every wake-up takes all the datagrams waiting in the socket and hands them over as one batch.
         """
         while True:
             # If state becomes TERMINATED, terminates this thread
             if isinstance(self.state, GNSStateTerminated):
                 break
             try:
-                data, addrPort = self.context.sock.recvfrom(16384)
-                # Ensure packets pass checksum
-                if HUDPPacket.verifyChecksum(data):
-                    # If connection is established and address does not match, drop it
-                    if self.context.destAddrPort is not None and addrPort != self.context.destAddrPort:
-                        continue
-                    packet = HUDPPacket.fromBytes(data)
-                    self.logger.logRecv(packet)
-                    if packet.isReliable() and packet.isDataPacket():
-                        self.context.shouldSendAck = True
-                    self.context.recvWindow.put(RecvingHUDPPacket(HUDPPacket.fromBytes(data), addrPort))
+                # Datagrams are verified in the receiver's buffer, only their content is copied out
+                self._receiveBatch(self.receiver.receive(self.context.sock))
             except socket.timeout:
                 continue
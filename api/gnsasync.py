@@ -0,0 +1,233 @@
+import asyncio
+import queue
+from threading import Semaphore
+from typing import List, Optional, Tuple
+
+from api.gnsconnection import GNSConnection
+from api.states.gnsslisten import GNSStateListen
+from api.states.gnssaccept import GNSStateAccept
+from api.states.gnssbound import GNSStateBound
+from api.states.gnsssynsent import GNSStateSynSent
+from api.states.gnssterminated import GNSStateTerminated
+from common import AddrPort, IllegalStateChangeException, SocketTimeoutException, StreamMessage, \
+    PRIORITY_REALTIME
+from snapshot import Snapshot
+import time
+
+
+class AsyncGameNetSocket(GNSConnection, asyncio.DatagramProtocol):
+    """
+    asyncio version of GameNetSocket. It behaves the same way on the wire and goes through the same states,
+    but connect(), accept(), recv() and close() are coroutines.
+
+    Instead of running its own threads, the socket is an asyncio.DatagramProtocol: the state machine runs on
+    the event loop whenever datagrams arrive, data is queued or a timer fires, so a single event loop can
+    drive thousands of connections.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        """
+        Event loop running this socket, set when it starts listening or connecting.
+        """
+
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        """
+        Transport wrapping the UDP socket of the context.
+        """
+
+        self.recvQueue: Optional[asyncio.Queue] = None
+        """
+        Data ready to be received by the user. Filled from 'recvBuffer' of the context after each step.
+        """
+
+        self.snapshotQueue: Optional[asyncio.Queue] = None
+        """
+        Snapshots ready to be received by the user. Filled from 'snapshotBuffer' of the context after each step.
+        """
+
+        self.waiters: List[Tuple[Semaphore, asyncio.Future]] = []
+        """
+        Coroutines waiting for a semaphore of the context to be released by a state.
+        """
+
+        self.isStepScheduled = False
+        """
+        Whether a step is already scheduled, so that packets arriving together are processed together.
+        """
+
+        self.timer: Optional[asyncio.TimerHandle] = None
+        """
+        Timer for the next state deadline or retransmission.
+        """
+
+    async def listen(self):
+        """
+        Begin listening on connection requests. The socket must be bound before this.
+        """
+        if not isinstance(self.state, GNSStateBound):
+            raise IllegalStateChangeException("Can only listen() on a BOUND socket")
+        await self.__open()
+        self._transition(GNSStateListen())
+
+    async def accept(self):
+        """
+        Begin accepting the connection requests. The socket must be listened on before this.
+        Return after connection with a remote is established.
+        """
+        if not isinstance(self.state, GNSStateListen):
+            raise IllegalStateChangeException("Can only accept() on a LISTEN socket")
+        self._transition(GNSStateAccept())
+        self.__wake()
+        await self.__waitFor(self.context.acceptSemaphore)
+
+    async def connect(self, addrPort: AddrPort):
+        """
+        Attempts to connect to an address and port number. The socket must be bound before this.
+        See GameNetSocket.connect() for why binding is required.
+        """
+        if not isinstance(self.state, GNSStateBound):
+            raise IllegalStateChangeException("Can only connect() on a BOUND socket")
+        self._queueSyn(addrPort)
+        self._transition(GNSStateSynSent())
+        await self.__open()
+        self.__wake()
+        await self.__waitFor(self.context.connectSemaphore)
+
+    def send(self, data: bytes, isReliable: bool, stream: int = 0, priority: int = PRIORITY_REALTIME):
+        """
+        Send data to remote. A connection must be established before this.
+        Does not block, the data is sent on the next iteration of the event loop.
+        :param data: Information to be sent to remote.
+        :param isReliable: True if Reliable channel is to be used. False otherwise.
+        :param stream: Stream to send on. See GameNetSocket.send().
+        :param priority: Priority class. See GameNetSocket.send().
+        """
+        self._queueData(data, isReliable, stream, priority)
+        self.__wake()
+
+    def sendKeyed(self, key: int, data: bytes):
+        """
+        Send the latest state of 'key' on the unreliable channel. See GameNetSocket.sendKeyed().
+        Does not block, the data is sent on the next iteration of the event loop.
+        """
+        self._queueKeyed(key, data)
+        self.__wake()
+
+    def sendSnapshot(self, snapshot: Snapshot):
+        """
+        Send the state of the world on the unreliable channel. See GameNetSocket.sendSnapshot().
+        Does not block, the data is sent on the next iteration of the event loop.
+        """
+        self._queueSnapshot(snapshot)
+        self.__wake()
+
+    async def recv(self, timeout=1.000) -> StreamMessage:
+        """
+        Return data sent from remote, with the stream it was sent on in its 'stream' attribute,
+        waiting until there is data to receive.
+        A connection must be established before this.
+        """
+        try:
+            return await asyncio.wait_for(self.recvQueue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise SocketTimeoutException()
+
+    async def recvSnapshot(self, timeout=1.000) -> Snapshot:
+        """
+        Return the next snapshot sent from remote, waiting until there is one. See GameNetSocket.recvSnapshot().
+        """
+        try:
+            return await asyncio.wait_for(self.snapshotQueue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise SocketTimeoutException()
+
+    async def close(self):
+        """
+        Close the connection. A connection must be established before this.
+        """
+        self._queueFin()
+        self.__wake()
+        await self.__waitFor(self.context.closeSemaphore)
+
+    def datagram_received(self, data: bytes, addr: AddrPort):
+        if self._receive(data, addr):
+            self.__wake()
+
+    def error_received(self, exc: Exception):
+        self.logger.logInfo(f"Socket error: {exc}")
+
+    async def __open(self):
+        """
+        Attach the UDP socket of the context to the running event loop.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.recvQueue = asyncio.Queue()
+        self.snapshotQueue = asyncio.Queue()
+        self.transport, _ = await self.loop.create_datagram_endpoint(lambda: self, sock=self.context.sock)
+
+    async def __waitFor(self, semaphore: Semaphore):
+        """
+        Wait until a state releases the semaphore, i.e. the equivalent of semaphore.acquire() for the event loop.
+        """
+        if semaphore.acquire(blocking=False):
+            return
+        future = self.loop.create_future()
+        self.waiters.append((semaphore, future))
+        await future
+
+    def __wake(self):
+        """
+        Schedule a step on the event loop, unless one is already scheduled.
+        """
+        if not self.isStepScheduled:
+            self.isStepScheduled = True
+            self.loop.call_soon(self.__step)
+
+    def __step(self):
+        """
+        Run the state machine, send whatever is ready, hand received data to the user
+        and arm the timer for the next deadline. The equivalent of one pass of both GameNetSocket threads.
+        """
+        self.isStepScheduled = False
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if isinstance(self.state, GNSStateTerminated) or self.transport.is_closing():
+            return
+
+        self._runStateMachine()
+        self._sendPackets(self.transport.sendto, time.time())
+
+        while True:
+            try:
+                self.recvQueue.put_nowait(self.context.recvBuffer.get_nowait())
+            except queue.Empty:
+                break
+        while True:
+            try:
+                self.snapshotQueue.put_nowait(self.context.snapshotBuffer.get_nowait())
+            except queue.Empty:
+                break
+
+        pendingWaiters = []
+        for semaphore, future in self.waiters:
+            if future.done():
+                continue
+            if semaphore.acquire(blocking=False):
+                future.set_result(None)
+            else:
+                pendingWaiters.append((semaphore, future))
+        self.waiters = pendingWaiters
+
+        if isinstance(self.state, GNSStateTerminated):
+            self.logger.logMetrics()
+            self.transport.close()
+            return
+
+        deadlines = [deadline for deadline in (self.state.deadline(self.context), self._nextRetryAt())
+                     if deadline is not None]
+        if deadlines:
+            self.timer = self.loop.call_later(max(0.0, min(deadlines) - time.time()), self.__wake)
@@ -0,0 +1,865 @@
+import queue
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from api.gnscontext import CoalescingBatch, GNSContext, SendingHUDPPacket, RecvingHUDPPacket
+from batchrecv import Datagram
+from snapshot import Snapshot
+from api.gnslogger import GNSLogger
+from api.states.gnssclosewait import GNSStateCloseWait
+from api.states.gnssfinwait1 import GNSStateFinWait1
+from api.states.gnssinitial import GNSStateInitial
+from api.states.gnssbound import GNSStateBound
+from api.states.gnsslastack import GNSStateLastAck
+from api.states.gnsstate import GNSState
+from common import AddrPort, IllegalStateChangeException, MAX_RETRY, MAX_DATAGRAM_SIZE, TIMER_RESOLUTION, \
+    COALESCING_MTU, ACK_EVERY, ACK_DELAY, FRAGMENT_MTU, MAX_MESSAGE_SIZE, COMPRESSION_LEVEL, MAX_STREAMS, \
+    DEFAULT_SCHEDULER, PRIORITY_NAMES, PRIORITY_REALTIME, PRIORITY_WEIGHTS, CHANNEL_NAMES, STATS_PORT
+from compression import PayloadCompressor
+from congestion import CONGESTION_CONTROLS
+from eventlog import CONSOLE_SINK, FileSink
+from stageprofiler import PROFILER, enableFromEnvironment
+from scheduler import SCHEDULERS
+from statsexport import StatsExporter
+from hudp import HUDPPacket, HEADER_SIZE, MAX_SACK_BLOCKS, MESSAGE_HEADER, FRAGMENT_HEADER, KEYED_HEADER, \
+    STREAM_HEADER
+
+SendTo = Callable[[memoryview, AddrPort], object]
+"""
+Function that sends a datagram to an address, e.g. socket.sendto() or DatagramTransport.sendto().
+"""
+
+
+class GNSConnection:
+    """
+    Core of a GameNet connection that does not perform any I/O by itself: the state machine, the context
+    shared by all states and the bookkeeping for sending and receiving packets.
+
+    GameNetSocket drives it with threads and AsyncGameNetSocket drives it from an asyncio event loop,
+    so that both behave exactly the same on the wire.
+    """
+
+    def __init__(self, context: Optional[GNSContext] = None, datagram: Optional[bytearray] = None):
+        """
+        :param context: Context of the connection. A new one with its own UDP socket is created if None.
+        :param datagram: Buffer to encode outgoing packets into, which may be shared by connections that are
+                         sent from the same thread. A new one is allocated if None.
+        """
+        self.context = context or GNSContext()
+        """
+        Information to be kept track of and share across all states.
+        """
+
+        self.state: GNSState = GNSStateInitial()
+        """
+        Current state of the socket.
+        """
+
+        self.logger: GNSLogger = GNSLogger()
+        """
+        Logging utility for the socket.
+        """
+
+        self.datagram = datagram or bytearray(MAX_DATAGRAM_SIZE)
+        """
+        Packets are encoded into this buffer right before being sent to avoid allocating per packet.
+        """
+
+        self.datagramView = memoryview(self.datagram)
+
+        enableFromEnvironment()
+
+    def bind(self, addrPort: AddrPort):
+        """
+        Bind this socket to a specific address and port number.
+        """
+        if not isinstance(self.state, GNSStateInitial):
+            raise IllegalStateChangeException("Can only bind() an INITIAL socket")
+        self.context.sendAddrPort = addrPort
+        self.context.sock.bind(addrPort)
+        self._transition(GNSStateBound())
+
+    def setEnableCrc(self, newValue: bool):
+        """
+        Offer CRC32 checksums to remote during the 3-way handshake. CRC32 is only used if both hosts offer it,
+        otherwise the connection falls back to the 1s complement checksum. Must be called before connect() or accept().
+        """
+        self.context.enableCrc = newValue
+
+    def setCompression(self, dictionary: Optional[bytes], level: int = COMPRESSION_LEVEL):
+        """
+        Offer zlib compression of payloads with a preset 'dictionary', e.g. typical payloads concatenated, to remote
+        during the 3-way handshake. Compression is only used if remote offers it with the same dictionary.
+        None disables it. Must be called before connect() or accept().
+        """
+        self.context.compressor = None if dictionary is None else PayloadCompressor(dictionary, level)
+
+    def setCongestionControl(self, name: str):
+        """
+        Select the congestion control algorithm of reliable packets by name, one of
+        congestion.CONGESTION_CONTROLS: "none" (default), "newreno" or "cubic". Must be called before connect() or accept().
+        """
+        self.context.congestion = CONGESTION_CONTROLS[name]()
+
+    def setScheduling(self, policy: str = DEFAULT_SCHEDULER, weights: Sequence[int] = PRIORITY_WEIGHTS):
+        """
+        Select how the reliable packets held back by the congestion window are shared between the priority classes,
+        one of scheduler.SCHEDULERS: "strict" (default) always sends the most important class first, "wfq" shares
+        the window in proportion to 'weights', one per class of PRIORITY_NAMES. Must be called before connect() or accept().
+        """
+        self.context.pendingSends = SCHEDULERS[policy](weights)
+
+    def setEnablePacing(self, newValue: bool):
+        """
+        Spread reliable packets over the RTT instead of sending a whole congestion window at once. Off by default.
+        """
+        self.context.enablePacing = newValue
+
+    def setCoalescing(self, latencyBudget: Optional[float], mtu: int = COALESCING_MTU):
+        """
+        Coalesce small messages sent on the same channel within 'latencyBudget' seconds, e.g. 0.002, into packets
+        of at most 'mtu' bytes. Remote splits them back into one recv() result each. None disables coalescing.
+        """
+        self.context.coalescingBudget = latencyBudget
+        self.context.coalescingMtu = mtu
+        if latencyBudget is None:
+            self._flushBatches()
+
+    def setFragmentation(self, mtu: Optional[int] = FRAGMENT_MTU):
+        """
+        Send messages that do not fit in a packet of 'mtu' bytes in fragments, each retransmitted on its own.
+        Remote rebuilds them into one recv() result. None sends every message in a single packet,
+        left to IP fragmentation.
+        """
+        if mtu is not None and mtu <= HEADER_SIZE + STREAM_HEADER.size + FRAGMENT_HEADER.size:
+            raise ValueError(f"MTU of {mtu} bytes leaves no room for the data of a fragment")
+        self.context.fragmentMtu = mtu
+
+    def setAckPolicy(self, every: int = ACK_EVERY, delay: float = ACK_DELAY):
+        """
+        Send the ACK once 'every' reliable data packets are received, or 'delay' seconds after the first of them,
+        e.g. 2 and 0.005. Until then, the ACK rides on any data packet sent to remote instead of a pure ACK.
+        The default ACKs every packet right away, unless data is sent at the same time.
+        """
+        self.context.ackEvery = every
+        self.context.ackDelay = delay
+
+    def setEnableLogSend(self, newValue: bool):
+        """
+        Turn on logging for sent packets
+        """
+        self.logger.setEnableLogSend(newValue)
+
+    def setEnableLogRecv(self, newValue: bool):
+        """
+        Turn on logging for received packets
+        """
+        self.logger.setEnableLogRecv(newValue)
+
+    def setEnableLogMetrics(self, newValue: bool):
+        """
+        Turn on logging for performance metrics
+        """
+        self.logger.setEnableLogMetrics(newValue)
+
+    def setEnableLogInfo(self, newValue: bool):
+        """
+        Turn on logging for state changes and other information
+        """
+        self.logger.setEnableLogInfo(newValue)
+
+    def setLogFile(self, path: Optional[str]):
+        """
+        Write the logs to the binary log file at 'path' instead of the standard output, to be rendered later with
+        `python3 -m eventlog <path>`. None goes back to the standard output.
+        """
+        self.logger.setSink(CONSOLE_SINK if path is None else FileSink(path))
+
+    def stats(self) -> dict:
+        """
+        Return a snapshot of the counters and gauges of the connection, which may be taken from any thread while
+        it runs: packets and bytes sent and received per channel, retransmissions, duplicates, drops, skips,
+        RTT, congestion window, depth of the queues, and latency and throughput of the packets received.
+        The depth of 'sendBuffer' is the number of reliable data packets sent and not yet acknowledged.
+        Times are in seconds, and values not known yet are None.
+        """
+        context = self.context
+        counters = context.counters
+        cwnd = context.congestion.cwnd
+        channelMetrics = {"reliable": self.logger.reliableMetrics, "unreliable": self.logger.unreliableMetrics}
+        return {
+            "state": type(self.state).__name__,
+            "packetsSent": dict(zip(CHANNEL_NAMES, counters.packetsSent)),
+            "bytesSent": dict(zip(CHANNEL_NAMES, counters.bytesSent)),
+            "packetsReceived": dict(zip(CHANNEL_NAMES, counters.packetsReceived)),
+            "bytesReceived": dict(zip(CHANNEL_NAMES, counters.bytesReceived)),
+            "retransmits": counters.retransmits,
+            "duplicates": counters.duplicates,
+            "checksumFailures": counters.checksumFailures,
+            "addressMismatches": counters.addressMismatches,
+            "skipAheads": counters.skipAheads,
+            "streamSkips": context.streams.skips,
+            "rtt": {"srtt": context.rtt.srtt, "rttvar": context.rtt.rttvar, "rto": context.rtt.rto},
+            "congestionWindow": None if cwnd == float("inf") else cwnd,
+            "queues": {
+                "sendWindow": context.sendWindow.qsize(),
+                "newPackets": len(context.newPackets),
+                "pendingSends": len(context.pendingSends),
+                # Reliable data in flight, without the control packets whose timers wait to fire after their ACK
+                "sendBuffer": len(context.unackedPackets),
+                "recvWindow": context.recvWindow.qsize(),
+                "reassembly": len(context.reassembly),
+                "recvBuffer": context.recvBuffer.qsize(),
+            },
+            "latency": {channel: {
+                "mean": metrics.latency.mean,
+                "p50": metrics.latencyPercentile(50),
+                "p99": metrics.latencyPercentile(99),
+                "p999": metrics.latencyPercentile(99.9),
+            } for channel, metrics in channelMetrics.items()},
+            "throughput": {channel: metrics.currentThroughput() for channel, metrics in channelMetrics.items()},
+        }
+
+    def serveStats(self, addrPort: AddrPort = ("127.0.0.1", STATS_PORT)) -> StatsExporter:
+        """
+        Serve stats() over HTTP at 'addrPort', at /metrics for Prometheus and at /stats as JSON, until the returned
+        exporter is closed.
+        """
+        return StatsExporter(lambda: {self.statsLabel(): self.stats()}, addrPort).start()
+
+    def statsLabel(self) -> str:
+        """
+        Return the label of this connection in the exported stats: the address and port number of remote.
+        """
+        destAddrPort = self.context.destAddrPort
+        return "unconnected" if destAddrPort is None else f"{destAddrPort[0]}:{destAddrPort[1]}"
+
+    def _transition(self, newState: GNSState):
+        """
+        Transition the socket's state to a new one.
+        :param newState: The new state to be changed to.
+        """
+        self.logger.logInfo(f"State changed from {self.state.__class__.__name__} to {newState.__class__.__name__}")
+        self.state = newState
+
+    def _queueSyn(self, addrPort: AddrPort):
+        """
+        Queue the first SYN packet to initiate the 3-way handshake with remote.
+        """
+        self.context.destAddrPort = addrPort
+        compressor = self.context.compressor
+        # The ACK field of a SYN is not significant, an offer of compression carries the ID of the dictionary instead
+        syn = HUDPPacket.create(self.context.seq, 0 if compressor is None else compressor.dictionaryId, isReliable=True,
+                                isSyn=True, isCrc=self.context.enableCrc, isCompressed=compressor is not None)
+        self.context.newPackets.append(SendingHUDPPacket(syn))
+        self.context.sendEvent.set()
+
+    def _queueData(self, data: bytes, isReliable: bool, stream: int = 0, priority: int = PRIORITY_REALTIME):
+        """
+        Queue data to be sent to remote on the reliable or unreliable channel, on 'stream', in class 'priority'.
+        If coalescing is enabled, small messages are held until their batch is full or its latency budget runs out.
+        """
+        if not 0 <= stream < MAX_STREAMS:
+            raise ValueError(f"Stream {stream} is not between 0 and {MAX_STREAMS - 1}")
+        if not 0 <= priority < len(PRIORITY_NAMES):
+            raise ValueError(f"Priority {priority} is not between 0 and {len(PRIORITY_NAMES) - 1}")
+        if self.context.coalescingBudget is None:
+            self.__queuePacket(data, isReliable, stream=stream, priority=priority)
+            return
+
+        framedSize = MESSAGE_HEADER.size + len(data)
+        overhead = HEADER_SIZE + STREAM_HEADER.size
+        channel = (isReliable, stream, priority)
+        with self.context.coalescingLock:
+            batch = self.context.coalescingBatches.get(channel)
+            if batch is None:
+                batch = self.context.coalescingBatches[channel] = CoalescingBatch()
+            if overhead + batch.size + framedSize > self.context.coalescingMtu:
+                self.__flushBatch(channel)
+            # Messages too large to share a packet are sent right away, after the batch to keep them in order
+            if overhead + framedSize > self.context.coalescingMtu:
+                self.__queuePacket(data, isReliable, stream=stream, priority=priority)
+                return
+            if not batch.messages:
+                batch.deadline = time.time() + self.context.coalescingBudget
+                # Wake up the sending thread so that it sleeps until the deadline at the latest
+                self.context.sendEvent.set()
+            batch.messages.append(data)
+            batch.size += framedSize
+
+    def _queueKeyed(self, key: int, data: bytes):
+        """
+        Queue the latest state of 'key' on the unreliable channel, replacing its previous update if it was not sent yet.
+        Updates wait for the coalescing latency budget if coalescing is enabled, and are otherwise sent right away.
+        """
+        if not 0 <= key < 1 << 32:
+            raise ValueError(f"Key {key} does not fit in 32 bits")
+        with self.context.coalescingLock:
+            counter = (self.context.keyCounters.get(key, -1) + 1) % (1 << 32)
+            self.context.keyCounters[key] = counter
+            self.context.keyedUpdates[key] = (counter, data)
+            if self.context.keyedDeadline is None:
+                self.context.keyedDeadline = time.time() + (self.context.coalescingBudget or 0.0)
+        self.context.sendEvent.set()
+
+    def _queueSnapshot(self, snapshot: Snapshot):
+        """
+        Queue a snapshot on the unreliable channel, delta-encoded against the latest one remote acknowledged.
+        """
+        data = self.context.snapshotEncoder.encode(snapshot)
+        with self.context.coalescingLock:
+            self.__queuePacket(data, False, isSnapshot=True)
+
+    def _flushKeyedUpdates(self, currentTime: Optional[float] = None):
+        """
+        Queue the unsent keyed updates if their latency budget runs out by 'currentTime', or in any case if None.
+        """
+        with self.context.coalescingLock:
+            if self.context.keyedUpdates and (currentTime is None or self.context.keyedDeadline <= currentTime):
+                self.__flushKeyedUpdates()
+
+    def _flushBatches(self, currentTime: Optional[float] = None):
+        """
+        Queue the coalesced messages whose latency budget runs out by 'currentTime', or all of them if None.
+        """
+        with self.context.coalescingLock:
+            for channel, batch in self.context.coalescingBatches.items():
+                if batch.messages and (currentTime is None or batch.deadline <= currentTime):
+                    self.__flushBatch(channel)
+
+    def _queueFin(self):
+        """
+        Queue a FIN packet and transition into the matching closing state.
+        """
+        with self.context.coalescingLock:
+            # Messages still being coalesced must be sent before the FIN
+            for channel in self.context.coalescingBatches:
+                self.__flushBatch(channel)
+            self.__flushKeyedUpdates()
+            fin = HUDPPacket.create(self.context.seq, self.context.ack, isReliable=True, isFin=True,
+                                    isCrc=self.context.useCrc)
+
+        # Semaphore is needed to prevent race-conditions from multiple threads trying to change states.
+        self.context.stateSemaphore.acquire()
+        if isinstance(self.state, GNSStateCloseWait):
+            self._transition(GNSStateLastAck())
+        else:
+            self._transition(GNSStateFinWait1())
+        self.context.stateSemaphore.release()
+
+        # Only sent once in the closing state, otherwise its ACK could be dropped by the previous state
+        self.context.newPackets.append(SendingHUDPPacket(fin))
+        self.context.sendEvent.set()
+        self.context.routineEvent.set()
+
+    def _receive(self, data, addrPort: AddrPort) -> bool:
+        """
+        Verify and parse a datagram from the UDP socket and place it into 'recvWindow'.
+        Return True if the packet was accepted. False if it was dropped.
+        """
+        recvingPacket = self.__parse(data, addrPort)
+        if recvingPacket is None:
+            return False
+        timed = PROFILER.enabled and PROFILER.sample("enqueue")
+        if timed:
+            start = time.perf_counter()
+        self.context.recvWindow.put(recvingPacket)
+        self.context.routineEvent.set()
+        if timed:
+            PROFILER.record("enqueue", time.perf_counter() - start)
+        return True
+
+    def _receiveBatch(self, datagrams: List[Datagram]) -> int:
+        """
+        Verify and parse a batch of datagrams from the UDP socket and place them into 'recvWindow' at once.
+        Return the number of packets that were accepted.
+        """
+        recvingPackets = []
+        for data, addrPort in datagrams:
+            recvingPacket = self.__parse(data, addrPort)
+            if recvingPacket is not None:
+                recvingPackets.append(recvingPacket)
+        if recvingPackets:
+            timed = PROFILER.enabled and PROFILER.sample("enqueue")
+            if timed:
+                start = time.perf_counter()
+            self.context.recvWindow.putMany(recvingPackets)
+            self.context.routineEvent.set()
+            if timed:
+                PROFILER.record("enqueue", time.perf_counter() - start)
+        return len(recvingPackets)
+
+    def __parse(self, data, addrPort: AddrPort) -> Optional[RecvingHUDPPacket]:
+        """
+        Verify and parse a datagram, and take in its ACK and SACK blocks.
+        Return the packet to be processed by the state, or None if it was dropped.
+        """
+        if PROFILER.enabled:
+            return self.__profiledParse(data, addrPort)
+        # Ensure packets pass checksum
+        if not HUDPPacket.verifyChecksum(data):
+            self.context.counters.checksumFailures += 1
+            return None
+        return self.__parseVerified(data, addrPort)
+
+    def __profiledParse(self, data, addrPort: AddrPort) -> Optional[RecvingHUDPPacket]:
+        """
+        Same as __parse(), timing the checksum and the parsing for the profiler.
+        """
+        timed = PROFILER.sample("checksum")
+        start = time.perf_counter()
+        isValid = HUDPPacket.verifyChecksum(data)
+        if timed:
+            PROFILER.record("checksum", time.perf_counter() - start)
+        if not isValid:
+            self.context.counters.checksumFailures += 1
+            return None
+        timed = PROFILER.sample("parse")
+        start = time.perf_counter()
+        recvingPacket = self.__parseVerified(data, addrPort)
+        if timed:
+            PROFILER.record("parse", time.perf_counter() - start)
+        return recvingPacket
+
+    def __parseVerified(self, data, addrPort: AddrPort) -> Optional[RecvingHUDPPacket]:
+        """
+        Parse a datagram that passed the checksum, and take in its ACK and SACK blocks.
+        Return the packet to be processed by the state, or None if it was dropped.
+        """
+        # If connection is established and address does not match, drop it
+        if self.context.destAddrPort is not None and addrPort != self.context.destAddrPort:
+            self.context.counters.addressMismatches += 1
+            return None
+        packet = HUDPPacket.fromBytes(data)
+        self.context.counters.countReceived(packet, len(data))
+        self.logger.logRecv(packet)
+        if packet.isAck():
+            self.context.rtt.onAck(packet.ack, time.time())
+            if packet.ack > self.context.ackedSeq:
+                self.context.ackedSeq = packet.ack
+                self.__onAck(packet.ack)
+                # The congestion window may have opened for packets held back
+                if self.context.pendingSends:
+                    self.context.sendEvent.set()
+        if packet.isSnapshotAck():
+            self.context.snapshotEncoder.onAck(packet.snapshotAck())
+        if packet.isSack():
+            sackBlocks = packet.sackBlocks()
+            self.__onSack(sackBlocks)
+            self.context.sackBlocks = sackBlocks
+            self.context.rtt.onSack(self.context.sackBlocks, time.time())
+            if self.context.pendingSends:
+                self.context.sendEvent.set()
+        if packet.isReliable() and packet.isDataPacket():
+            self.context.shouldSendAck = True
+            self.context.unackedSegments += 1
+        return RecvingHUDPPacket(packet, addrPort)
+
+    def _runStateMachine(self):
+        """
+        Process the received packets until the state does not change anymore and send back a pure ACK if needed.
+        """
+        self.context.stateSemaphore.acquire()
+        timed = PROFILER.enabled and PROFILER.sample("process")
+        if timed:
+            start = time.perf_counter()
+        newState = self.state.process(self.context)
+        while type(self.state) is not type(newState):
+            self._transition(newState)
+            newState = self.state.process(self.context)
+        if timed:
+            PROFILER.record("process", time.perf_counter() - start)
+        self.context.stateSemaphore.release()
+
+        # Send back Pure ACK if needed
+        if self.context.shouldSendAck:
+            self.context.shouldSendAck = False
+            self.logger.ackMetrics.due += 1
+            sackBlocks = self.__collectSackBlocks()
+            if sackBlocks:
+                # SACK blocks cannot ride on data packets, report the out-of-order packets right away
+                with self.context.ackLock:
+                    self.context.ackDeadline = None
+                    self.context.unackedSegments = 0
+                    snapshotAck = self.context.snapshotAck
+                    self.context.snapshotAck = None
+                self.logger.ackMetrics.pureAcks += 1
+                self.context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(
+                    self.context.seq, self.context.ack, self.context.useCrc, sackBlocks, snapshotAck)))
+            else:
+                self.__delayAck()
+
+    def _sendPackets(self, sendto: SendTo, currentTime: float):
+        """
+        Send all packets in 'sendWindow' and 'newPackets' and the packets in 'sendBuffer' that timed out by 'currentTime'.
+        First transmissions of reliable packets wait in 'pendingSends' for the congestion window and the pacer.
+        """
+        self.__updateCongestionControl(currentTime)
+        if self.context.coalescingBudget is not None:
+            self._flushBatches(currentTime)
+        if self.context.keyedUpdates:
+            self._flushKeyedUpdates(currentTime)
+
+        while True:
+            try:
+                sendingPacket = self.context.sendWindow.get_nowait()
+            except queue.Empty:
+                break
+            self._transmit(sendingPacket, sendto, currentTime)
+
+        # Packets that are not held back are sent by priority class, and in order within each class
+        unheldPackets: List[List[SendingHUDPPacket]] = [[] for _ in PRIORITY_NAMES]
+        while self.context.newPackets:
+            sendingPacket = self.context.newPackets.popleft()
+            # Reliable packets are numbered as they leave 'pendingSends', control ones included
+            if sendingPacket.packet.isReliable():
+                self.context.pendingSends.append(sendingPacket)
+            else:
+                unheldPackets[sendingPacket.priority].append(sendingPacket)
+        for sendingPackets in unheldPackets:
+            for sendingPacket in sendingPackets:
+                self._transmit(sendingPacket, sendto, currentTime)
+
+        # Only the packets that timed out are taken out of 'sendBuffer'
+        for sendingPacket in self.context.sendBuffer.expire(currentTime):
+            self._transmit(sendingPacket, sendto, currentTime)
+
+        self.__sendPendingPackets(sendto, currentTime)
+        self.__sendDelayedAck(sendto, currentTime)
+
+    def _transmit(self, sendingPacket: SendingHUDPPacket, sendto: SendTo, currentTime: float):
+        """
+        Send a single packet to remote and put it back into 'sendBuffer' if it has retries left.
+        """
+        packet = sendingPacket.packet
+
+        if packet.isReliable() and sendingPacket.retryLeft < MAX_RETRY:
+            # If this packet has already been sent and ACKed by remote
+            if packet.seq < self.context.rec:
+                return
+            # If remote already holds this packet out-of-order, according to its SACK blocks
+            if packet.isDataPacket() and self.__isSacked(packet):
+                return
+
+        # Recorded before sending, as the ACK may be received before sendto() returns
+        attempts = MAX_RETRY - sendingPacket.retryLeft
+        if packet.isDataPacket() and (attempts == 0 or packet.isUnreliable()):
+            # Until the first transmission, 'retryAt' is the time the packet was queued at
+            queueDelay = max(0.0, currentTime - sendingPacket.retryAt)
+            self.logger.queueMetrics.update(sendingPacket.priority, queueDelay)
+            if PROFILER.enabled and PROFILER.sample("sendQueue"):
+                PROFILER.record("sendQueue", queueDelay)
+        if packet.isReliable():
+            if attempts == 0 and packet.isDataPacket():
+                # Added before sending, as the ACK may be received before sendto() returns
+                with self.context.unackedLock:
+                    self.context.unackedPackets[packet.seq] = sendingPacket
+            self.context.rtt.onTransmit(packet.calculateAck() if packet.isDataPacket() else packet.seq + 1,
+                                        currentTime, attempts > 0)
+
+        if self.__isCongestionControlled(sendingPacket):
+            # Further retransmissions of a packet belong to the loss event of its first one,
+            # and the congestion control only reacts to the first loss of each window
+            if attempts == 1:
+                self.context.congestion.onLoss(self.context.sentSeq, currentTime)
+            else:
+                self.context.sentSeq = max(self.context.sentSeq, packet.calculateAck())
+            if self.context.enablePacing:
+                self.context.pacer.consume(packet.size(), currentTime)
+
+        timed = PROFILER.enabled and PROFILER.sample("pack")
+        if timed:
+            start = time.perf_counter()
+        if packet.isDataPacket():
+            self.__piggybackAck(packet)
+
+        if self.context.destAddrPort:
+            size = packet.packInto(self.datagram)
+            self.logger.logSend(sendingPacket)
+            if timed:
+                PROFILER.record("pack", time.perf_counter() - start)
+            timed = PROFILER.enabled and PROFILER.sample("sendto")
+            if timed:
+                start = time.perf_counter()
+            sendto(self.datagramView[:size], self.context.destAddrPort)
+            if timed:
+                PROFILER.record("sendto", time.perf_counter() - start)
+            self.context.counters.countSent(packet, size, attempts > 0 and packet.isReliable())
+        else:
+            raise RuntimeError("This branch is not supposed to be matched")
+
+        # Reliable packets are retransmitted after the RTO, doubled on every retransmission
+        sendingPacket.decrementRetry(currentTime + self.context.rtt.timeout(attempts))
+
+        # If there are still retries left, put it back into the buffer
+        if sendingPacket.retryLeft > 0:
+            self.__schedule(sendingPacket)
+
+    def _nextRetryAt(self) -> Optional[float]:
+        """
+        Return the time at which the first packet in 'sendBuffer' times out, a delayed ACK, a batch of coalesced
+        messages or the keyed updates are due or the pacer lets the next packet of 'pendingSends' through, or None if there is none of them.
+        Packets held back by the congestion window are sent when an ACK arrives instead.
+        """
+        nextRetryAt = self.context.sendBuffer.nextExpiry()
+        ackDeadline = self.context.ackDeadline
+        if ackDeadline is not None:
+            nextRetryAt = ackDeadline if nextRetryAt is None else min(nextRetryAt, ackDeadline)
+        # Copied at once, as the user may add the batch of a new stream meanwhile
+        for batch in list(self.context.coalescingBatches.values()):
+            deadline = batch.deadline
+            if batch.messages and deadline is not None:
+                nextRetryAt = deadline if nextRetryAt is None else min(nextRetryAt, deadline)
+        keyedDeadline = self.context.keyedDeadline
+        if keyedDeadline is not None:
+            nextRetryAt = keyedDeadline if nextRetryAt is None else min(nextRetryAt, keyedDeadline)
+        if self.context.pendingSends and self.__hasCongestionWindowFor(self.context.pendingSends.peek()):
+            readyAt = self.context.pacer.readyAt(time.time())
+            nextRetryAt = readyAt if nextRetryAt is None else min(nextRetryAt, readyAt)
+        return nextRetryAt
+
+    def __delayAck(self):
+        """
+        Make the ACK due after 'ackDelay', or right away once 'ackEvery' reliable data packets are left unACKed.
+        """
+        with self.context.ackLock:
+            delay = 0.0 if self.context.unackedSegments >= self.context.ackEvery else self.context.ackDelay
+            deadline = time.time() + delay
+            if self.context.ackDeadline is None or deadline < self.context.ackDeadline:
+                self.context.ackDeadline = deadline
+        self.context.sendEvent.set()
+
+    def __piggybackAck(self, packet: HUDPPacket):
+        """
+        Make a data packet about to be sent carry the latest ACK, which then no longer needs a pure ACK
+        unless a snapshot must be acknowledged too.
+        """
+        with self.context.ackLock:
+            ack = self.context.ack
+            if packet.ack != ack or not packet.isAck():
+                packet.updateAck(ack)
+            if self.context.ackDeadline is not None and self.context.snapshotAck is None:
+                self.context.ackDeadline = None
+                self.context.unackedSegments = 0
+                self.logger.ackMetrics.piggybacked += 1
+
+    def __sendDelayedAck(self, sendto: SendTo, currentTime: float):
+        """
+        Send a pure ACK if the ACK is due by 'currentTime' and no data packet carried it.
+        """
+        with self.context.ackLock:
+            if self.context.ackDeadline is None or self.context.ackDeadline > currentTime:
+                return
+            self.context.ackDeadline = None
+            self.context.unackedSegments = 0
+            snapshotAck = self.context.snapshotAck
+            self.context.snapshotAck = None
+        self.logger.ackMetrics.pureAcks += 1
+        self._transmit(SendingHUDPPacket(HUDPPacket.createPureAck(
+            self.context.seq, self.context.ack, self.context.useCrc, self.__collectSackBlocks(), snapshotAck)),
+            sendto, currentTime)
+
+    def __queuePacket(self, data: bytes, isReliable: bool, isCoalesced: bool = False, isFragment: bool = False,
+                      isSnapshot: bool = False, stream: int = 0, priority: int = PRIORITY_REALTIME):
+        """
+        Create the packet carrying 'data' and schedule it to be sent right away.
+        Data too large for 'fragmentMtu' is sent in fragments.
+        Reliable packets are numbered on their stream, unreliable ones only carry a stream header off stream 0.
+        """
+        fragmentMtu = self.context.fragmentMtu
+        overhead = HEADER_SIZE + STREAM_HEADER.size
+        if not isFragment and fragmentMtu is not None and overhead + len(data) > fragmentMtu:
+            self.__queueFragments(data, isReliable, fragmentMtu - overhead - FRAGMENT_HEADER.size, isSnapshot, stream,
+                                  priority)
+            return
+        data, isCompressed = self.__compress(data)
+        isStream = isReliable or stream != 0
+        if isStream:
+            streamSeq = self.context.streamSeqs.get(stream, 0) if isReliable else 0
+            if isReliable:
+                self.context.streamSeqs[stream] = (streamSeq + 1) % (1 << 32)
+            # Left uncompressed, so that remote orders the packet before decompressing it
+            data = STREAM_HEADER.pack(stream, streamSeq) + data
+        # Reliable packets are only numbered once they are sent, see __number()
+        packet = HUDPPacket.create(self.context.seq, self.context.ack, data, isReliable=isReliable, isAck=isReliable,
+                                   isCrc=self.context.useCrc, isCoalesced=isCoalesced, isFragment=isFragment,
+                                   isSnapshot=isSnapshot, isCompressed=isCompressed, isStream=isStream)
+        self.context.newPackets.append(SendingHUDPPacket(packet, priority))
+        self.context.sendEvent.set()
+
+    def __queueFragments(self, message: bytes, isReliable: bool, fragmentSize: int, isSnapshot: bool = False,
+                         stream: int = 0, priority: int = PRIORITY_REALTIME):
+        """
+        Queue a message as packets of at most 'fragmentSize' bytes of it each, which are acknowledged and
+        retransmitted independently.
+        """
+        if len(message) > MAX_MESSAGE_SIZE:
+            raise ValueError(f"Message of {len(message)} bytes is larger than {MAX_MESSAGE_SIZE} bytes")
+        messageId = self.context.nextMessageIds[isReliable]
+        self.context.nextMessageIds[isReliable] = (messageId + 1) % (1 << 32)
+        for data in HUDPPacket.fragment(messageId, message, fragmentSize):
+            self.__queuePacket(data, isReliable, isFragment=True, isSnapshot=isSnapshot, stream=stream,
+                               priority=priority)
+
+    def __flushBatch(self, channel: Tuple[bool, int, int]):
+        """
+        Queue the messages coalesced on a channel, stream and priority class as one packet.
+        'coalescingLock' must be held.
+        """
+        batch = self.context.coalescingBatches.get(channel)
+        if batch is None or not batch.messages:
+            return
+        isReliable, stream, priority = channel
+        if len(batch.messages) == 1:
+            self.__queuePacket(batch.messages[0], isReliable, stream=stream, priority=priority)
+        else:
+            self.__queuePacket(HUDPPacket.coalesce(batch.messages), isReliable, isCoalesced=True, stream=stream,
+                               priority=priority)
+        batch.messages = []
+        batch.size = 0
+        batch.deadline = None
+
+    def __flushKeyedUpdates(self):
+        """
+        Queue every unsent keyed update as its own unreliable packet. 'coalescingLock' must be held.
+        """
+        for key, (counter, data) in self.context.keyedUpdates.items():
+            data, isCompressed = self.__compress(KEYED_HEADER.pack(key, counter) + data)
+            packet = HUDPPacket.create(self.context.seq, self.context.ack, data, isCrc=self.context.useCrc, isKeyed=True,
+                                       isCompressed=isCompressed)
+            self.context.newPackets.append(SendingHUDPPacket(packet))
+        self.context.keyedUpdates = {}
+        self.context.keyedDeadline = None
+        self.context.sendEvent.set()
+
+    def __compress(self, data: bytes) -> Tuple[bytes, bool]:
+        """
+        Return the payload to be sent for 'data', compressed if both hosts agreed on it and it is worth it,
+        and whether it was compressed.
+        """
+        if not self.context.useCompression:
+            return data, False
+        compressed = self.context.compressor.compress(data)
+        if compressed is None:
+            return data, False
+        return compressed, True
+
+    def __isCongestionControlled(self, sendingPacket: SendingHUDPPacket) -> bool:
+        """
+        Return True if the packet counts against the congestion window, i.e. it is a reliable data packet.
+        """
+        return sendingPacket.packet.isReliable() and sendingPacket.packet.isDataPacket()
+
+    def __hasCongestionWindowFor(self, sendingPacket: SendingHUDPPacket) -> bool:
+        """
+        Return True if the congestion window has room for the first transmission of the packet.
+        """
+        if not self.__isCongestionControlled(sendingPacket):
+            return True
+        sentSeq, ackedSeq = self.context.sentSeq, self.context.ackedSeq
+        # Packets that remote holds out-of-order have left the network too
+        sackedBytes = sum(max(0, min(end, sentSeq) - max(start, ackedSeq)) for start, end in self.context.sackBlocks)
+        bytesInFlight = max(0, sentSeq - ackedSeq - sackedBytes)
+        return self.context.congestion.canSend(bytesInFlight, sendingPacket.packet.size())
+
+    def __updateCongestionControl(self, currentTime: float):
+        """
+        Report the ACKs received since the last call to the congestion control and update the pacing rate.
+        """
+        ackedSeq = self.context.ackedSeq
+        if ackedSeq > self.context.congestionAck:
+            self.context.congestion.onAck(ackedSeq, ackedSeq - self.context.congestionAck, self.context.rtt.srtt,
+                                          currentTime)
+            self.context.congestionAck = ackedSeq
+
+        srtt = self.context.rtt.srtt
+        cwnd = self.context.congestion.cwnd
+        if srtt is None or cwnd == float("inf"):
+            self.context.pacer.setRate(None)
+        else:
+            self.context.pacer.setRate(self.context.congestion.pacingGain() * cwnd / max(srtt, TIMER_RESOLUTION))
+
+    def __sendPendingPackets(self, sendto: SendTo, currentTime: float):
+        """
+        Send the packets of 'pendingSends' in the order of the scheduler, as long as the congestion window and the pacer
+        allow it.
+        """
+        pendingSends = self.context.pendingSends
+        while pendingSends and self.__hasCongestionWindowFor(pendingSends.peek()):
+            if self.context.enablePacing and self.context.pacer.readyAt(currentTime) > currentTime:
+                break
+            sendingPacket = pendingSends.popleft()
+            self.__number(sendingPacket.packet)
+            self._transmit(sendingPacket, sendto, currentTime)
+
+    def __number(self, packet: HUDPPacket):
+        """
+        Give a reliable packet the next SEQ right before its first transmission. Packets are thus numbered in the
+        order they are sent rather than queued, as the scheduler lets important classes overtake the others:
+        otherwise remote would wait on the gaps of the packets held back, and they would count as in flight.
+        """
+        seq = self.context.seq
+        if packet.isDataPacket():
+            self.context.seq += len(packet.content)
+        else:
+            self.context.seq += 1
+            if packet.isFin():
+                self.context.finAck = self.context.seq
+        packet.updateSeq(seq)
+
+    def __collectSackBlocks(self) -> List[Tuple[int, int]]:
+        """
+        Return the first SEQ ranges of the reliable packets waiting in 'reassembly' past the ACK, merged and in order.
+        """
+        return self.context.reassembly.ranges()[:MAX_SACK_BLOCKS]
+
+    def __isSacked(self, packet: HUDPPacket) -> bool:
+        """
+        Return True if remote reported holding the whole packet in its latest SACK blocks. False otherwise.
+        """
+        end = packet.calculateAck()
+        return any(start <= packet.seq and end <= blockEnd for start, blockEnd in self.context.sackBlocks)
+
+    def __schedule(self, sendingPacket: SendingHUDPPacket):
+        """
+        Put a packet into 'sendBuffer' to be sent at its 'retryAt', unless it is a data packet that remote acknowledged
+        while it was sent.
+        """
+        with self.context.unackedLock:
+            packet = sendingPacket.packet
+            if not packet.isDataPacket() or self.context.unackedPackets.get(packet.seq) is sendingPacket:
+                self.context.sendBuffer.schedule(sendingPacket, sendingPacket.retryAt)
+
+    def __onAck(self, ack: int):
+        """
+        Forget the reliable data packets acknowledged by 'ack' and cancel their timers.
+        """
+        unackedPackets = self.context.unackedPackets
+        with self.context.unackedLock:
+            while unackedPackets:
+                seq, sendingPacket = next(iter(unackedPackets.items()))
+                if sendingPacket.packet.calculateAck() > ack:
+                    break
+                del unackedPackets[seq]
+                self.context.sendBuffer.cancel(sendingPacket)
+
+    def __onSack(self, sackBlocks: List[Tuple[int, int]]):
+        """
+        Forget the reliable data packets that remote holds according to 'sackBlocks' and cancel their timers.
+        The packets of the previous SACK blocks are already forgotten, so only the parts the blocks grew by are walked.
+        """
+        previousBlocks = dict(self.context.sackBlocks)
+        unackedPackets = self.context.unackedPackets
+        with self.context.unackedLock:
+            for start, end in sackBlocks:
+                seq = start
+                while seq < end:
+                    if seq in previousBlocks:
+                        seq = previousBlocks[seq]
+                        continue
+                    sendingPacket = unackedPackets.get(seq)
+                    if sendingPacket is None or sendingPacket.packet.calculateAck() > end:
+                        break
+                    del unackedPackets[seq]
+                    self.context.sendBuffer.cancel(sendingPacket)
+                    seq = sendingPacket.packet.calculateAck()
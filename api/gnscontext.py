@@ -1,8 +1,20 @@
 from __future__ import annotations
-from threading import Semaphore
+from collections import OrderedDict, deque
+from threading import Event, Lock, Semaphore
+from congestion import CongestionControl, TokenBucketPacer, CONGESTION_CONTROLS
 from hudp import HUDPPacket
-from queue import Queue, PriorityQueue
-from common import AddrPort, MAX_RETRY, RETRY_INCREMENT, MAX_SEND_WINDOW_SIZE
+from queue import Queue
+from compression import PayloadCompressor
+from reassembly import FragmentAssembler, ReassemblyBuffer, StreamBuffer
+from snapshot import Snapshot, SnapshotDecoder, SnapshotEncoder
+from rtt import RttEstimator
+from scheduler import PacketScheduler, SCHEDULERS
+from timingwheel import TimingWheel
+from stageprofiler import PROFILER
+from common import AddrPort, MAX_RETRY, MAX_SEND_WINDOW_SIZE, DEFAULT_CONGESTION_CONTROL, COALESCING_MTU, \
+    ACK_EVERY, ACK_DELAY, FRAGMENT_MTU, DEFAULT_SCHEDULER, PRIORITY_REALTIME, CHANNEL_CONTROL, CHANNEL_NAMES, \
+    CHANNEL_RELIABLE, CHANNEL_UNRELIABLE, StreamMessage
+from typing import Deque, Dict, List, Optional, Tuple
 import socket
 import time
 
@@ -12,32 +24,36 @@ class SendingHUDPPacket:
     Represent a HUDP packet that is about to be sent.
     """
 
-    def __init__(self, packet: HUDPPacket):
+    __slots__ = ("packet", "retryLeft", "retryAt", "priority")
+
+    def __init__(self, packet: HUDPPacket, priority: int = PRIORITY_REALTIME):
         self.packet = packet
         """
         The HUDP packet itself.
         """
 
+        self.priority = priority
+        """
+        Priority class of the packet, which decides when it is sent if it is held back.
+        """
+
         self.retryLeft = 1 if packet.isUnreliable() else MAX_RETRY
         """
-        Number of retries remaining for this packet. Initially 1 for unreliable packets and 15 for reliable ones.
+        Number of retries remaining for this packet. Initially 1 for unreliable packets and MAX_RETRY for reliable ones.
         """
 
         self.retryAt = time.time()
+        """
+        Time at which this packet is to be re-sent. Until its first transmission, the time it was queued at.
+        """
 
-    def decrementRetry(self):
+    def decrementRetry(self, retryAt: float):
         """
         Decrement the number of retries remaining and set a new time for this packet to be re-sent.
         """
 
         self.retryLeft -= 1
-        self.retryAt += RETRY_INCREMENT
-
-    def __lt__(self, other: SendingHUDPPacket):
-        """
-        Provide the ordering for the PriorityQueue.
-        """
-        return self.retryAt < other.retryAt
+        self.retryAt = retryAt
 
 
 class RecvingHUDPPacket:
@@ -45,6 +61,8 @@ class RecvingHUDPPacket:
     Represent a HUDP packet that is about to be processed.
     """
 
+    __slots__ = ("packet", "addrPort", "arrivalTime")
+
     def __init__(self, packet: HUDPPacket, addrPort: AddrPort):
         self.packet = packet
         """
@@ -61,11 +79,157 @@ class RecvingHUDPPacket:
         Arrival time of this packet
         """
 
-    def __lt__(self, other: RecvingHUDPPacket):
+
+class CoalescingBatch:
+    """
+    Small messages of one channel, stream and priority class waiting to be coalesced into a single packet.
+    """
+
+    __slots__ = ("messages", "size", "deadline")
+
+    def __init__(self):
+        self.messages: List[bytes] = []
+        """
+        Messages in the order they were sent.
+        """
+
+        self.size = 0
+        """
+        Size of the coalesced payload so far, length prefixes included.
+        """
+
+        self.deadline: Optional[float] = None
         """
-        Provide the ordering for the PriorityQueue.
+        Time at which the batch must be sent, i.e. the latency budget after its first message. None if empty.
         """
-        return self.packet.seq < other.packet.seq
+
+
+class ConnectionCounters:
+    """
+    Counters of the packets of a connection since it was created, reported by stats().
+    Each counter is only incremented by one thread, so that no increment is lost.
+    """
+
+    __slots__ = ("packetsSent", "bytesSent", "packetsReceived", "bytesReceived", "retransmits", "duplicates",
+                 "checksumFailures", "addressMismatches", "skipAheads")
+
+    def __init__(self):
+        self.packetsSent: List[int] = [0] * len(CHANNEL_NAMES)
+        """
+        Datagrams sent on each channel of CHANNEL_NAMES, retransmissions included.
+        """
+
+        self.bytesSent: List[int] = [0] * len(CHANNEL_NAMES)
+        """
+        Bytes of the datagrams sent on each channel, headers included.
+        """
+
+        self.packetsReceived: List[int] = [0] * len(CHANNEL_NAMES)
+        """
+        Valid datagrams received from remote on each channel, duplicates included.
+        """
+
+        self.bytesReceived: List[int] = [0] * len(CHANNEL_NAMES)
+        """
+        Bytes of the valid datagrams received on each channel, headers included.
+        """
+
+        self.retransmits = 0
+        """
+        Retransmissions of reliable packets.
+        """
+
+        self.duplicates = 0
+        """
+        Reliable packets received again after they were ACKed or while they were waiting in 'reassembly'.
+        """
+
+        self.checksumFailures = 0
+        """
+        Datagrams dropped because their checksum did not match.
+        """
+
+        self.addressMismatches = 0
+        """
+        Datagrams dropped because they came from another address than remote.
+        """
+
+        self.skipAheads = 0
+        """
+        Times the ACK gave up on missing packets after SKIP_AHEAD_TIMEOUT.
+        """
+
+    def countSent(self, packet: HUDPPacket, size: int, isRetransmit: bool):
+        """
+        Count a datagram of 'size' bytes sent to remote. Only called by the sending thread.
+        """
+        channel = ConnectionCounters.channelOf(packet)
+        self.packetsSent[channel] += 1
+        self.bytesSent[channel] += size
+        if isRetransmit:
+            self.retransmits += 1
+
+    def countReceived(self, packet: HUDPPacket, size: int):
+        """
+        Count a valid datagram of 'size' bytes received from remote. Only called by the receiving thread.
+        """
+        channel = ConnectionCounters.channelOf(packet)
+        self.packetsReceived[channel] += 1
+        self.bytesReceived[channel] += size
+
+    @staticmethod
+    def channelOf(packet: HUDPPacket) -> int:
+        """
+        Return the channel a packet is counted on.
+        """
+        if not packet.isDataPacket():
+            return CHANNEL_CONTROL
+        return CHANNEL_UNRELIABLE if packet.isUnreliable() else CHANNEL_RELIABLE
+
+
+class SignalingQueue(Queue):
+    """
+    Queue that sets an event whenever an item is put into it, so that its consumer can sleep until then.
+    """
+
+    def __init__(self, event: Event, maxsize: int = 0):
+        super().__init__(maxsize=maxsize)
+        self.event = event
+        """
+        Event to be set on every put().
+        """
+
+    def _put(self, item):
+        super()._put(item)
+        self.event.set()
+
+
+class BatchingQueue(Queue):
+    """
+    Queue that can also take a whole batch of items under a single acquisition of its lock.
+    """
+
+    def putMany(self, items: List):
+        """
+        Put all 'items' into the queue at once. The queue must not be bounded.
+        """
+        with self.not_full:
+            for item in items:
+                self._put(item)
+            self.unfinished_tasks += len(items)
+            self.not_empty.notify(len(items))
+
+
+class RecvWindow(BatchingQueue):
+    """
+    Queue of the packets received waiting for the state machine, which reports to the profiler how long they waited.
+    """
+
+    def _get(self) -> RecvingHUDPPacket:
+        recvingPacket = super()._get()
+        if PROFILER.enabled and PROFILER.sample("recvQueue"):
+            PROFILER.record("recvQueue", time.time() - recvingPacket.arrivalTime)
+        return recvingPacket
 
 
 class GNSContext:
@@ -73,16 +237,27 @@ class GNSContext:
     Wrapper class for all information to be kept tracked of for the HUDP reliable delivery service.
     """
 
-    def __init__(self):
-        self.sock: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def __init__(self, sock: Optional[socket.socket] = None,
+                 sendEvent: Optional[Event] = None, routineEvent: Optional[Event] = None):
+        """
+        :param sock: UDP socket shared with other connections. A new one is created if None.
+        :param sendEvent: Event-like object to use as 'sendEvent'. A new Event is created if None.
+        :param routineEvent: Event-like object to use as 'routineEvent'. A new Event is created if None.
+        """
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.settimeout(0.200)
+
+        self.sock: socket.socket = sock
         """
         The underlying UDP packet. Timeout time is 0.200 seconds.
         """
-        self.sock.settimeout(0.200)
 
         self.seq: int = 0
         """
         Sequence Number of the next packet to be sent. Initially random to simulate actual TCP behaviour.
+        Reliable packets are numbered by the sending thread when they are first sent, in the order they leave
+        'pendingSends', so that SEQ keeps growing on the wire whatever their priority class.
         """
 
         self.rec: int = 0
@@ -90,37 +265,85 @@ class GNSContext:
         Largest received Acknowledgement Number from remote.
         """
 
+        self.finAck: Optional[int] = None
+        """
+        Acknowledgement Number remote sends back once it received the FIN, known once the FIN is numbered.
+        """
+
         self.ack: int = 0
         """
         Next expected Sequence Number to be received from remote.
         """
 
-        self.sendWindow: Queue[SendingHUDPPacket] = Queue(maxsize=MAX_SEND_WINDOW_SIZE)
+        self.sendEvent: Event = sendEvent or Event()
+        """
+        Event to wake up the sending thread, set when a packet is queued to be sent.
+        The sending thread otherwise sleeps until the next packet in 'sendBuffer' times out.
+        """
+
+        self.routineEvent: Event = routineEvent or Event()
+        """
+        Event to wake up the routine thread, set when a packet arrives or the user changes the state.
+        The routine thread otherwise sleeps until the deadline of the current state.
+        """
+
+        self.sendWindow: SignalingQueue[SendingHUDPPacket] = SignalingQueue(self.sendEvent, MAX_SEND_WINDOW_SIZE)
         """
         Queue to store ready-to-send packets. Timeout is 0.200s.
-        GameNetSocket will create a thread to continually retrieves packets from this queue and send it.
+        GameNetSocket will create a thread that wakes up whenever a packet is put here and sends it.
+        """
+
+        self.newPackets: Deque[SendingHUDPPacket] = deque()
+        """
+        Packets queued by the user that were never transmitted, e.g. data, SYN and FIN, in the order they were queued.
+        They are taken out on the next pass of the sending thread rather than going through 'sendBuffer',
+        whose timers may fire up to one tick late. 'sendEvent' must be set after appending a packet here.
+        """
+
+        self.sendBuffer: TimingWheel[SendingHUDPPacket] = TimingWheel()
+        """
+        Timing wheel to store packets that are not ready to be sent, i.e. waiting for timeout.
+        Each packet is scheduled at its 'retryAt' and only the packets that time out are taken out of it.
+        GameNetSocket's sending thread sleeps until the first packet times out and then sends it.
+        'sendEvent' must be set after scheduling a packet here.
         """
 
-        self.sendBuffer: PriorityQueue[SendingHUDPPacket] = PriorityQueue()
+        self.unackedPackets: OrderedDict[int, SendingHUDPPacket] = OrderedDict()
         """
-        PriorityQueue to store packets that are not ready to be sent, i.e. waiting for timeout.
-        The Queue is ordered from closest to furthest away from timing out (e.g. a packet
-        that times out in 100ms is in front of a packet that times out in 200ms).
-        GameNetSocket has a routine to check when packets times out and put them into 'sendWindow'.
+        Reliable data packets transmitted at least once that remote neither acknowledged nor reported in its SACK
+        blocks, keyed by SEQ in the order they were first sent. Their timers are cancelled from 'sendBuffer' as soon
+        as the ACK or SACK blocks arrive, instead of firing only to be skipped. Control packets such as the FIN are
+        left out, as the states wait for their own ACK, which only a retransmission may bring back.
         """
 
-        self.recvWindow: PriorityQueue[RecvingHUDPPacket] = PriorityQueue()
+        self.unackedLock: Lock = Lock()
         """
-        PriorityQueue to store about-to-be-processed packets.
-        The Queue is ordered from packets with lowest to highest sequence numbers (e.g. a packet with
-        a sequence number of 100 will be in front of a packet with sequence number of 200).
+        Protects 'unackedPackets', since packets are added by the sending thread and acknowledged by the receiving
+        thread.
+        """
+
+        self.recvWindow: RecvWindow = RecvWindow()
+        """
+        Queue to store about-to-be-processed packets, in the order they arrived.
         GameNetSocket will create a thread to continually retrieves packets from the UDP socket and place it here.
-        Provides the buffering needed for packet reordering.
+        'routineEvent' must be set after a new packet is placed here.
+        """
+
+        self.reassembly = ReassemblyBuffer()
+        """
+        Reliable data packets received past the ACK, waiting for the packets before them.
+        Provides the buffering needed for packet reordering, see GNSState.receiveData().
         """
 
-        self.recvBuffer: Queue[bytes] = Queue()
+        self.streams = StreamBuffer()
         """
-        Queue to store packets' data that are ready to be received by the client.
+        Reliable data packets received out of the order of their stream, waiting for the packets before them
+        on the same stream. Only used by the routine thread.
+        """
+
+        self.recvBuffer: Queue[StreamMessage] = Queue()
+        """
+        Queue to store packets' data that are ready to be received by the client, with the stream they were sent on.
         """
 
         self.sendAddrPort: AddrPort = None
@@ -132,12 +355,199 @@ class GNSContext:
         Address and port number of remote.
         """
 
+        self.enableCrc: bool = False
+        """
+        Whether this socket offers CRC32 checksums to remote during the 3-way handshake.
+        """
+
+        self.useCrc: bool = False
+        """
+        Whether both hosts agreed on CRC32 checksums. Packets are protected by the 1s complement checksum otherwise.
+        """
+
+        self.compressor: Optional[PayloadCompressor] = None
+        """
+        Compresses and decompresses payloads with the dictionary this socket offers to remote during the 3-way
+        handshake, None if compression is not offered.
+        """
+
+        self.useCompression: bool = False
+        """
+        Whether both hosts agreed on compression with the same dictionary. Payloads are sent as is otherwise.
+        """
+
         self.shouldSendAck: bool = False
         """
         Whether a data packet was received. This is for deciding transmission of ACK packets, especially
         if the data packet received was out-of-order.
         """
 
+        self.ackEvery: int = ACK_EVERY
+        """
+        Number of reliable data packets received after which the ACK is due right away.
+        """
+
+        self.ackDelay: float = ACK_DELAY
+        """
+        Time in seconds the ACK may otherwise wait for an outgoing data packet to ride on.
+        """
+
+        self.unackedSegments: int = 0
+        """
+        Number of reliable data packets received since an ACK was last sent.
+        """
+
+        self.ackDeadline: Optional[float] = None
+        """
+        Time at which a pure ACK must be sent unless a data packet carries the ACK before. None if no ACK is due.
+        """
+
+        self.ackLock: Lock = Lock()
+        """
+        Protects 'ackDeadline' and 'unackedSegments', since ACKs are scheduled by the routine thread
+        and piggybacked or sent by the sending thread.
+        """
+
+        self.rtt: RttEstimator = RttEstimator()
+        """
+        Estimates the retransmission timeout of reliable packets from the RTT to remote.
+        """
+
+        self.counters = ConnectionCounters()
+        """
+        Packets and bytes sent and received per channel and the packets retransmitted, duplicated or dropped.
+        """
+
+        self.congestion: CongestionControl = CONGESTION_CONTROLS[DEFAULT_CONGESTION_CONTROL]()
+        """
+        Limits the reliable data in flight. Only used by the sending thread.
+        """
+
+        self.enablePacing: bool = False
+        """
+        Whether the first transmissions of reliable packets are spread over the RTT by 'pacer'. Off by default.
+        """
+
+        self.pacer: TokenBucketPacer = TokenBucketPacer()
+        """
+        Paces reliable packets at a multiple of cwnd / SRTT. Only used by the sending thread.
+        """
+
+        self.pendingSends: PacketScheduler = SCHEDULERS[DEFAULT_SCHEDULER]()
+        """
+        Reliable packets queued by the user and due for their first transmission, held back by the congestion window
+        or the pacer, in the order they were queued within each priority class. The scheduler decides which class
+        sends next. Packets are only numbered when they leave it. Only used by the sending thread.
+        """
+
+        self.sentSeq: int = 0
+        """
+        End of the reliable data that has been transmitted at least once.
+        """
+
+        self.ackedSeq: int = 0
+        """
+        Largest ACK received from remote, as seen by the receiving thread. Unlike 'rec',
+        it is updated as soon as a packet arrives, so that the sending thread can reopen the congestion window.
+        """
+
+        self.congestionAck: int = 0
+        """
+        Largest ACK already reported to 'congestion'.
+        """
+
+        self.coalescingBudget: Optional[float] = None
+        """
+        How long in seconds a small message may wait to be coalesced with the next ones. None disables coalescing.
+        """
+
+        self.coalescingMtu: int = COALESCING_MTU
+        """
+        Largest packet in bytes, header included, that messages are coalesced into.
+        """
+
+        self.coalescingBatches: Dict[Tuple[bool, int, int], CoalescingBatch] = {}
+        """
+        Messages waiting to be coalesced, keyed by channel, reliable (True) or unreliable (False), stream
+        and priority class. Batches are created on their first message.
+        """
+
+        self.coalescingLock: Lock = Lock()
+        """
+        Protects 'coalescingBatches', 'keyedUpdates', 'streamSeqs' and the SEQ of the packets made from them,
+        since batches are filled by the user and flushed by the sending thread.
+        """
+
+        self.keyedUpdates: Dict[int, Tuple[int, bytes]] = {}
+        """
+        Latest update of each key and its counter that was not sent yet, in the order the keys were first queued.
+        A newer update of a key replaces its unsent one.
+        """
+
+        self.keyedDeadline: Optional[float] = None
+        """
+        Time at which 'keyedUpdates' must be sent, i.e. the latency budget after the first of them. None if empty.
+        """
+
+        self.keyCounters: Dict[int, int] = {}
+        """
+        Counter of the latest update queued for each key.
+        """
+
+        self.deliveredCounters: Dict[int, int] = {}
+        """
+        Counter of the latest update delivered to the user for each key of remote. Older updates are dropped.
+        Only used by the routine thread.
+        """
+
+        self.fragmentMtu: Optional[int] = FRAGMENT_MTU
+        """
+        Largest packet in bytes, header included, that a message is sent in. Larger messages are fragmented.
+        None disables fragmentation.
+        """
+
+        self.streamSeqs: Dict[int, int] = {}
+        """
+        Sequence number of the next reliable packet sent on each stream.
+        """
+
+        self.nextMessageIds: Dict[bool, int] = {True: 0, False: 0}
+        """
+        ID of the next message sent in fragments, for the reliable (True) and unreliable (False) channels.
+        """
+
+        self.snapshotEncoder: SnapshotEncoder = SnapshotEncoder()
+        """
+        Encodes the snapshots sent to remote as deltas against the latest one remote acknowledged.
+        """
+
+        self.snapshotDecoder: SnapshotDecoder = SnapshotDecoder()
+        """
+        Rebuilds the snapshots received from remote. Only used by the routine thread.
+        """
+
+        self.snapshotBuffer: Queue[Snapshot] = Queue()
+        """
+        Queue to store the snapshots that are ready to be received by the client.
+        """
+
+        self.snapshotAck: Optional[int] = None
+        """
+        ID of the latest snapshot received that was not acknowledged to remote yet, None if none.
+        It is sent in the next pure ACK, as it cannot ride on data packets. Protected by 'ackLock'.
+        """
+
+        self.fragments: FragmentAssembler = FragmentAssembler()
+        """
+        Messages being rebuilt from the fragments received. Only used by the routine thread.
+        """
+
+        self.sackBlocks: List[Tuple[int, int]] = []
+        """
+        SEQ ranges past 'rec' that remote holds, from the SACK blocks of its latest pure ACK.
+        Reliable packets inside them are not retransmitted.
+        """
+
         self.acceptSemaphore: Semaphore = Semaphore(0)
         """
         Semaphore to block accept() function from returning until the 3-way handshake is complete.
@@ -1,17 +1,48 @@
 from api.gnscontext import SendingHUDPPacket
+from common import MAX_RETRY, PRIORITY_NAMES
+from eventlog import CONSOLE_SINK, EVENT_HIDDEN, EVENT_INFO, EVENT_METRIC, EVENT_RECV, EVENT_RETRANSMIT, EVENT_RTT, \
+    EVENT_SEND, LOG_WRITER, EventRing, LogSink
 from hudp import HUDPPacket
-from typing import Dict, List, Tuple
-from datetime import datetime
-from functools import reduce
-from statistics import mean
+from metrics import LogHistogram, RunningStats, SlidingWindowCounter
+from threading import Lock
+from typing import List, Optional
 import time
 
 
 class Metrics:
+    """
+    Latency, jitter and throughput of the packets received on a channel, kept in constant memory by streaming
+    estimators and readable from any thread while the connection runs.
+    """
+
     def __init__(self):
-        self.latencies: List[int] = []
-        self.jitters: List[int] = []
-        self.dataSizes: List[Tuple[float, int]] = []
+        self.latency = RunningStats()
+        """
+        Mean, deviation and extremes in seconds of the time from the creation of a packet to its arrival.
+        """
+
+        self.latencyHistogram = LogHistogram()
+        """
+        Distribution of the latencies, for their percentiles.
+        """
+
+        self.jitter = RunningStats()
+        """
+        Mean and extremes in seconds of the interarrival jitter estimated at each packet, as in RFC 3550.
+        """
+
+        self.throughput = SlidingWindowCounter()
+        """
+        Bytes received over the last THROUGHPUT_WINDOW seconds.
+        """
+
+        self.totalBytes = 0
+        self.firstTime = 0.0
+        self.lastTime = 0.0
+        """
+        Arrival time of the first and latest packets, for the throughput over the whole connection.
+        """
+
         self.lastTransitTime = 0
         self.currentJitter = 0
 
@@ -19,67 +50,157 @@ class Metrics:
         currentTime = time.time()
         latency = currentTime - packet.time
 
-        if hasattr(self, 'lastTransitTime') and self.lastTransitTime > 0:
+        if self.lastTransitTime > 0:
             # RFC 3550 jitter calculation
             D = latency - self.lastTransitTime
             self.currentJitter += (abs(D) - self.currentJitter) / 16
-            self.jitters.append(self.currentJitter)
+            self.jitter.add(self.currentJitter)
 
         self.lastTransitTime = latency
-        self.latencies.append(latency)
-        self.dataSizes.append((currentTime, len(packet.toBytes())))
+        self.latency.add(latency)
+        self.latencyHistogram.add(latency)
+
+        size = packet.size()
+        self.throughput.add(size, currentTime)
+        if self.totalBytes == 0:
+            self.firstTime = currentTime
+        self.totalBytes += size
+        self.lastTime = currentTime
+
+    def latencyPercentile(self, percent: float) -> float:
+        """
+        Return the latency in seconds below which 'percent' % of the packets arrived, within 1/64 of it.
+        """
+        return self.latencyHistogram.percentile(percent)
+
+    def currentThroughput(self) -> float:
+        """
+        Return the bytes received per second over the last THROUGHPUT_WINDOW seconds.
+        """
+        return self.throughput.rate(time.time())
+
+    def averageThroughput(self) -> float:
+        """
+        Return the bytes received per second from the first packet to the latest, 0 until two packets arrived
+        at different times.
+        """
+        totalTime = self.lastTime - self.firstTime
+        return self.totalBytes / totalTime if totalTime > 0 else 0.0
 
     def __str__(self):
-        avgLatency = 0
-        if len(self.latencies) > 0:
-            avgLatency = round(mean(self.latencies) * 1000)
+        p50, p99, p999 = (round(self.latencyPercentile(percent) * 1000) for percent in (50, 99, 99.9))
+        return (
+            f"Average Latency: {round(self.latency.mean * 1000)} ms | "
+            f"Jitter: {round(self.jitter.mean * 1000)} ms | "
+            f"Throughput: {round(self.averageThroughput())} Bps | "
+            f"Latency p50/p99/p99.9: {p50}/{p99}/{p999} ms"
+        )
+
 
-        jitter = 0
-        if len(self.jitters) > 0:
-            jitter = round(mean(self.jitters) * 1000)
+class AckMetrics:
+    def __init__(self):
+        self.due: int = 0
+        """
+        Number of times received data called for an ACK, i.e. the pure ACKs sent if every ACK were sent right away.
+        """
+
+        self.pureAcks: int = 0
+        """
+        Number of pure ACKs actually sent for received data.
+        """
+
+        self.piggybacked: int = 0
+        """
+        Number of due ACKs that rode on an outgoing data packet instead.
+        """
 
-        throughput = 0
-        if len(self.dataSizes):
-            totalTime = self.dataSizes[-1][0] - self.dataSizes[0][0]
-            if totalTime > 0:
-                totalDataSizes = reduce(lambda acc, tup: acc + tup[1], self.dataSizes, 0)
-                throughput = round(totalDataSizes / totalTime)
+    def saved(self) -> int:
+        """
+        Return the number of pure ACKs that were not sent thanks to delaying and piggybacking.
+        """
+        return max(0, self.due - self.pureAcks)
 
+    def __str__(self):
         return (
-            f"Average Latency: {avgLatency} ms | "
-            f"Jitter: {jitter} ms | "
-            f"Throughput: {throughput} Bps"
+            f"Pure ACKs: {self.pureAcks} | "
+            f"Piggybacked: {self.piggybacked} | "
+            f"Saved: {self.saved()} of {self.due}"
         )
 
 
-class GNSLogger:
-    def __init__(self, logSend=True, logRecv=True, logMetrics=True):
-        self.sendRecord: Dict[HUDPPacket, float] = {}
+class QueueMetrics:
+    def __init__(self):
+        self.counts: List[int] = [0] * len(PRIORITY_NAMES)
         """
-        Tracks all packet that has been sent.
-        Maps the packet to the timestamp when it was first sent.
+        Number of data packets sent for the first time, per priority class.
+        """
+
+        self.totalDelays: List[float] = [0.0] * len(PRIORITY_NAMES)
+        """
+        Sum of the time in seconds these packets waited between being queued and sent, per priority class.
+        """
+
+        self.maxDelays: List[float] = [0.0] * len(PRIORITY_NAMES)
         """
+        Longest time in seconds one of these packets waited, per priority class.
+        """
+
+    def update(self, priority: int, delay: float):
+        """
+        Record that a data packet of class 'priority' was sent for the first time 'delay' seconds after being queued.
+        """
+        self.counts[priority] += 1
+        self.totalDelays[priority] += delay
+        self.maxDelays[priority] = max(self.maxDelays[priority], delay)
+
+    def meanDelay(self, priority: int) -> float:
+        """
+        Return the average time in seconds the packets of class 'priority' waited to be sent, 0 if none was sent.
+        """
+        return self.totalDelays[priority] / self.counts[priority] if self.counts[priority] else 0.0
+
+    def __str__(self):
+        return " | ".join(
+            f"{name}: {self.counts[priority]} sent, "
+            f"{self.meanDelay(priority) * 1000:.1f} ms avg, {self.maxDelays[priority] * 1000:.1f} ms max"
+            for priority, name in enumerate(PRIORITY_NAMES) if self.counts[priority])
 
-        self.sendSeqRecord: Dict[int, float] = {}
+
+class GNSLogger:
+    """
+    Logs the packets sent and received, RTT samples, state changes and metrics of a connection.
+
+    Logging an event only records it into a fixed-size ring of binary events, created once something is logged,
+    which the log writer thread drains into a sink: rendered to the standard output by default, or written to a
+    binary log file (setLogFile) to be rendered later with `python3 -m eventlog <file>`. With logging off, logSend
+    and logRecv return right away and nothing is kept per packet.
+    """
+
+    def __init__(self, logSend=True, logRecv=True, logMetrics=True, logInfo=True):
+        self.ring: Optional[EventRing] = None
         """
-        Tracks all packet that has been sent.
-        Maps the packet SEQ to the timestamp when it was first sent.
+        Events logged and not yet drained by the log writer thread. None until the first event.
         """
 
-        self.recvRecord: Dict[HUDPPacket, float] = {}
+        self.sink: LogSink = CONSOLE_SINK
         """
-        Tracks all valid packet that has been received.
-        Maps the packet to the timestamp when it was first received.
+        Where the events go.
         """
 
-        self.lastAck: int = 0
+        self.ringLock = Lock()
+        """
+        Makes sure that the threads of the connection logging their first event at once create a single ring.
+        """
 
         self.unreliableMetrics = Metrics()
         self.reliableMetrics = Metrics()
+        self.ackMetrics = AckMetrics()
+        self.queueMetrics = QueueMetrics()
 
         self.enableLogSend = logSend
         self.enableLogRecv = logRecv
         self.enableLogMetrics = logMetrics
+        self.enableLogInfo = logInfo
 
     def setEnableLogSend(self, newValue: bool):
         self.enableLogSend = newValue
@@ -90,53 +211,79 @@ class GNSLogger:
     def setEnableLogMetrics(self, newValue: bool):
         self.enableLogMetrics = newValue
 
-    def log(self, message: str):
-        timeString = datetime.now().strftime("%M:%S:%f")[:-3]
-        print(f"[{timeString}]: \033[43m API \033[0m {message}", flush=True)
+    def setEnableLogInfo(self, newValue: bool):
+        self.enableLogInfo = newValue
 
-    def logInfo(self, message: str):
-        self.log(f"\033[100m INFO \033[0m {message}")
+    def setSink(self, sink: LogSink):
+        """
+        Send the events logged from now on to 'sink'. The events logged before still go to the previous one.
+        """
+        if self.ring is not None:
+            LOG_WRITER.flush(self.ring)
+            self.ring.sink = sink
+        self.sink = sink
+
+    def flush(self):
+        """
+        Hand the events logged so far over to the sink right away, e.g. before the connection goes away.
+        """
+        if self.ring is not None:
+            LOG_WRITER.flush(self.ring)
+
+    def logInfo(self, message: str, force=False):
+        if self.enableLogInfo or force:
+            self.__logText(EVENT_INFO, message)
 
     def logMtrc(self, message: str):
-        self.log(f"\033[45m MTRC \033[0m {message}")
+        self.__logText(EVENT_METRIC, message)
 
     def logSend(self, sendingPacket: SendingHUDPPacket):
+        # Sent packets are also recorded to take RTT samples
+        if not (self.enableLogSend or self.enableLogMetrics):
+            return
         packet = sendingPacket.packet
-        message = f"\033[42m SEND \033[0m {packet} "
-        if not packet.isUnreliable():
-            if packet in self.sendRecord:
-                message += "retransmit "
-            else:
-                self.sendRecord[packet] = packet.time
-                if packet.seq not in self.sendSeqRecord:
-                    self.sendSeqRecord[packet.seq] = packet.time
-
-        if self.enableLogSend:
-            self.log(message)
+        kind = EVENT_RETRANSMIT if sendingPacket.retryLeft < MAX_RETRY and packet.isReliable() else EVENT_SEND
+        if not self.enableLogSend:
+            kind |= EVENT_HIDDEN
+        self.__getRing().write(kind, packet.seq, packet.ack, packet.checksum, packet.flags, packet.time,
+                               len(packet.content))
 
     def logRecv(self, packet: HUDPPacket):
-        message = f"\033[44m RECV \033[0m {packet} "
-        if not packet.isUnreliable():
-            if packet in self.recvRecord:
-                message += "duplicate "
-            else:
-                self.recvRecord[packet] = packet.time
-
-        if self.enableLogRecv:
-            self.log(message)
-
-        if packet.flags.isAck and packet.ack > self.lastAck:
-            rtt = round((time.time() - self.sendSeqRecord[self.lastAck]) * 1000)
-            if self.enableLogMetrics:
-                self.logMtrc(f"SEQ {self.lastAck} -> {packet.ack}: RTT ≈ {rtt} ms")
-            self.lastAck = packet.ack
-
         if packet.isUnreliable():
             self.unreliableMetrics.updateMetrics(packet)
         else:
             self.reliableMetrics.updateMetrics(packet)
 
+        if not (self.enableLogRecv or self.enableLogMetrics):
+            return
+        kind = EVENT_RECV
+        if not self.enableLogRecv:
+            kind |= EVENT_HIDDEN
+        if self.enableLogMetrics:
+            kind |= EVENT_RTT
+        self.__getRing().write(kind, packet.seq, packet.ack, packet.checksum, packet.flags, packet.time,
+                               len(packet.content))
+
     def logMetrics(self):
         if self.enableLogMetrics:
-            self.logInfo(f"Unreliable: {self.unreliableMetrics}")
-            self.logInfo(f"Reliable: {self.reliableMetrics}")
+            self.logInfo(f"Unreliable: {self.unreliableMetrics}", force=True)
+            self.logInfo(f"Reliable: {self.reliableMetrics}", force=True)
+            self.logInfo(f"ACKs: {self.ackMetrics}", force=True)
+            self.logInfo(f"Queue delay: {self.queueMetrics}", force=True)
+        self.flush()
+
+    def __logText(self, kind: int, message: str):
+        text = message.encode()
+        self.__getRing().write(kind, size=len(text), text=text)
+
+    def __getRing(self) -> EventRing:
+        """
+        Return the ring of this logger, created and handed to the log writer thread on first use.
+        """
+        if self.ring is None:
+            with self.ringLock:
+                if self.ring is None:
+                    ring = EventRing(self.sink)
+                    LOG_WRITER.register(ring)
+                    self.ring = ring
+        return self.ring
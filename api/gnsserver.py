@@ -0,0 +1,508 @@
+import heapq
+import itertools
+import queue
+import socket
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from api.gnscontext import GNSContext
+from api.gnsconnection import GNSConnection
+from api.states.gnssaccept import GNSStateAccept
+from api.states.gnssterminated import GNSStateTerminated
+from batchrecv import Datagram, DatagramReceiver, DATAGRAM_RECEIVERS, DEFAULT_DATAGRAM_RECEIVER
+from common import AddrPort, IllegalStateChangeException, SocketTimeoutException, MAX_DATAGRAM_SIZE, ACK_EVERY, \
+    ACK_DELAY, COMPRESSION_LEVEL, StreamMessage, DEFAULT_SCHEDULER, PRIORITY_REALTIME, PRIORITY_WEIGHTS, STATS_PORT, \
+    HANDSHAKE_TIMEOUT, MAX_CONNECTIONS, MAX_PENDING_CONNECTIONS, RECV_SLOT_SIZE
+from hudp import HUDPPacket
+from snapshot import Snapshot
+from compression import PayloadCompressor
+from eventlog import CONSOLE_SINK, FileSink, LogSink
+from statsexport import StatsExporter
+from scheduler import SCHEDULERS
+import time
+
+
+class GameNetServerConnection(GNSConnection):
+    """
+    A connection accepted by GameNetServer. It is used like a connected GameNetSocket, with send(), recv()
+    and close(), but it does not own a UDP socket nor any thread: the server receives its datagrams
+    and runs its state machine.
+    """
+
+    def __init__(self, server: "GameNetServer", addrPort: AddrPort):
+        signal = _ConnectionSignal(server, self)
+        super().__init__(GNSContext(server.sock, signal, signal), server.datagram)
+
+        self.remoteAddrPort: AddrPort = addrPort
+        """
+        Address and port number of the remote this connection was created for.
+        """
+
+        self.timerAt: Optional[float] = None
+        """
+        Time of the latest timer scheduled for this connection by the server. Older timers are ignored.
+        """
+
+        self.isPending = True
+        """
+        Whether the 3-way handshake is still in progress, until the connection is handed over to accept().
+        """
+
+        self.handshakeDeadline: float = time.time() + server.handshakeTimeout
+        """
+        Time at which the connection is dropped if its handshake is not complete by then.
+        """
+
+    def send(self, data: bytes, isReliable: bool, stream: int = 0, priority: int = PRIORITY_REALTIME):
+        """
+        Send data to remote. The connection must be established before this.
+        :param data: Information to be sent to remote.
+        :param isReliable: True if Reliable channel is to be used. False otherwise.
+        :param stream: Stream to send on. See GameNetSocket.send().
+        :param priority: Priority class. See GameNetSocket.send().
+        """
+        self._queueData(data, isReliable, stream, priority)
+
+    def sendKeyed(self, key: int, data: bytes):
+        """
+        Send the latest state of 'key' on the unreliable channel. See GameNetSocket.sendKeyed().
+        """
+        self._queueKeyed(key, data)
+
+    def sendSnapshot(self, snapshot: Snapshot):
+        """
+        Send the state of the world on the unreliable channel. See GameNetSocket.sendSnapshot().
+        """
+        self._queueSnapshot(snapshot)
+
+    def recv(self, timeout=1.000) -> StreamMessage:
+        """
+        Return data sent from remote, with the stream it was sent on in its 'stream' attribute.
+        This function will block until there is data to receive.
+        """
+        try:
+            return self.context.recvBuffer.get(timeout=timeout)
+        except queue.Empty:
+            raise SocketTimeoutException()
+
+    def recvSnapshot(self, timeout=1.000) -> Snapshot:
+        """
+        Return the next snapshot sent from remote. See GameNetSocket.recvSnapshot().
+        """
+        try:
+            return self.context.snapshotBuffer.get(timeout=timeout)
+        except queue.Empty:
+            raise SocketTimeoutException()
+
+    def close(self):
+        """
+        Close the connection. Other connections of the server are not affected.
+        """
+        self._queueFin()
+        self.context.closeSemaphore.acquire()
+
+
+class _ConnectionSignal:
+    """
+    Stands in for both events of a GameNetServerConnection's context.
+    Setting it marks the connection as ready, so that the server's driving thread services it.
+    """
+
+    __slots__ = ("server", "connection")
+
+    def __init__(self, server: "GameNetServer", connection: GameNetServerConnection):
+        self.server = server
+        self.connection = connection
+
+    def set(self):
+        self.server._notify(self.connection)
+
+    def clear(self):
+        pass
+
+
+class GameNetServer:
+    """
+    Listener for the GameNet protocol that serves many remotes over a single UDP port.
+
+    Datagrams are demultiplexed by the remote's address and port number to one GameNetServerConnection each.
+    A datagram from an unknown remote creates a new connection only if it is a valid SYN, and accept() returns
+    the connections once their 3-way handshake completes, so it can be called repeatedly. Connections that do not
+    complete their handshake within a timeout are dropped, and SYNs past the limits on pending and total connections
+    are dropped before any connection is created, so that a flood of SYNs, e.g. from spoofed addresses, cannot grow
+    the memory of the server without bound.
+
+    Only two threads are used regardless of the number of connections: one receives datagrams and one drives
+    the state machines and sends packets of the connections that are ready or whose timer fired.
+    """
+
+    def __init__(self):
+        self.sock: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        """
+        The UDP socket shared by all connections.
+        """
+        self.sock.settimeout(0.200)
+
+        self.datagram = bytearray(MAX_DATAGRAM_SIZE)
+        """
+        Buffer that all connections encode their outgoing packets into. Only the driving thread sends.
+        """
+
+        self.connections: Dict[AddrPort, GameNetServerConnection] = {}
+        """
+        Live connections, keyed by the address and port number of their remote.
+        """
+
+        self.acceptQueue: queue.Queue[GameNetServerConnection] = queue.Queue()
+        """
+        Connections whose 3-way handshake is complete, waiting to be returned by accept().
+        """
+
+        self.readyConnections: Set[GameNetServerConnection] = set()
+        """
+        Connections that received a packet or were given something to send since the last step.
+        """
+
+        self.readyLock = Lock()
+        """
+        Protects 'readyConnections' and 'connections', which are shared by the server threads and the user.
+        """
+
+        self.event = Event()
+        """
+        Event to wake up the driving thread, set when a connection becomes ready.
+        """
+
+        self.timers: List[Tuple[float, int, GameNetServerConnection]] = []
+        """
+        Heap of the next deadline or retransmission of each connection.
+        """
+
+        self.timerCounter = itertools.count()
+        """
+        Breaks ties between timers of the same time in 'timers'.
+        """
+
+        self.isListening = False
+        """
+        Whether new connections are accepted.
+        """
+
+        self.pendingCount = 0
+        """
+        Number of connections in 'connections' whose handshake is still in progress.
+        """
+
+        self.droppedSyns = 0
+        """
+        Number of SYNs from new remotes dropped because of the connection limits.
+        """
+
+        self.handshakeTimeout = HANDSHAKE_TIMEOUT
+        self.maxPending = MAX_PENDING_CONNECTIONS
+        self.maxConnections = MAX_CONNECTIONS
+
+        self.isClosed = False
+        """
+        Whether close() was called, which terminates the server threads.
+        """
+
+        self.receiver: DatagramReceiver = DATAGRAM_RECEIVERS[DEFAULT_DATAGRAM_RECEIVER]()
+        """
+        Reads datagrams from the UDP socket in batches for the receiving thread.
+        """
+
+        self.ackEvery = ACK_EVERY
+        self.ackDelay = ACK_DELAY
+        self.enableCrc = False
+        self.compressor: Optional[PayloadCompressor] = None
+        self.scheduling: Tuple[str, Sequence[int]] = (DEFAULT_SCHEDULER, PRIORITY_WEIGHTS)
+        self.enableLogSend = True
+        self.enableLogRecv = True
+        self.enableLogMetrics = True
+        self.enableLogInfo = True
+        self.logSink: LogSink = CONSOLE_SINK
+
+    def bind(self, addrPort: AddrPort):
+        """
+        Bind the server to a specific address and port number.
+        """
+        self.sock.bind(addrPort)
+
+    def listen(self):
+        """
+        Begin accepting connection requests from any remote. The server must be bound before this.
+        """
+        if self.isListening or self.isClosed:
+            raise IllegalStateChangeException("Can only listen() once on an open server")
+        self.isListening = True
+        Thread(target=self.__recv).start()
+        Thread(target=self.__drive).start()
+
+    def accept(self, timeout: Optional[float] = None) -> GameNetServerConnection:
+        """
+        Return the next connection whose 3-way handshake is complete. This function will block until there is one.
+        """
+        if not self.isListening:
+            raise IllegalStateChangeException("Can only accept() on a listening server")
+        try:
+            return self.acceptQueue.get(timeout=timeout)
+        except queue.Empty:
+            raise SocketTimeoutException()
+
+    def close(self):
+        """
+        Stop the server threads and close the UDP socket. Connections should be closed before this.
+        """
+        self.isClosed = True
+        self.isListening = False
+        self.event.set()
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Return the stats() of every connection, keyed by the address and port number of its remote.
+        See GNSConnection.stats().
+        """
+        with self.readyLock:
+            connections = list(self.connections.items())
+        return {f"{host}:{port}": connection.stats() for (host, port), connection in connections}
+
+    def serveStats(self, addrPort: AddrPort = ("127.0.0.1", STATS_PORT)) -> StatsExporter:
+        """
+        Serve the stats of every connection over HTTP. See GNSConnection.serveStats().
+        """
+        return StatsExporter(self.stats, addrPort).start()
+
+    def setDatagramReceiver(self, name: str, slotSize: int = RECV_SLOT_SIZE):
+        """
+        Select how the receiving thread reads datagrams. See GameNetSocket.setDatagramReceiver().
+        Must be called before listen().
+        """
+        self.receiver = DATAGRAM_RECEIVERS[name](slotSize=slotSize)
+
+    def setConnectionLimits(self, maxPending: int = MAX_PENDING_CONNECTIONS, maxConnections: int = MAX_CONNECTIONS,
+                            handshakeTimeout: float = HANDSHAKE_TIMEOUT):
+        """
+        Limit the connections in their 3-way handshake to 'maxPending' and all connections to 'maxConnections',
+        and drop the connections that have not completed their handshake within 'handshakeTimeout' seconds.
+        SYNs from new remotes past the limits are dropped. The timeout applies to new connections.
+        """
+        if maxPending < 1 or maxConnections < 1 or handshakeTimeout <= 0:
+            raise ValueError("Connection limits and handshake timeout must be positive")
+        self.maxPending = maxPending
+        self.maxConnections = maxConnections
+        self.handshakeTimeout = handshakeTimeout
+
+    def setAckPolicy(self, every: int = ACK_EVERY, delay: float = ACK_DELAY):
+        """
+        Delay the ACKs of new connections. See GNSConnection.setAckPolicy().
+        """
+        self.ackEvery = every
+        self.ackDelay = delay
+
+    def setEnableCrc(self, newValue: bool):
+        """
+        Offer CRC32 checksums to remotes of new connections. See GNSConnection.setEnableCrc().
+        """
+        self.enableCrc = newValue
+
+    def setCompression(self, dictionary: Optional[bytes], level: int = COMPRESSION_LEVEL):
+        """
+        Offer compression to remotes of new connections. See GNSConnection.setCompression().
+        """
+        self.compressor = None if dictionary is None else PayloadCompressor(dictionary, level)
+
+    def setScheduling(self, policy: str = DEFAULT_SCHEDULER, weights: Sequence[int] = PRIORITY_WEIGHTS):
+        """
+        Select the scheduler of the priority classes of new connections. See GNSConnection.setScheduling().
+        """
+        # Fails now on an unknown policy or invalid weights, rather than on the next connection
+        SCHEDULERS[policy](weights)
+        self.scheduling = (policy, tuple(weights))
+
+    def setEnableLogSend(self, newValue: bool):
+        """
+        Turn on logging for sent packets of new connections
+        """
+        self.enableLogSend = newValue
+
+    def setEnableLogRecv(self, newValue: bool):
+        """
+        Turn on logging for received packets of new connections
+        """
+        self.enableLogRecv = newValue
+
+    def setEnableLogMetrics(self, newValue: bool):
+        """
+        Turn on logging for performance metrics of new connections
+        """
+        self.enableLogMetrics = newValue
+
+    def setEnableLogInfo(self, newValue: bool):
+        """
+        Turn on logging for state changes of new connections
+        """
+        self.enableLogInfo = newValue
+
+    def setLogFile(self, path: Optional[str]):
+        """
+        Write the logs of new connections to the binary log file at 'path', shared by all of them, instead of the
+        standard output. See GNSConnection.setLogFile().
+        """
+        self.logSink = CONSOLE_SINK if path is None else FileSink(path)
+
+    def _notify(self, connection: GameNetServerConnection):
+        """
+        Mark a connection as ready and wake up the driving thread.
+        """
+        with self.readyLock:
+            self.readyConnections.add(connection)
+        self.event.set()
+
+    def _dispatch(self, data, addrPort: AddrPort) -> bool:
+        """
+        Route a datagram to the connection of its remote, creating the connection if it is a valid SYN
+        within the connection limits.
+        Return True if the packet was accepted. False if it was dropped.
+        """
+        connection = self.connections.get(addrPort)
+        if connection is None:
+            if not self.isListening or not HUDPPacket.verifyChecksum(data) or not HUDPPacket.fromBytes(data).isSyn():
+                return False
+            if self.pendingCount >= self.maxPending or len(self.connections) >= self.maxConnections:
+                self.droppedSyns += 1
+                return False
+            connection = self.__createConnection(addrPort)
+        return connection._receive(data, addrPort)
+
+    def _dispatchBatch(self, datagrams: List[Datagram]):
+        """
+        Route a batch of datagrams to the connections of their remotes, each connection taking its datagrams at once.
+        """
+        batches: Dict[GameNetServerConnection, List[Datagram]] = {}
+        for data, addrPort in datagrams:
+            connection = self.connections.get(addrPort)
+            if connection is None:
+                # A new remote must start with a SYN, which creates its connection for the datagrams after it
+                self._dispatch(data, addrPort)
+                continue
+            batch = batches.get(connection)
+            if batch is None:
+                batch = batches[connection] = []
+            batch.append((data, addrPort))
+        for connection, batch in batches.items():
+            connection._receiveBatch(batch)
+
+    def _step(self, currentTime: float):
+        """
+        Service every connection that is ready or whose timer is due by 'currentTime'.
+        """
+        with self.readyLock:
+            ready = self.readyConnections
+            self.readyConnections = set()
+
+        while self.timers and self.timers[0][0] <= currentTime:
+            timerAt, _, connection = heapq.heappop(self.timers)
+            # Timers are never removed from the heap, ignore those that were replaced by a newer one
+            if connection.timerAt == timerAt:
+                connection.timerAt = None
+                ready.add(connection)
+
+        for connection in ready:
+            self.__service(connection, currentTime)
+
+    def _nextTimerAt(self) -> Optional[float]:
+        """
+        Return the time of the earliest timer, or None if there is none.
+        """
+        return self.timers[0][0] if self.timers else None
+
+    def __createConnection(self, addrPort: AddrPort) -> GameNetServerConnection:
+        """
+        Create a connection for a new remote, waiting for its SYN in the ACCEPT state.
+        """
+        connection = GameNetServerConnection(self, addrPort)
+        connection.context.sendAddrPort = self.sock.getsockname()
+        connection.setEnableCrc(self.enableCrc)
+        connection.context.compressor = self.compressor
+        connection.setScheduling(*self.scheduling)
+        connection.setAckPolicy(self.ackEvery, self.ackDelay)
+        connection.setEnableLogSend(self.enableLogSend)
+        connection.setEnableLogRecv(self.enableLogRecv)
+        connection.setEnableLogMetrics(self.enableLogMetrics)
+        connection.setEnableLogInfo(self.enableLogInfo)
+        connection.logger.setSink(self.logSink)
+        connection._transition(GNSStateAccept())
+        with self.readyLock:
+            self.connections[addrPort] = connection
+            self.pendingCount += 1
+        return connection
+
+    def __remove(self, connection: GameNetServerConnection):
+        """
+        Forget a terminated connection, so that its remote may connect again.
+        """
+        with self.readyLock:
+            if self.connections.get(connection.remoteAddrPort) is connection:
+                del self.connections[connection.remoteAddrPort]
+                if connection.isPending:
+                    self.pendingCount -= 1
+
+    def __service(self, connection: GameNetServerConnection, currentTime: float):
+        """
+        Run the state machine of a connection, send its packets and schedule its next timer.
+        """
+        if isinstance(connection.state, GNSStateTerminated):
+            return
+
+        connection._runStateMachine()
+        connection._sendPackets(self.sock.sendto, currentTime)
+
+        if connection.context.acceptSemaphore.acquire(blocking=False):
+            with self.readyLock:
+                connection.isPending = False
+                self.pendingCount -= 1
+            self.acceptQueue.put(connection)
+        elif connection.isPending and currentTime >= connection.handshakeDeadline:
+            # Half-open, e.g. the SYN came from a spoofed address that never answers
+            connection._transition(GNSStateTerminated())
+
+        if isinstance(connection.state, GNSStateTerminated):
+            connection.logger.logMetrics()
+            self.__remove(connection)
+            return
+
+        deadlines = [deadline for deadline in (connection.state.deadline(connection.context),
+                                               connection._nextRetryAt(),
+                                               connection.handshakeDeadline if connection.isPending else None)
+                     if deadline is not None]
+        if deadlines:
+            timerAt = min(deadlines)
+            if connection.timerAt is None or timerAt < connection.timerAt:
+                connection.timerAt = timerAt
+                heapq.heappush(self.timers, (timerAt, next(self.timerCounter), connection))
+
+    def __drive(self):
+        """
+        Runs the state machines and sends packets of all connections. This function is executed in its own thread.
+        It sleeps until a connection becomes ready or the earliest timer fires.
+        """
+        while not self.isClosed:
+            self.event.clear()
+            self._step(time.time())
+            nextTimerAt = self._nextTimerAt()
+            self.event.wait(None if nextTimerAt is None else max(0.0, nextTimerAt - time.time()))
+        self.sock.close()
+
+    def __recv(self):
+        """
+        Receives packets from the socket in batches and dispatches them to their connection.
+        This function is executed in its own thread.
+        """
+        while not self.isClosed:
+            try:
+                self._dispatchBatch(self.receiver.receive(self.sock))
+            except socket.timeout:
+                continue
+            except OSError:
+                break
@@ -26,8 +26,14 @@ class GNSStateAccept(GNSState):
                 # Set ACK to remote's SEQ
                 context.ack = packet.seq + 1
                 context.destAddrPort = recvingPacket.addrPort
+                # Use CRC32 checksums only if both sides offer them
+                context.useCrc = context.enableCrc and packet.isCrc()
+                # Compress payloads only if both sides offer it with the same dictionary
+                context.useCompression = (context.compressor is not None and packet.isCompressed()
+                                          and packet.ack == context.compressor.dictionaryId)
                 # Send back SYN ACK, completing the 2nd step in the 3-way handshake
-                synAck = HUDPPacket.create(context.seq, context.ack, isReliable=True, isSyn=True, isAck=True)
+                synAck = HUDPPacket.create(context.seq, context.ack, isReliable=True, isSyn=True, isAck=True,
+                                           isCrc=context.useCrc, isCompressed=context.useCompression)
                 context.seq += 1
                 context.sendWindow.put(SendingHUDPPacket(synAck))
                 return GNSStateSynRcvd()
@@ -23,7 +23,7 @@ class GNSStateCloseWait(GNSState):
             recvingPacket = context.recvWindow.get()
             packet = recvingPacket.packet
             if packet.isFin() and packet.seq + 1 == context.ack:
-                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.seq, context.ack)))
+                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.seq, context.ack, context.useCrc)))
             elif packet.isPureAck():
                 context.rec = max(context.rec, packet.ack)
             elif packet.isRst():
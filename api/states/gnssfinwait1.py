@@ -1,14 +1,13 @@
 from api.states.gnssclosing import GNSStateClosing
-from api.states.gnsstate import GNSState
+from api.states.gnsstate import GNSReceivingState, GNSState
 from api.states.gnssfinwait2 import GNSStateFinWait2
 from api.gnscontext import GNSContext, SendingHUDPPacket
 from api.states.gnssterminated import GNSStateTerminated
-from common import SKIP_AHEAD_TIMEOUT
 from hudp import HUDPPacket
 import time
 
 
-class GNSStateFinWait1(GNSState):
+class GNSStateFinWait1(GNSReceivingState):
     """
     FIN_WAIT1 happens after user calls close() on the socket and a FIN was sent to remote. This state
     essentially waits for the expected ACK to come back.
@@ -26,57 +25,29 @@ class GNSStateFinWait1(GNSState):
     All other packets are dropped and ignored.
     """
 
-    def __init__(self):
-        self.timeOnCurrentAck = time.time()
-        """
-        The last time when ACK changed.
-        """
-
     def process(self, context: GNSContext) -> GNSState:
         recvLen = context.recvWindow.qsize()
         for _ in range(recvLen):
             recvingPacket = context.recvWindow.get()
             packet = recvingPacket.packet
             if packet.isSynAck() and packet.seq + 1 == context.ack:
-                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.rec, context.ack)))
+                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.rec, context.ack, context.useCrc)))
             elif packet.isFin() and packet.seq == context.ack:  # Simultaneous close
                 context.ack = packet.seq + 1
-                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.seq, context.ack)))
+                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.seq, context.ack, context.useCrc)))
                 return GNSStateClosing()
             elif packet.isRst() and packet.seq == context.ack:
                 return GNSStateTerminated()
-            elif packet.isPureAck() and packet.ack == context.seq:
+            elif packet.isPureAck() and packet.ack == context.finAck:
                 context.rec = packet.ack
                 context.closeSemaphore.release()
                 return GNSStateFinWait2()
             elif packet.isPureAck():
                 context.rec = max(context.rec, packet.ack)
             elif packet.isDataPacket():
-                if not packet.isReliable():
-                    context.recvBuffer.put(packet.content)
-                    continue
-
-                if packet.seq < context.ack:
-                    # We have acknowledged this packet before, skip it.
-                    continue
-                elif packet.seq > context.ack:
-                    # If this packet is out-in-order, all packets after it are out-of-order too
-                    # due to the ordering of the PriorityQueue
-                    context.recvWindow.put(recvingPacket)
-                    break
-                else:
-                    context.rec = max(context.rec, packet.ack)
-                    context.ack = packet.calculateAck()
+                if self.receiveData(context, recvingPacket):
                     self.timeOnCurrentAck = time.time()
-                    context.shouldSendAck = True
-                    context.recvBuffer.put(packet.content)
 
-        currentTime = time.time()
-        # The socket has been stuck on this ACK for too long, skip ACK to the nearest next SEQ
-        # that it has received
-        if currentTime - self.timeOnCurrentAck > SKIP_AHEAD_TIMEOUT and context.recvWindow.qsize() > 0:
-            recvingPacket = context.recvWindow.get()
-            context.ack = recvingPacket.packet.seq
-            context.recvWindow.put(recvingPacket)
+        self.skipStalled(context)
 
         return self
@@ -19,7 +19,7 @@ class GNSStateLastAck(GNSState):
         for _ in range(recvLen):
             recvingPacket = context.recvWindow.get()
             packet = recvingPacket.packet
-            if packet.isPureAck() and packet.ack == context.seq:
+            if packet.isPureAck() and packet.ack == context.finAck:
                 context.rec = packet.ack
                 context.closeSemaphore.release()
                 return GNSStateTerminated()
@@ -28,6 +28,8 @@ class GNSStateSynRcvd(GNSState):
             elif packet.isSynAck() and packet.ack == context.seq:
                 context.ack = packet.seq + 1
                 context.rec = packet.ack
+                context.useCrc = context.useCrc and packet.isCrc()
+                context.useCompression = context.useCompression and packet.isCompressed()
                 context.connectSemaphore.release()
                 return GNSStateEstablished()
             elif packet.isRst() and packet.ack == context.seq:
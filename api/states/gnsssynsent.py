@@ -25,12 +25,18 @@ class GNSStateSynSent(GNSState):
             if packet.isSynAck() and packet.ack == context.seq:
                 context.ack = packet.seq + 1
                 context.rec = packet.ack
-                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.seq, context.ack)))
+                context.useCrc = context.enableCrc and packet.isCrc()
+                context.useCompression = context.compressor is not None and packet.isCompressed()
+                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.seq, context.ack, context.useCrc)))
                 context.connectSemaphore.release()
                 return GNSStateEstablished()
             elif packet.isSyn():  # Simultaneous open
                 context.ack = packet.seq + 1
-                synAck = HUDPPacket.create(context.seq - 1, context.ack, isReliable=True, isSyn=True, isAck=True)
+                context.useCrc = context.enableCrc and packet.isCrc()
+                context.useCompression = (context.compressor is not None and packet.isCompressed()
+                                          and packet.ack == context.compressor.dictionaryId)
+                synAck = HUDPPacket.create(context.seq - 1, context.ack, isReliable=True, isSyn=True, isAck=True,
+                                           isCrc=context.useCrc, isCompressed=context.useCompression)
                 context.sendWindow.put(SendingHUDPPacket(synAck))
                 return GNSStateSynRcvd()
             elif packet.isRst() and packet.ack == context.seq:
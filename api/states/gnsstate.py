@@ -1,6 +1,11 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from api.gnscontext import GNSContext
+from typing import Optional
+import time
+import zlib
+from api.gnscontext import GNSContext, RecvingHUDPPacket
+from common import SKIP_AHEAD_TIMEOUT, StreamMessage
+from hudp import HUDPPacket
 
 
 class GNSState(ABC):
@@ -11,3 +16,173 @@ class GNSState(ABC):
     @abstractmethod
     def process(self, context: GNSContext) -> GNSState:
         pass
+
+    def deliver(self, context: GNSContext, packet: HUDPPacket):
+        """
+        Hand the data of a packet to the user, one item of 'recvBuffer' per message if it was coalesced,
+        tagged with the stream it was sent on.
+        A fragment is only handed over with the last fragment of its message,
+        a keyed update only if it is newer than the last one delivered for its key,
+        and a snapshot only once it is rebuilt from its baseline, as an item of 'snapshotBuffer'.
+        Compressed payloads are decompressed first. Those that cannot be are dropped.
+        The packet itself is left untouched, since reliable ones may still be waiting in 'reassembly'.
+        """
+        stream = 0
+        if packet.isStream():
+            stream, _ = packet.streamHeader()
+            packet = packet.withContent(packet.streamData())
+        if packet.isCompressed():
+            if not context.useCompression:
+                return
+            try:
+                # SEQ and ACK were already taken from the size of the payload on the wire
+                packet = packet.withContent(context.compressor.decompress(packet.content))
+            except zlib.error:
+                return
+        if packet.isKeyed():
+            key, counter = packet.keyedHeader()
+            lastCounter = context.deliveredCounters.get(key)
+            if lastCounter is None or HUDPPacket.isNewerCounter(counter, lastCounter):
+                context.deliveredCounters[key] = counter
+                context.recvBuffer.put(StreamMessage(packet.keyedData()))
+            return
+        if packet.isFragment():
+            message = context.fragments.add(packet, time.time())
+            messages = [] if message is None else [message]
+        else:
+            messages = packet.messages()
+        for message in messages:
+            if packet.isSnapshot():
+                self.__deliverSnapshot(context, message)
+            else:
+                context.recvBuffer.put(StreamMessage(message, stream))
+
+    def __deliverSnapshot(self, context: GNSContext, data: bytes):
+        """
+        Rebuild a snapshot and make its ACK due, so that remote encodes the next snapshots against it.
+        """
+        decoded = context.snapshotDecoder.decode(data)
+        if decoded is None:
+            return
+        snapshotId, snapshot = decoded
+        context.snapshotBuffer.put(snapshot)
+        with context.ackLock:
+            context.snapshotAck = snapshotId
+        context.shouldSendAck = True
+
+    def receiveData(self, context: GNSContext, recvingPacket: RecvingHUDPPacket) -> bool:
+        """
+        Handle a data packet: unreliable ones are delivered right away, reliable ones in order of their stream.
+        A reliable packet past the ACK waits in 'reassembly' until the packets before it arrive, which only holds
+        back the ACK. It is delivered as soon as the packets before it on its stream were, see 'streams'.
+        Return True if the ACK advanced.
+        """
+        packet = recvingPacket.packet
+        if not packet.isReliable():
+            # Unreliable packets may carry a piggybacked ACK
+            if packet.isAck():
+                context.rec = max(context.rec, packet.ack)
+            self.deliver(context, packet)
+            return False
+
+        if packet.seq != context.ack:
+            # Out-of-order, or acknowledged before and dropped by the buffer
+            if context.reassembly.insert(recvingPacket, context.ack):
+                self.__deliverInStream(context, packet)
+            else:
+                context.counters.duplicates += 1
+            return False
+
+        self.__accept(context, packet)
+        self.__deliverInStream(context, packet)
+        self.__acceptContiguous(context)
+        return True
+
+    def skipAhead(self, context: GNSContext):
+        """
+        Give up on the packets missing before the first one waiting in 'reassembly', move the ACK to it and
+        past the run of packets that follows.
+        """
+        firstSeq = context.reassembly.firstSeq()
+        if firstSeq is not None:
+            context.counters.skipAheads += 1
+            context.ack = firstSeq
+            self.__acceptContiguous(context)
+
+    def skipStalledStreams(self, context: GNSContext, currentTime: float):
+        """
+        Give up on the packets missing on the streams stuck on them for too long and deliver the packets that follow.
+        """
+        for packet in context.streams.skipStalled(currentTime):
+            self.deliver(context, packet)
+
+    def __deliverInStream(self, context: GNSContext, packet: HUDPPacket):
+        """
+        Deliver a reliable packet that just arrived, along with the packets of its stream that were waiting for it,
+        or keep it until the packets before it on its stream arrive.
+        Packets without a stream header are delivered in order of SEQ instead, once the ACK moves past them.
+        """
+        if not packet.isStream():
+            return
+        stream, streamSeq = packet.streamHeader()
+        for streamPacket in context.streams.offer(stream, streamSeq, packet, time.time()):
+            self.deliver(context, streamPacket)
+
+    def __accept(self, context: GNSContext, packet: HUDPPacket):
+        """
+        Move the ACK past a reliable packet whose SEQ is the ACK, and deliver it if it has no stream header.
+        """
+        context.rec = max(context.rec, packet.ack)
+        context.ack = packet.calculateAck()
+        context.shouldSendAck = True
+        if not packet.isStream():
+            self.deliver(context, packet)
+
+    def __acceptContiguous(self, context: GNSContext):
+        """
+        Move the ACK past the packets of 'reassembly' that now follow it without gap.
+        """
+        for recvingPacket in context.reassembly.popContiguous(context.ack):
+            self.__accept(context, recvingPacket.packet)
+
+    def deadline(self, context: GNSContext) -> Optional[float]:
+        """
+        Return the time at which process() must run again even if no packet arrives,
+        or None if the state only reacts to incoming packets.
+        """
+        return None
+
+
+class GNSReceivingState(GNSState, ABC):
+    """
+    Base of the states in which data from remote is still received, i.e. ESTABLISHED and the states of an active
+    close. They skip the ACK, and each stream, ahead of a missing packet they have been stuck on for too long.
+    """
+
+    def __init__(self):
+        self.timeOnCurrentAck = time.time()
+        """
+        The last time when ACK changed.
+        """
+
+    def skipStalled(self, context: GNSContext):
+        """
+        Skip ahead where receiving has been stuck on a missing packet for longer than SKIP_AHEAD_TIMEOUT.
+        To be called at the end of process().
+        """
+        currentTime = time.time()
+        # The socket has been stuck on this ACK for too long, skip ACK to the nearest next SEQ
+        # that it has received
+        if currentTime - self.timeOnCurrentAck > SKIP_AHEAD_TIMEOUT and len(context.reassembly) > 0:
+            self.skipAhead(context)
+            self.timeOnCurrentAck = currentTime
+        # Likewise for each stream stuck on a missing packet, while the other streams go on
+        self.skipStalledStreams(context, currentTime)
+
+    def deadline(self, context: GNSContext) -> Optional[float]:
+        # A timer is only needed to skip ahead while out-of-order packets are waiting, on the ACK or on a stream
+        deadline = context.streams.deadline()
+        if len(context.reassembly) > 0:
+            skipAt = self.timeOnCurrentAck + SKIP_AHEAD_TIMEOUT
+            deadline = skipAt if deadline is None else min(deadline, skipAt)
+        return deadline
@@ -3,6 +3,7 @@ from api.gnscontext import GNSContext, SendingHUDPPacket
 from api.states.gnssterminated import GNSStateTerminated
 from hudp import HUDPPacket
 from common import TIME_WAIT_TIME
+from typing import Optional
 import time
 
 
@@ -25,9 +26,12 @@ class GNSStateTimeWait(GNSState):
             recvingPacket = context.recvWindow.get()
             packet = recvingPacket.packet
             if packet.isFin() and packet.seq + 1 == context.ack:
-                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.seq, context.ack)))
+                context.sendWindow.put(SendingHUDPPacket(HUDPPacket.createPureAck(context.seq, context.ack, context.useCrc)))
 
         if time.time() - self.initialTime > TIME_WAIT_TIME:
             return GNSStateTerminated()
 
         return self
+
+    def deadline(self, context: GNSContext) -> Optional[float]:
+        return self.initialTime + TIME_WAIT_TIME
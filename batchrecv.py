@@ -0,0 +1,296 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import socket
+import sys
+
+from common import AddrPort, MAX_DATAGRAM_SIZE, RECV_BATCH_SIZE, RECV_SLOT_SIZE
+
+Datagram = Tuple[memoryview, AddrPort]
+"""
+A received datagram and the address and port number it came from.
+"""
+
+WSAEMSGSIZE = 10040
+"""
+Error raised by Windows, instead of truncating the datagram, when it does not fit in the buffer of recvfrom_into().
+"""
+
+
+class DatagramReceiver(ABC):
+    """
+    Interface for the way a receiving thread reads datagrams from its UDP socket.
+
+    receive() blocks like recvfrom() until a first datagram arrives or the socket times out, then drains the
+    datagrams already waiting in the socket without blocking, so that a burst is handed over as one batch
+    instead of waking the thread and taking the queue locks once per datagram. Every datagram is received
+    into its own slot of a buffer allocated on the first call, and is only valid until the next call.
+
+    Slots are sized for the MTU rather than for the largest UDP payload, so that a receiver holds a few kilobytes
+    instead of a megabyte. A datagram that fills its slot may have been truncated, which the checksum does not
+    always catch, so it is dropped and the slots grow to MAX_DATAGRAM_SIZE for the next call, in time for
+    its retransmission.
+    """
+
+    name: str = ""
+
+    def __init__(self, batchSize: int = RECV_BATCH_SIZE, slotSize: int = RECV_SLOT_SIZE):
+        self.batchSize = batchSize
+        """
+        Maximum number of datagrams returned by one call to receive().
+        """
+
+        self.slotSize = min(slotSize, MAX_DATAGRAM_SIZE)
+        """
+        Bytes of each slot, MAX_DATAGRAM_SIZE once a datagram filled a smaller one.
+        """
+
+        self.buffer: Optional[bytearray] = None
+        """
+        Memory of the slots, one of 'slotSize' bytes per datagram of a batch.
+        """
+
+        self.slots: List[memoryview] = []
+        """
+        Views over the slots of 'buffer'.
+        """
+
+    def receive(self, sock: socket.socket) -> List[Datagram]:
+        """
+        Return the datagrams waiting in 'sock', at least one unless they were dropped as truncated.
+        Raise socket.timeout if none arrives within the timeout of 'sock'.
+        """
+        if self.buffer is None:
+            self._allocate()
+        while True:
+            try:
+                size, addrPort = sock.recvfrom_into(self.slots[0])
+                break
+            except OSError as error:
+                if not self._isTruncated(error):
+                    raise
+                self._grow()
+                self._allocate()
+        datagrams = [(self.slots[0][:size], addrPort)]
+        if self.batchSize > 1:
+            self._drain(sock, datagrams)
+        if self.slotSize < MAX_DATAGRAM_SIZE:
+            fittingDatagrams = [datagram for datagram in datagrams if len(datagram[0]) < self.slotSize]
+            if len(fittingDatagrams) < len(datagrams):
+                self._grow()
+                return fittingDatagrams
+        return datagrams
+
+    def _grow(self):
+        """
+        Receive into slots of MAX_DATAGRAM_SIZE bytes from the next call on. The datagrams returned by this call
+        keep the current buffer alive until then.
+        """
+        self.slotSize = MAX_DATAGRAM_SIZE
+        self.buffer = None
+
+    @staticmethod
+    def _isTruncated(error: OSError) -> bool:
+        """
+        Return True if recvfrom_into() failed because the datagram was larger than the slot, which Windows reports
+        as an error and drops. False otherwise.
+        """
+        return getattr(error, "winerror", None) == WSAEMSGSIZE
+
+    def _allocate(self):
+        """
+        Allocate the slots of the batches.
+        """
+        self.buffer = bytearray(self.batchSize * self.slotSize)
+        view = memoryview(self.buffer)
+        self.slots = [view[i * self.slotSize:(i + 1) * self.slotSize] for i in range(self.batchSize)]
+
+    @abstractmethod
+    def _drain(self, sock: socket.socket, datagrams: List[Datagram]):
+        """
+        Append the datagrams already waiting in 'sock' to 'datagrams', without blocking, until the socket
+        is empty or the batch is full. The slots after the last datagram of 'datagrams' are free.
+        """
+        pass
+
+
+class SingleReceiver(DatagramReceiver):
+    """
+    One datagram per call, i.e. the behaviour before batching was added. Kept as the baseline for benchmarks.
+    """
+
+    name = "single"
+
+    def __init__(self, batchSize: int = 1, slotSize: int = RECV_SLOT_SIZE):
+        super().__init__(1, slotSize)
+
+    def _drain(self, sock: socket.socket, datagrams: List[Datagram]):
+        pass
+
+
+class PollingReceiver(DatagramReceiver):
+    """
+    Portable batching: checks that the socket is readable with a zero-timeout select() before each recvfrom(),
+    since a socket with a timeout would otherwise wait for it to expire once the socket is empty.
+    """
+
+    name = "poll"
+
+    def _drain(self, sock: socket.socket, datagrams: List[Datagram]):
+        while len(datagrams) < self.batchSize:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                return
+            slot = self.slots[len(datagrams)]
+            try:
+                size, addrPort = sock.recvfrom_into(slot)
+            except OSError as error:
+                if not self._isTruncated(error):
+                    raise
+                self._grow()
+                return
+            datagrams.append((slot[:size], addrPort))
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IoVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+SOCKADDR_SIZE = 128
+"""
+Size of a struct sockaddr_storage, large enough for the address of any socket family.
+"""
+
+MAX_CACHED_ADDRESSES = 4096
+"""
+Number of decoded remote addresses kept by RecvmmsgReceiver before its cache is cleared.
+"""
+
+
+def _loadRecvmmsg():
+    """
+    Return libc's recvmmsg(), or None if it is not available on this platform.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+_recvmmsg = _loadRecvmmsg()
+
+
+class RecvmmsgReceiver(DatagramReceiver):
+    """
+    Linux only: drains the socket with a single recvmmsg() system call, called through ctypes,
+    which fills the slots and the source addresses of a whole batch at once.
+    """
+
+    name = "recvmmsg"
+
+    def __init__(self, batchSize: int = RECV_BATCH_SIZE, slotSize: int = RECV_SLOT_SIZE):
+        super().__init__(batchSize, slotSize)
+
+        self.headers = None
+        """
+        The struct mmsghdr of each slot, pointing at the slot and at its entry of 'names'.
+        """
+
+        self.ioVecs = None
+        """
+        The struct iovec of each slot.
+        """
+
+        self.names = None
+        """
+        The struct sockaddr_storage that recvmmsg() writes the source address of each slot into.
+        """
+
+        self.addresses: Dict[bytes, AddrPort] = {}
+        """
+        Decoded source addresses, keyed by their raw struct sockaddr, so that each remote is only decoded once.
+        """
+
+    def _allocate(self):
+        super()._allocate()
+        self.names = ctypes.create_string_buffer(self.batchSize * SOCKADDR_SIZE)
+        self.headers = (_MMsgHdr * self.batchSize)()
+        self.ioVecs = (_IoVec * self.batchSize)()
+        base = ctypes.addressof((ctypes.c_char * len(self.buffer)).from_buffer(self.buffer))
+        for i in range(self.batchSize):
+            self.ioVecs[i].iov_base = base + i * self.slotSize
+            self.ioVecs[i].iov_len = self.slotSize
+            header = self.headers[i].msg_hdr
+            header.msg_name = ctypes.addressof(self.names) + i * SOCKADDR_SIZE
+            header.msg_iov = ctypes.pointer(self.ioVecs[i])
+            header.msg_iovlen = 1
+
+    def _drain(self, sock: socket.socket, datagrams: List[Datagram]):
+        first = len(datagrams)
+        count = self.batchSize - first
+        for i in range(first, self.batchSize):
+            self.headers[i].msg_hdr.msg_namelen = SOCKADDR_SIZE
+        received = _recvmmsg(sock.fileno(), ctypes.addressof(self.headers[first]), count,
+                             socket.MSG_DONTWAIT, None)
+        if received < 0:
+            error = ctypes.get_errno()
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            raise OSError(error, os.strerror(error))
+        names = ctypes.addressof(self.names)
+        for i in range(first, first + received):
+            header = self.headers[i]
+            name = ctypes.string_at(names + i * SOCKADDR_SIZE, header.msg_hdr.msg_namelen)
+            datagrams.append((self.slots[i][:header.msg_len], self.__decodeAddress(name)))
+
+    def __decodeAddress(self, name: bytes) -> AddrPort:
+        """
+        Convert a raw struct sockaddr_in or sockaddr_in6 into the tuple that recvfrom() would return.
+        """
+        addrPort = self.addresses.get(name)
+        if addrPort is not None:
+            return addrPort
+        family = int.from_bytes(name[:2], sys.byteorder)
+        port = int.from_bytes(name[2:4], "big")
+        if family == socket.AF_INET6:
+            addrPort = (socket.inet_ntop(socket.AF_INET6, name[8:24]), port,
+                        int.from_bytes(name[4:8], "big"), int.from_bytes(name[24:28], sys.byteorder))
+        else:
+            addrPort = (socket.inet_ntop(socket.AF_INET, name[4:8]), port)
+        if len(self.addresses) >= MAX_CACHED_ADDRESSES:
+            self.addresses.clear()
+        self.addresses[name] = addrPort
+        return addrPort
+
+
+DATAGRAM_RECEIVERS = {receiver.name: receiver for receiver in (SingleReceiver, PollingReceiver, RecvmmsgReceiver)
+                      if receiver is not RecvmmsgReceiver or _recvmmsg is not None}
+"""
+All datagram receivers available on this platform, keyed by name.
+"""
+
+DEFAULT_DATAGRAM_RECEIVER = "recvmmsg" if "recvmmsg" in DATAGRAM_RECEIVERS else "poll"
+"""
+Name of the receiver used by new sockets: recvmmsg() where available, select() and recvfrom() otherwise.
+"""
@@ -0,0 +1,31 @@
+import os
+from timeit import Timer
+from checksum import CHECKSUM_BACKENDS
+
+PAYLOAD_SIZES = [0, 64, 256, 1024, 4096, 16364]
+HEADER_SIZE = 20
+REPEAT = 5
+
+
+def benchmark(backend, header: bytes, payload: bytes) -> float:
+    """
+    Return the best time in microseconds taken by the backend to checksum one packet.
+    """
+    timer = Timer(lambda: backend.compute(header, payload))
+    number, _ = timer.autorange()
+    return min(timer.repeat(REPEAT, number)) / number * 1e6
+
+
+def main():
+    header = os.urandom(HEADER_SIZE)
+    names = list(CHECKSUM_BACKENDS)
+    print(f"{'Payload (B)':>12}" + "".join(f"{name + ' (us)':>14}" for name in names) + f"{'Speedup':>10}")
+    for size in PAYLOAD_SIZES:
+        payload = os.urandom(size)
+        results = {name: benchmark(backend, header, payload) for name, backend in CHECKSUM_BACKENDS.items()}
+        speedup = results["loop"] / results["bulk"]
+        print(f"{size:>12}" + "".join(f"{results[name]:>14.2f}" for name in names) + f"{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
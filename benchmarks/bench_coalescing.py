@@ -0,0 +1,110 @@
+import asyncio
+import itertools
+import random
+import statistics
+import struct
+import time
+from api.gnsasync import AsyncGameNetSocket
+from benchmarks.bench_congestion import EmulatedLink, PROFILES
+from common import SocketTimeoutException
+from hudp import HEADER_SIZE
+
+TICK_COUNT = 200
+TICK_INTERVAL = 0.005
+MESSAGES_PER_TICK = 20
+"""
+Small messages sent back-to-back at every game tick, half on each channel.
+"""
+MESSAGE_SIZE = 32
+RUN_TIMEOUT = 30.0
+BUDGETS = [None, 0.001, 0.005]
+"""
+Latency budgets compared, None disables coalescing.
+"""
+
+TIMESTAMP = struct.Struct("!d")
+
+
+class CountingLink(EmulatedLink):
+    """
+    EmulatedLink that also counts the bytes sent by the client.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.bytesByClient = 0
+
+    def datagram_received(self, data: bytes, addrPort):
+        if addrPort == self.clientAddrPort:
+            self.bytesByClient += len(data)
+        super().datagram_received(data, addrPort)
+
+
+async def run(port: int, latencyBudget):
+    serverAddrPort, clientAddrPort, linkAddrPort = [("127.0.0.1", port + i) for i in range(3)]
+    loop = asyncio.get_running_loop()
+    link = CountingLink(clientAddrPort, serverAddrPort, *PROFILES["default"])
+    linkTransport, _ = await loop.create_datagram_endpoint(lambda: link, local_addr=linkAddrPort)
+
+    sockets = []
+    for addrPort in (serverAddrPort, clientAddrPort):
+        sock = AsyncGameNetSocket()
+        for setEnable in (sock.setEnableLogSend, sock.setEnableLogRecv, sock.setEnableLogMetrics,
+                          sock.setEnableLogInfo):
+            setEnable(False)
+        sock.setCoalescing(latencyBudget)
+        sock.bind(addrPort)
+        sockets.append(sock)
+    server, client = sockets
+
+    await server.listen()
+    accepting = asyncio.ensure_future(server.accept())
+    await client.connect(linkAddrPort)
+    await accepting
+
+    async def produce():
+        padding = bytes(MESSAGE_SIZE - TIMESTAMP.size)
+        for _ in range(TICK_COUNT):
+            for i in range(MESSAGES_PER_TICK):
+                client.send(TIMESTAMP.pack(time.time()) + padding, i % 2 == 0)
+            await asyncio.sleep(TICK_INTERVAL)
+
+    producing = asyncio.ensure_future(produce())
+    datagramsBefore, bytesBefore = link.sentByClient, link.bytesByClient
+    latencies = []
+    start = time.time()
+    try:
+        while len(latencies) < TICK_COUNT * MESSAGES_PER_TICK and time.time() - start < RUN_TIMEOUT:
+            data = await server.recv(timeout=1.0)
+            latencies.append(time.time() - TIMESTAMP.unpack_from(data)[0])
+    except SocketTimeoutException:
+        pass
+    await producing
+
+    for sock in sockets:
+        sock.transport.close()
+    linkTransport.close()
+    # Datagrams sent by the client also include its pure ACKs, which are few since it receives no data
+    return latencies, link.sentByClient - datagramsBefore, link.bytesByClient - bytesBefore
+
+
+def main():
+    messageCount = TICK_COUNT * MESSAGES_PER_TICK
+    print(f"{messageCount} messages of {MESSAGE_SIZE} B, {MESSAGES_PER_TICK} every {TICK_INTERVAL * 1000:g} ms, "
+          f"half reliable and half unreliable")
+    print(f"{'Budget (ms)':>12}{'Delivered':>11}{'Datagrams':>11}{'Msgs/datagram':>15}{'Header bytes':>14}"
+          f"{'Wire bytes':>12}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+    ports = itertools.count(42000, 10)
+    for latencyBudget in BUDGETS:
+        random.seed(0)
+        latencies, datagrams, wireBytes = asyncio.run(run(next(ports), latencyBudget))
+        name = "off" if latencyBudget is None else f"{latencyBudget * 1000:g}"
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else float("nan")
+        print(f"{name:>12}{len(latencies) / messageCount:>10.1%}{datagrams:>11}{messageCount / datagrams:>15.1f}"
+              f"{datagrams * HEADER_SIZE:>14}{wireBytes:>12}{p50:>10.2f}{p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
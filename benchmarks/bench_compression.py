@@ -0,0 +1,80 @@
+import json
+import random
+import time
+from compression import PayloadCompressor
+
+PAYLOAD_COUNT = 5000
+DICTIONARY_SAMPLES = 40
+"""
+Payloads concatenated into the preset dictionary, generated apart from the measured ones.
+"""
+MESSAGE_COUNTS = [1, 4, 16]
+"""
+Game messages per payload, e.g. as coalesced into a single packet.
+"""
+
+MESSAGE_TYPES = ["move", "shoot", "chat", "spawn"]
+
+
+def message() -> dict:
+    """
+    Return a random game message, with the field names and shapes every message of its type shares.
+    """
+    kind = random.choice(MESSAGE_TYPES)
+    body = {"type": kind, "entity": random.randrange(10000), "tick": random.randrange(1 << 20)}
+    if kind == "move":
+        body["position"] = {axis: round(random.uniform(-500, 500), 2) for axis in "xyz"}
+        body["velocity"] = {axis: round(random.uniform(-10, 10), 2) for axis in "xyz"}
+    elif kind == "shoot":
+        body["weapon"] = random.choice(["rifle", "pistol", "shotgun"])
+        body["target"] = random.randrange(10000)
+    elif kind == "chat":
+        body["channel"] = random.choice(["team", "all"])
+        body["text"] = random.choice(["gg", "need backup", "on my way", "nice shot"])
+    else:
+        body["health"] = 100
+        body["team"] = random.choice(["red", "blue"])
+    return body
+
+
+def payload(messageCount: int) -> bytes:
+    return json.dumps([message() for _ in range(messageCount)], separators=(",", ":")).encode()
+
+
+def run(compressor: PayloadCompressor, payloads):
+    """
+    Return the wire bytes per payload, the share of payloads sent compressed and the microseconds per payload
+    spent compressing and decompressing.
+    """
+    start = time.perf_counter()
+    results = [compressor.compress(data) for data in payloads]
+    compressTime = time.perf_counter() - start
+    compressed = [result for result in results if result is not None]
+    start = time.perf_counter()
+    for result in compressed:
+        compressor.decompress(result)
+    decompressTime = time.perf_counter() - start
+    wireBytes = sum(len(data) if result is None else len(result) for data, result in zip(payloads, results))
+    return (wireBytes / len(payloads), len(compressed) / len(payloads), compressTime / len(payloads) * 1e6,
+            decompressTime / len(payloads) * 1e6)
+
+
+def main():
+    print(f"{PAYLOAD_COUNT} JSON payloads per row, dictionary of {DICTIONARY_SAMPLES} sample payloads")
+    print(f"{'Messages':>9}{'Raw (B)':>9}{'Dictionary':>12}{'Wire (B)':>10}{'Saved':>8}{'Compressed':>12}"
+          f"{'Compress (us)':>15}{'Decompress (us)':>17}{'us per KB saved':>17}")
+    for messageCount in MESSAGE_COUNTS:
+        random.seed(messageCount)
+        dictionary = b"".join(payload(messageCount) for _ in range(DICTIONARY_SAMPLES))[-32768:]
+        payloads = [payload(messageCount) for _ in range(PAYLOAD_COUNT)]
+        rawBytes = sum(len(data) for data in payloads) / len(payloads)
+        for name, compressor in (("none", PayloadCompressor()), ("preset", PayloadCompressor(dictionary))):
+            wireBytes, compressedShare, compressTime, decompressTime = run(compressor, payloads)
+            saved = rawBytes - wireBytes
+            costPerKb = (compressTime + decompressTime) / saved * 1024 if saved > 0 else float("nan")
+            print(f"{messageCount:>9}{rawBytes:>9.0f}{name:>12}{wireBytes:>10.0f}{saved / rawBytes:>8.1%}"
+                  f"{compressedShare:>12.1%}{compressTime:>15.1f}{decompressTime:>17.1f}{costPerKb:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import asyncio
+import itertools
+import random
+import time
+from api.gnsasync import AsyncGameNetSocket
+from common import SocketTimeoutException
+
+MESSAGE_COUNT = 1000
+MESSAGE_SIZE = 1000
+BOTTLENECK_RATE = 1_000_000
+"""
+Bytes per second the emulated link forwards from the client to the server.
+"""
+BOTTLENECK_QUEUE = 32_000
+"""
+Bytes the emulated link buffers before dropping datagrams from the client.
+"""
+RUN_TIMEOUT = 30.0
+
+PROFILES = {
+    # Same delay, jitter and loss as tests/setup_netem.sh
+    "default": (0.001, 0.0, 0.0),
+    "low_loss": (0.001, 0.005, 0.01),
+    "high_loss": (0.001, 0.020, 0.11),
+}
+CONTROLLERS = [("none", False), ("newreno", False), ("newreno", True), ("cubic", True)]
+
+
+class EmulatedLink(asyncio.DatagramProtocol):
+    """
+    UDP relay between a client and a server emulating netem's delay, normally distributed jitter and loss
+    in both directions, plus a bottleneck with a drop-tail queue from the client to the server.
+    """
+
+    def __init__(self, clientAddrPort, serverAddrPort, delay: float, jitter: float, loss: float):
+        self.clientAddrPort = clientAddrPort
+        self.serverAddrPort = serverAddrPort
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.transport = None
+        self.linkFreeAt = 0.0
+        self.sentByClient = 0
+        self.queueDrops = 0
+        self.randomDrops = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addrPort):
+        currentTime = time.time()
+        isFromClient = addrPort == self.clientAddrPort
+        destAddrPort = self.serverAddrPort if isFromClient else self.clientAddrPort
+        departAt = currentTime
+        if isFromClient:
+            self.sentByClient += 1
+            queued = max(0.0, self.linkFreeAt - currentTime) * BOTTLENECK_RATE
+            if queued + len(data) > BOTTLENECK_QUEUE:
+                self.queueDrops += 1
+                return
+            self.linkFreeAt = max(currentTime, self.linkFreeAt) + len(data) / BOTTLENECK_RATE
+            departAt = self.linkFreeAt
+        if random.random() < self.loss:
+            self.randomDrops += 1
+            return
+        deliverAt = departAt + max(0.0, random.gauss(self.delay, self.jitter))
+        asyncio.get_running_loop().call_later(deliverAt - currentTime, self.forward, data, destAddrPort)
+
+    def forward(self, data: bytes, destAddrPort):
+        if not self.transport.is_closing():
+            self.transport.sendto(data, destAddrPort)
+
+
+async def run(port: int, profile, congestionControl: str, enablePacing: bool):
+    serverAddrPort, clientAddrPort, linkAddrPort = [("127.0.0.1", port + i) for i in range(3)]
+    loop = asyncio.get_running_loop()
+    link = EmulatedLink(clientAddrPort, serverAddrPort, *profile)
+    linkTransport, _ = await loop.create_datagram_endpoint(lambda: link, local_addr=linkAddrPort)
+
+    sockets = []
+    for addrPort in (serverAddrPort, clientAddrPort):
+        sock = AsyncGameNetSocket()
+        for setEnable in (sock.setEnableLogSend, sock.setEnableLogRecv, sock.setEnableLogMetrics,
+                          sock.setEnableLogInfo):
+            setEnable(False)
+        sock.setCongestionControl(congestionControl)
+        sock.setEnablePacing(enablePacing)
+        sock.bind(addrPort)
+        sockets.append(sock)
+    server, client = sockets
+
+    await server.listen()
+    accepting = asyncio.ensure_future(server.accept())
+    await client.connect(linkAddrPort)
+    await accepting
+
+    payload = bytes(MESSAGE_SIZE)
+    start = time.time()
+    for _ in range(MESSAGE_COUNT):
+        client.send(payload, True)
+    received = 0
+    try:
+        while received < MESSAGE_COUNT and time.time() - start < RUN_TIMEOUT:
+            await server.recv(timeout=RUN_TIMEOUT)
+            received += 1
+    except SocketTimeoutException:
+        pass
+    elapsed = time.time() - start
+
+    for sock in sockets:
+        sock.transport.close()
+    linkTransport.close()
+    return received, elapsed, link
+
+
+def main():
+    print(f"{MESSAGE_COUNT} reliable messages of {MESSAGE_SIZE} B over a {BOTTLENECK_RATE // 1000} KB/s bottleneck "
+          f"with a {BOTTLENECK_QUEUE // 1000} KB queue")
+    print(f"{'Profile':>10}{'Controller':>16}{'Delivered':>11}{'Goodput (KB/s)':>16}{'Datagrams':>11}"
+          f"{'Queue drops':>13}{'Random drops':>14}")
+    ports = itertools.count(41000, 10)
+    for profileName, profile in PROFILES.items():
+        for congestionControl, enablePacing in CONTROLLERS:
+            random.seed(0)
+            received, elapsed, link = asyncio.run(run(next(ports), profile, congestionControl, enablePacing))
+            name = congestionControl + ("+pacing" if enablePacing else "")
+            goodput = received * MESSAGE_SIZE / elapsed / 1000
+            print(f"{profileName:>10}{name:>16}{received / MESSAGE_COUNT:>10.1%}{goodput:>16.1f}"
+                  f"{link.sentByClient:>11}{link.queueDrops:>13}{link.randomDrops:>14}")
+
+
+if __name__ == "__main__":
+    main()
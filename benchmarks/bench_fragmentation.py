@@ -0,0 +1,108 @@
+import asyncio
+import itertools
+import random
+import time
+from api.gnsasync import AsyncGameNetSocket
+from benchmarks.bench_congestion import EmulatedLink, PROFILES
+from common import FRAGMENT_MTU, SocketTimeoutException
+
+MESSAGE_COUNT = 200
+MESSAGE_SIZES = [4000, 16000]
+TICK_INTERVAL = 0.020
+"""
+Interval between unreliable messages, so that they stay below the bottleneck rate. Reliable ones are sent at once.
+"""
+IP_MTU = 1500
+"""
+Size of the IP fragments a datagram is cut into when it is not fragmented by the transport.
+"""
+RUN_TIMEOUT = 30.0
+MTUS = [None, FRAGMENT_MTU]
+"""
+Fragmentation MTUs compared, None leaves large datagrams to IP fragmentation.
+"""
+
+
+class IpFragmentingLink(EmulatedLink):
+    """
+    EmulatedLink that drops a datagram if any of its IP fragments is lost, as IP fragmentation would.
+    """
+
+    def __init__(self, clientAddrPort, serverAddrPort, delay: float, jitter: float, loss: float):
+        super().__init__(clientAddrPort, serverAddrPort, delay, jitter, loss)
+        self.fragmentLoss = loss
+
+    def datagram_received(self, data: bytes, addrPort):
+        ipFragments = -(-len(data) // IP_MTU)
+        self.loss = 1 - (1 - self.fragmentLoss) ** ipFragments
+        super().datagram_received(data, addrPort)
+
+
+async def run(port: int, profile, mtu, isReliable: bool, messageSize: int):
+    serverAddrPort, clientAddrPort, linkAddrPort = [("127.0.0.1", port + i) for i in range(3)]
+    loop = asyncio.get_running_loop()
+    link = IpFragmentingLink(clientAddrPort, serverAddrPort, *profile)
+    linkTransport, _ = await loop.create_datagram_endpoint(lambda: link, local_addr=linkAddrPort)
+
+    sockets = []
+    for addrPort in (serverAddrPort, clientAddrPort):
+        sock = AsyncGameNetSocket()
+        for setEnable in (sock.setEnableLogSend, sock.setEnableLogRecv, sock.setEnableLogMetrics,
+                          sock.setEnableLogInfo):
+            setEnable(False)
+        sock.setFragmentation(mtu)
+        sock.bind(addrPort)
+        sockets.append(sock)
+    server, client = sockets
+
+    await server.listen()
+    accepting = asyncio.ensure_future(server.accept())
+    await client.connect(linkAddrPort)
+    await accepting
+
+    async def produce():
+        for i in range(MESSAGE_COUNT):
+            client.send(bytes([i % 256]) * messageSize, isReliable)
+            if not isReliable:
+                await asyncio.sleep(TICK_INTERVAL)
+
+    producing = asyncio.ensure_future(produce())
+    received = 0
+    start = time.time()
+    try:
+        while received < MESSAGE_COUNT and time.time() - start < RUN_TIMEOUT:
+            data = await server.recv(timeout=1.0)
+            assert len(data) == messageSize
+            received += 1
+    except SocketTimeoutException:
+        pass
+    elapsed = time.time() - start
+    await producing
+
+    for sock in sockets:
+        sock.transport.close()
+    linkTransport.close()
+    return received, elapsed
+
+
+def main():
+    print(f"{MESSAGE_COUNT} messages per run, unreliable ones every {TICK_INTERVAL * 1000:g} ms, "
+          f"an IP fragment of {IP_MTU} B is lost at the loss rate of the profile")
+    print(f"{'Profile':>10}{'Size (B)':>10}{'Fragments':>11}{'Unreliable delivered':>22}{'Reliable time (s)':>19}")
+    ports = itertools.count(43000, 10)
+    for profileName in ("low_loss", "high_loss"):
+        for messageSize in MESSAGE_SIZES:
+            for mtu in MTUS:
+                random.seed(messageSize)
+                unreliableReceived, _ = asyncio.run(run(next(ports), PROFILES[profileName], mtu, False, messageSize))
+                reliableReceived, elapsed = asyncio.run(run(next(ports), PROFILES[profileName], mtu, True,
+                                                            messageSize))
+                name = "IP" if mtu is None else f"HUDP {mtu}"
+                reliableTime = (f"{elapsed:.2f}" if reliableReceived == MESSAGE_COUNT
+                                else f"{reliableReceived}/{MESSAGE_COUNT} in {elapsed:.0f}")
+                print(f"{profileName:>10}{messageSize:>10}{name:>11}{unreliableReceived / MESSAGE_COUNT:>22.1%}"
+                      f"{reliableTime:>19}")
+
+
+if __name__ == "__main__":
+    main()
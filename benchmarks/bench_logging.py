@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+import tracemalloc
+from api.gnscontext import SendingHUDPPacket
+from api.gnslogger import GNSLogger
+from eventlog import FileSink, LOG_WRITER, readEvents
+from hudp import HUDPPacket
+
+PACKET_COUNT = 200000
+PAYLOAD_SIZE = 100
+CONFIGS = [
+    ("off", dict(logSend=False, logRecv=False, logMetrics=False, logInfo=False)),
+    ("metrics", dict(logSend=False, logRecv=False, logMetrics=True, logInfo=False)),
+    ("all", dict(logSend=True, logRecv=True, logMetrics=True, logInfo=True)),
+]
+"""
+Logging turned on per run, by name. Enabled events go to a binary log file.
+"""
+
+
+def run(config: dict, path: str):
+    """
+    Return the microseconds per packet spent logging a reliable packet sent and the ACK received for it,
+    and the memory in KB still held by the logger afterwards, including its metrics.
+    """
+    logger = GNSLogger(**config)
+    logger.setSink(FileSink(path))
+    packets = [HUDPPacket.create(seq * PAYLOAD_SIZE, 0, bytes(PAYLOAD_SIZE), isReliable=True)
+               for seq in range(PACKET_COUNT)]
+    acks = [HUDPPacket.createPureAck(0, (seq + 1) * PAYLOAD_SIZE) for seq in range(PACKET_COUNT)]
+    sendingPackets = [SendingHUDPPacket(packet) for packet in packets]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for sendingPacket, ack in zip(sendingPackets, acks):
+        logger.logSend(sendingPacket)
+        logger.logRecv(ack)
+    elapsed = time.perf_counter() - start
+    LOG_WRITER.flush()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return elapsed / PACKET_COUNT * 1e6, held / 1024
+
+
+def main():
+    print(f"{PACKET_COUNT} reliable packets of {PAYLOAD_SIZE} B sent and ACKed, events written to a binary log file")
+    print(f"{'Logging':>9}{'us per packet':>15}{'Held (KB)':>11}{'Events kept':>13}{'File (KB)':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, config in CONFIGS:
+            path = os.path.join(directory, f"{name}.hlog")
+            perPacket, held = run(config, path)
+            with open(path, "rb") as file:
+                # The rest was dropped while the ring was full, as the loop logs faster than the writer drains
+                kept = sum(1 for _ in readEvents(file))
+            print(f"{name:>9}{perPacket:>15.2f}{held:>11.0f}{kept:>13}{os.path.getsize(path) / 1024:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
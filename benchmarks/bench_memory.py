@@ -0,0 +1,30 @@
+import os
+import tracemalloc
+from api.gnscontext import SendingHUDPPacket
+from common import MAX_SEND_WINDOW_SIZE
+from hudp import HUDPPacket
+
+PAYLOAD_SIZE = 1024
+
+
+def main():
+    # All packets share the same payload object so that only the per-packet overhead is measured
+    payload = os.urandom(PAYLOAD_SIZE)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    window = [
+        SendingHUDPPacket(HUDPPacket.create(i * PAYLOAD_SIZE, 0, payload, isReliable=True, isAck=True))
+        for i in range(MAX_SEND_WINDOW_SIZE)
+    ]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = after - before
+    print(f"In-flight packets: {len(window)}")
+    print(f"Total overhead: {total / 1024:.1f} KiB (excluding the {PAYLOAD_SIZE} B payload)")
+    print(f"Bytes per in-flight packet: {total / len(window):.1f} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import asyncio
+import itertools
+import random
+import statistics
+import struct
+import time
+from api.gnsasync import AsyncGameNetSocket
+from benchmarks.bench_congestion import EmulatedLink, PROFILES
+from common import PRIORITY_BULK, PRIORITY_CRITICAL, PRIORITY_NAMES, PRIORITY_REALTIME, SocketTimeoutException
+
+TICK_COUNT = 120
+TICK_INTERVAL = 1 / 60
+COMMAND = struct.Struct("!Id")
+"""
+Game command sent reliably at every tick: its tick number and the time it was sent at.
+"""
+BULK_COUNT = 1000
+BULK_SIZE = 1000
+"""
+Reliable messages of a bulk transfer queued at once at the start, e.g. a map download, about 1 s of the bottleneck.
+"""
+COMMAND_STREAM = 1
+BULK_STREAM = 2
+RUN_TIMEOUT = 30.0
+SCHEDULERS = [("fifo", "strict"), ("strict", "strict"), ("wfq", "wfq")]
+"""
+Runs compared: name and scheduler. "fifo" sends everything in the same class, as without priority classes.
+"""
+
+
+async def run(port: int, profile, name: str, scheduler: str):
+    """
+    Return the latencies in seconds of the commands received, the time to complete the bulk transfer
+    and the queue metrics of the client.
+    """
+    serverAddrPort, clientAddrPort, linkAddrPort = [("127.0.0.1", port + i) for i in range(3)]
+    loop = asyncio.get_running_loop()
+    link = EmulatedLink(clientAddrPort, serverAddrPort, *profile)
+    linkTransport, _ = await loop.create_datagram_endpoint(lambda: link, local_addr=linkAddrPort)
+
+    sockets = []
+    for addrPort in (serverAddrPort, clientAddrPort):
+        sock = AsyncGameNetSocket()
+        for setEnable in (sock.setEnableLogSend, sock.setEnableLogRecv, sock.setEnableLogMetrics,
+                          sock.setEnableLogInfo):
+            setEnable(False)
+        sock.setScheduling(scheduler)
+        # Packets are only held back, and so scheduled, by a congestion window
+        sock.setCongestionControl("newreno")
+        sock.setEnablePacing(True)
+        sock.bind(addrPort)
+        sockets.append(sock)
+    server, client = sockets
+
+    await server.listen()
+    accepting = asyncio.ensure_future(server.accept())
+    await client.connect(linkAddrPort)
+    await accepting
+
+    commandPriority, bulkPriority = (PRIORITY_REALTIME, PRIORITY_REALTIME) if name == "fifo" \
+        else (PRIORITY_CRITICAL, PRIORITY_BULK)
+
+    async def produce():
+        chunk = bytes(BULK_SIZE)
+        for _ in range(BULK_COUNT):
+            client.send(chunk, True, BULK_STREAM, bulkPriority)
+        for tick in range(TICK_COUNT):
+            client.send(COMMAND.pack(tick, time.perf_counter()), True, COMMAND_STREAM, commandPriority)
+            await asyncio.sleep(TICK_INTERVAL)
+
+    start = time.perf_counter()
+    producing = asyncio.ensure_future(produce())
+    latencies = []
+    bulkReceived = 0
+    bulkTime = float("nan")
+    try:
+        while (len(latencies) < TICK_COUNT or bulkReceived < BULK_COUNT) and time.perf_counter() - start < RUN_TIMEOUT:
+            data = await server.recv(timeout=2.0)
+            if data.stream == COMMAND_STREAM:
+                _, sentAt = COMMAND.unpack(data)
+                latencies.append(time.perf_counter() - sentAt)
+            else:
+                bulkReceived += 1
+                if bulkReceived == BULK_COUNT:
+                    bulkTime = time.perf_counter() - start
+    except SocketTimeoutException:
+        pass
+    await producing
+
+    for sock in sockets:
+        sock.transport.close()
+    linkTransport.close()
+    return latencies, bulkTime, client.logger.queueMetrics
+
+
+def main():
+    print(f"{BULK_COUNT} reliable bulk messages of {BULK_SIZE} B queued at once, then a reliable command every tick "
+          f"for {TICK_COUNT} ticks at {1 / TICK_INTERVAL:.0f} Hz, with pacing")
+    print(f"{'Profile':>10}{'Scheduler':>11}{'Class':>10}{'Queue avg (ms)':>16}{'Queue max (ms)':>16}"
+          f"{'Command p50 (ms)':>18}{'Command p99 (ms)':>18}{'Bulk done (s)':>15}")
+    ports = itertools.count(46000, 10)
+    for profileName in ("default", "low_loss"):
+        for name, scheduler in SCHEDULERS:
+            random.seed(0)
+            latencies, bulkTime, queueMetrics = asyncio.run(run(next(ports), PROFILES[profileName], name, scheduler))
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else float("nan")
+            for priority, className in enumerate(PRIORITY_NAMES):
+                if not queueMetrics.counts[priority]:
+                    continue
+                print(f"{profileName:>10}{name:>11}{className:>10}{queueMetrics.meanDelay(priority) * 1000:>16.1f}"
+                      f"{queueMetrics.maxDelays[priority] * 1000:>16.1f}{p50:>18.1f}{p99:>18.1f}{bulkTime:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
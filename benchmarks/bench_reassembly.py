@@ -0,0 +1,102 @@
+import random
+import time
+from queue import PriorityQueue
+from api.gnscontext import RecvingHUDPPacket
+from hudp import HUDPPacket
+from reassembly import ReassemblyBuffer
+
+PACKET_COUNT = 20000
+PAYLOAD_SIZE = 32
+REORDER_DISTANCES = [0, 8, 64]
+"""
+Maximum number of positions a packet may arrive late, 0 keeps them in order.
+"""
+DUPLICATE_RATE = 0.2
+"""
+Fraction of the packets that arrive twice, e.g. retransmitted after their ACK was lost.
+"""
+
+
+class QueuedPacket:
+    """
+    Stands in for the previous RecvingHUDPPacket, ordered by SEQ for the PriorityQueue.
+    """
+
+    __slots__ = ("packet",)
+
+    def __init__(self, packet: HUDPPacket):
+        self.packet = packet
+
+    def __lt__(self, other: "QueuedPacket"):
+        return self.packet.seq < other.packet.seq
+
+
+def arrivals(packets, reorderDistance: int):
+    """
+    Return 'packets' shuffled within 'reorderDistance' positions, with some of them duplicated.
+    """
+    keyed = [(i + random.uniform(0, reorderDistance), packet) for i, packet in enumerate(packets)]
+    keyed += [(i + random.uniform(0, reorderDistance * 4 + 1), packet) for i, packet in enumerate(packets)
+              if random.random() < DUPLICATE_RATE]
+    keyed.sort(key=lambda arrival: arrival[0])
+    return [packet for _, packet in keyed]
+
+
+def runPriorityQueue(arrived) -> float:
+    """
+    Previous 'recvWindow': pop every packet, put back the head on a gap and wait for the next arrival.
+    """
+    recvWindow = PriorityQueue()
+    ack = 0
+    delivered = 0
+    start = time.perf_counter()
+    for packet in arrived:
+        recvWindow.put(QueuedPacket(packet))
+        for _ in range(recvWindow.qsize()):
+            recvingPacket = recvWindow.get()
+            if recvingPacket.packet.seq < ack:
+                continue
+            elif recvingPacket.packet.seq > ack:
+                recvWindow.put(recvingPacket)
+                break
+            ack = recvingPacket.packet.calculateAck()
+            delivered += 1
+    elapsed = time.perf_counter() - start
+    assert delivered == PACKET_COUNT
+    return elapsed
+
+
+def runReassemblyBuffer(arrived) -> float:
+    reassembly = ReassemblyBuffer()
+    ack = 0
+    delivered = 0
+    start = time.perf_counter()
+    for packet in arrived:
+        if packet.seq != ack:
+            reassembly.insert(RecvingHUDPPacket(packet, None), ack)
+            continue
+        ack = packet.calculateAck()
+        delivered += 1
+        for recvingPacket in reassembly.popContiguous(ack):
+            ack = recvingPacket.packet.calculateAck()
+            delivered += 1
+    elapsed = time.perf_counter() - start
+    assert delivered == PACKET_COUNT
+    return elapsed
+
+
+def main():
+    packets = [HUDPPacket.create(i * PAYLOAD_SIZE, 0, bytes(PAYLOAD_SIZE), isReliable=True)
+               for i in range(PACKET_COUNT)]
+    print(f"{PACKET_COUNT} reliable packets, {DUPLICATE_RATE:.0%} of them duplicated")
+    print(f"{'Reorder distance':>17}{'PriorityQueue (us/pkt)':>25}{'Reassembly (us/pkt)':>22}{'Speedup':>10}")
+    for reorderDistance in REORDER_DISTANCES:
+        random.seed(reorderDistance)
+        arrived = arrivals(packets, reorderDistance)
+        queueTime = runPriorityQueue(arrived) / len(arrived) * 1e6
+        bufferTime = runReassemblyBuffer(arrived) / len(arrived) * 1e6
+        print(f"{reorderDistance:>17}{queueTime:>25.2f}{bufferTime:>22.2f}{queueTime / bufferTime:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
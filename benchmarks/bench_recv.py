@@ -0,0 +1,79 @@
+import multiprocessing
+import socket
+import time
+from api.gnsconnection import GNSConnection
+from batchrecv import DATAGRAM_RECEIVERS
+from hudp import HUDPPacket
+
+DURATION = 2.0
+PAYLOAD_SIZES = [32, 512]
+SENDER_PROCESSES = 2
+"""
+Processes flooding the receiver, so that the sender is not the bottleneck.
+"""
+
+
+def flood(addrPort, datagram: bytes, duration: float, sent):
+    """
+    Send 'datagram' to 'addrPort' as fast as possible for 'duration' seconds. Executed in its own process.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    count = 0
+    end = time.time() + duration
+    while time.time() < end:
+        for _ in range(100):
+            sock.sendto(datagram, addrPort)
+        count += 100
+    with sent.get_lock():
+        sent.value += count
+
+
+def run(receiverName: str, payloadSize: int):
+    """
+    Return the number of datagrams sent, the number of packets accepted into 'recvWindow' and the number of batches.
+    """
+    connection = GNSConnection()
+    connection.setEnableLogRecv(False)
+    connection.context.sock.bind(("127.0.0.1", 0))
+    receiver = DATAGRAM_RECEIVERS[receiverName]()
+    datagram = HUDPPacket.create(0, 0, bytes(payloadSize)).toBytes()
+
+    sent = multiprocessing.Value("q", 0)
+    senders = [multiprocessing.Process(target=flood, args=(connection.context.sock.getsockname(), datagram,
+                                                           DURATION, sent))
+               for _ in range(SENDER_PROCESSES)]
+    for sender in senders:
+        sender.start()
+
+    accepted = 0
+    batches = 0
+    while True:
+        try:
+            accepted += connection._receiveBatch(receiver.receive(connection.context.sock))
+        except socket.timeout:
+            if not any(sender.is_alive() for sender in senders):
+                break
+            continue
+        batches += 1
+        # Stand in for the routine thread, which takes the packets out of the window
+        with connection.context.recvWindow.mutex:
+            connection.context.recvWindow.queue.clear()
+
+    for sender in senders:
+        sender.join()
+    connection.context.sock.close()
+    return sent.value, accepted, batches
+
+
+def main():
+    print(f"Unreliable packets flooded over loopback by {SENDER_PROCESSES} processes for {DURATION:g} s")
+    print(f"{'Payload (B)':>12}{'Receiver':>10}{'Sent':>10}{'Received':>10}{'Dropped':>9}{'Kpps':>8}{'Batch':>7}")
+    for payloadSize in PAYLOAD_SIZES:
+        for receiverName in DATAGRAM_RECEIVERS:
+            sent, accepted, batches = run(receiverName, payloadSize)
+            print(f"{payloadSize:>12}{receiverName:>10}{sent:>10}{accepted:>10}{1 - accepted / sent:>9.1%}"
+                  f"{accepted / DURATION / 1000:>8.1f}{accepted / max(batches, 1):>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
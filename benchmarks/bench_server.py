@@ -0,0 +1,73 @@
+import time
+import tracemalloc
+from api.gnsserver import GameNetServer
+from hudp import HUDPPacket
+
+PEER_COUNTS = (1000, 10000)
+PAYLOAD = bytes(64)
+HANDSHAKE_TIME_LIMIT = 600.0
+
+
+def createServer() -> GameNetServer:
+    server = GameNetServer()
+    server.setEnableLogSend(False)
+    server.setEnableLogRecv(False)
+    server.setEnableLogMetrics(False)
+    server.setEnableLogInfo(False)
+    # Every peer is in its handshake at once, for longer than a remote normally takes under tracemalloc
+    server.setConnectionLimits(max(PEER_COUNTS), max(PEER_COUNTS), HANDSHAKE_TIME_LIMIT)
+    # Datagrams are injected with _dispatch() and the connections are driven with _step() from this thread
+    server.isListening = True
+    return server
+
+
+def handshake(server: GameNetServer, peers):
+    """
+    Complete the 3-way handshake of every peer, as if each of them had sent a SYN and then an ACK.
+    """
+    for addrPort in peers:
+        server._dispatch(HUDPPacket.create(0, 0, isReliable=True, isSyn=True).toBytes(), addrPort)
+    server._step(time.time())
+    for addrPort in peers:
+        server._dispatch(HUDPPacket.createPureAck(1, 1).toBytes(), addrPort)
+    server._step(time.time())
+
+
+def run(peerCount: int):
+    peers = [("127.0.0.1", 20000 + i) for i in range(peerCount)]
+
+    server = createServer()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    handshake(server, peers)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert server.acceptQueue.qsize() == peerCount
+    server.sock.close()
+
+    server = createServer()
+    start = time.perf_counter()
+    handshake(server, peers)
+    handshakeTime = time.perf_counter() - start
+
+    datagrams = [HUDPPacket.create(1, 1, PAYLOAD, isReliable=True, isAck=True).toBytes()] * peerCount
+    start = time.perf_counter()
+    for addrPort, datagram in zip(peers, datagrams):
+        server._dispatch(datagram, addrPort)
+    server._step(time.time())
+    dataTime = time.perf_counter() - start
+    server.sock.close()
+
+    print(f"{peerCount} peers:")
+    print(f"  Memory per connection: {(after - before) / peerCount / 1024:.1f} KiB")
+    print(f"  Handshake per connection: {handshakeTime / peerCount * 1e6:.1f} us")
+    print(f"  Reliable packet + ACK per connection: {dataTime / peerCount * 1e6:.1f} us")
+
+
+def main():
+    for peerCount in PEER_COUNTS:
+        run(peerCount)
+
+
+if __name__ == "__main__":
+    main()
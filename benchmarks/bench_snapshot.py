@@ -0,0 +1,118 @@
+import asyncio
+import itertools
+import random
+import struct
+from api.gnsasync import AsyncGameNetSocket
+from benchmarks.bench_coalescing import CountingLink
+from benchmarks.bench_congestion import PROFILES
+from common import SocketTimeoutException
+from snapshot import SnapshotEncoder
+
+TICK_COUNT = 90
+TICK_INTERVAL = 1 / 30
+ENTITY_COUNTS = [64, 256, 1024]
+ENTITY_STATE = struct.Struct("!6f")
+"""
+State of an entity: position and velocity.
+"""
+MOVING_RATE = 0.2
+"""
+Fraction of the entities whose state changes at every tick.
+"""
+SPAWN_RATE = 0.01
+"""
+Fraction of the entities that despawn and are replaced by a new entity at every tick.
+"""
+TICK_ENTITY = (1 << 32) - 1
+"""
+Entity holding the tick number, so that the receiver can check every snapshot against the one sent.
+"""
+
+
+def simulate(entityCount: int):
+    """
+    Return the snapshot of every tick of a world where some entities move and a few respawn.
+    """
+    entities = {entityId: ENTITY_STATE.pack(*(random.uniform(-100, 100) for _ in range(6)))
+                for entityId in range(entityCount)}
+    nextEntityId = entityCount
+    snapshots = []
+    for tick in range(TICK_COUNT):
+        for entityId in random.sample(list(entities), int(entityCount * MOVING_RATE)):
+            entities[entityId] = ENTITY_STATE.pack(*(random.uniform(-100, 100) for _ in range(6)))
+        for entityId in random.sample(list(entities), int(entityCount * SPAWN_RATE)):
+            del entities[entityId]
+            entities[nextEntityId] = ENTITY_STATE.pack(*(random.uniform(-100, 100) for _ in range(6)))
+            nextEntityId += 1
+        snapshot = dict(entities)
+        snapshot[TICK_ENTITY] = tick.to_bytes(4, "big")
+        snapshots.append(snapshot)
+    return snapshots
+
+
+async def run(port: int, snapshots, isDelta: bool):
+    serverAddrPort, clientAddrPort, linkAddrPort = [("127.0.0.1", port + i) for i in range(3)]
+    loop = asyncio.get_running_loop()
+    link = CountingLink(clientAddrPort, serverAddrPort, *PROFILES["low_loss"])
+    linkTransport, _ = await loop.create_datagram_endpoint(lambda: link, local_addr=linkAddrPort)
+
+    sockets = []
+    for addrPort in (serverAddrPort, clientAddrPort):
+        sock = AsyncGameNetSocket()
+        for setEnable in (sock.setEnableLogSend, sock.setEnableLogRecv, sock.setEnableLogMetrics,
+                          sock.setEnableLogInfo):
+            setEnable(False)
+        sock.bind(addrPort)
+        sockets.append(sock)
+    server, client = sockets
+    if not isDelta:
+        # Without baselines every snapshot is encoded in full
+        client.context.snapshotEncoder = SnapshotEncoder(historySize=0)
+
+    await server.listen()
+    accepting = asyncio.ensure_future(server.accept())
+    await client.connect(linkAddrPort)
+    await accepting
+
+    async def produce():
+        for snapshot in snapshots:
+            client.sendSnapshot(snapshot)
+            await asyncio.sleep(TICK_INTERVAL)
+
+    producing = asyncio.ensure_future(produce())
+    bytesBefore = link.bytesByClient
+    received = 0
+    try:
+        while True:
+            snapshot = await server.recvSnapshot(timeout=0.5)
+            assert snapshot == snapshots[int.from_bytes(snapshot[TICK_ENTITY], "big")]
+            received += 1
+    except SocketTimeoutException:
+        pass
+    await producing
+
+    for sock in sockets:
+        sock.transport.close()
+    linkTransport.close()
+    return received, link.bytesByClient - bytesBefore
+
+
+def main():
+    print(f"{TICK_COUNT} snapshots at {1 / TICK_INTERVAL:.0f} Hz, entities of {ENTITY_STATE.size} B, "
+          f"{MOVING_RATE:.0%} of them changing and {SPAWN_RATE:.0%} respawning per tick, low_loss profile")
+    print(f"{'Entities':>9}{'Encoding':>10}{'Delivered':>11}{'Bytes/tick':>12}{'Saved':>8}")
+    ports = itertools.count(44000, 10)
+    for entityCount in ENTITY_COUNTS:
+        random.seed(entityCount)
+        snapshots = simulate(entityCount)
+        fullBytes = None
+        for isDelta in (False, True):
+            received, wireBytes = asyncio.run(run(next(ports), snapshots, isDelta))
+            bytesPerTick = wireBytes / TICK_COUNT
+            fullBytes = fullBytes or bytesPerTick
+            print(f"{entityCount:>9}{'delta' if isDelta else 'full':>10}{received / TICK_COUNT:>11.1%}"
+                  f"{bytesPerTick:>12.0f}{1 - bytesPerTick / fullBytes:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import asyncio
+import itertools
+import random
+import statistics
+import struct
+import time
+from api.gnsasync import AsyncGameNetSocket
+from benchmarks.bench_congestion import EmulatedLink, PROFILES
+from common import SocketTimeoutException
+
+TICK_COUNT = 300
+TICK_INTERVAL = 1 / 60
+COMMAND = struct.Struct("!Id")
+"""
+Game command sent reliably at every tick: its tick number and the time it was sent at.
+"""
+CHUNK_SIZE = 1000
+"""
+Size of the chunk of a bulk transfer, e.g. of a map or asset, sent reliably at every tick alongside the command.
+"""
+COMMAND_STREAM = 1
+BULK_STREAM = 2
+
+
+async def run(port: int, profile, isMultiStream: bool):
+    """
+    Return the latencies in seconds of the commands received, from send() to recv().
+    """
+    serverAddrPort, clientAddrPort, linkAddrPort = [("127.0.0.1", port + i) for i in range(3)]
+    loop = asyncio.get_running_loop()
+    link = EmulatedLink(clientAddrPort, serverAddrPort, *profile)
+    linkTransport, _ = await loop.create_datagram_endpoint(lambda: link, local_addr=linkAddrPort)
+
+    sockets = []
+    for addrPort in (serverAddrPort, clientAddrPort):
+        sock = AsyncGameNetSocket()
+        for setEnable in (sock.setEnableLogSend, sock.setEnableLogRecv, sock.setEnableLogMetrics,
+                          sock.setEnableLogInfo):
+            setEnable(False)
+        sock.bind(addrPort)
+        sockets.append(sock)
+    server, client = sockets
+
+    await server.listen()
+    accepting = asyncio.ensure_future(server.accept())
+    await client.connect(linkAddrPort)
+    await accepting
+
+    commandStream, bulkStream = (COMMAND_STREAM, BULK_STREAM) if isMultiStream else (0, 0)
+
+    async def produce():
+        chunk = bytes(CHUNK_SIZE)
+        for tick in range(TICK_COUNT):
+            client.send(chunk, True, bulkStream)
+            client.send(COMMAND.pack(tick, time.perf_counter()), True, commandStream)
+            await asyncio.sleep(TICK_INTERVAL)
+
+    producing = asyncio.ensure_future(produce())
+    latencies = []
+    try:
+        while len(latencies) < TICK_COUNT:
+            data = await server.recv(timeout=2.0)
+            if len(data) == COMMAND.size:
+                _, sentAt = COMMAND.unpack(data)
+                latencies.append(time.perf_counter() - sentAt)
+    except SocketTimeoutException:
+        pass
+    await producing
+
+    for sock in sockets:
+        sock.transport.close()
+    linkTransport.close()
+    return latencies
+
+
+def main():
+    print(f"{TICK_COUNT} ticks at {1 / TICK_INTERVAL:.0f} Hz, each sending a reliable command and a "
+          f"{CHUNK_SIZE} B reliable chunk of a bulk transfer")
+    print(f"{'Profile':>10}{'Streams':>9}{'Commands':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'Max (ms)':>10}")
+    ports = itertools.count(45000, 10)
+    for profileName in ("low_loss", "high_loss"):
+        for isMultiStream in (False, True):
+            random.seed(0)
+            latencies = sorted(asyncio.run(run(next(ports), PROFILES[profileName], isMultiStream)))
+            if not latencies:
+                print(f"{profileName:>10}{'2' if isMultiStream else '1':>9}{0:>10}")
+                continue
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{profileName:>10}{'2' if isMultiStream else '1':>9}{len(latencies):>10}"
+                  f"{statistics.median(latencies) * 1000:>10.1f}{p99 * 1000:>10.1f}{latencies[-1] * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import random
+import struct
+import threading
+import time
+from typing import Dict, List, Tuple
+from api.gns import GameNetSocket
+from common import SocketTimeoutException
+from metrics import LogHistogram
+
+DURATION = 2.0
+"""
+Seconds of sending per run.
+"""
+BASE_POINT = (256, 2000, 0.5)
+"""
+Message size in bytes, messages per second and fraction of reliable messages, from which each parameter is swept.
+"""
+SIZES = [64, 256, 1024]
+RATES = [500, 2000, 8000, 32000]
+RELIABLE_FRACTIONS = [0.0, 0.5, 1.0]
+MESSAGE = struct.Struct("!HId")
+"""
+Start of every message: the run it belongs to, its index and the time it was sent at, the rest is padding.
+"""
+DRAIN_TIMEOUT = 0.5
+"""
+How long the receiver waits for more messages once all were sent, before counting the rest as lost.
+"""
+RUN_TIMEOUT = 30.0
+PORT = 47100
+
+
+def sweep() -> List[Tuple[int, int, float]]:
+    """
+    Return the runs: the base point, and each parameter swept in turn while the others stay at the base point.
+    """
+    size, rate, fraction = BASE_POINT
+    points = [(sweptSize, rate, fraction) for sweptSize in SIZES]
+    points += [(size, sweptRate, fraction) for sweptRate in RATES]
+    points += [(size, rate, sweptFraction) for sweptFraction in RELIABLE_FRACTIONS]
+    return list(dict.fromkeys([BASE_POINT] + points))
+
+
+def runName(size: int, rate: int, fraction: float) -> str:
+    return f"{size}B/{rate}pps/{fraction:.0%}rel"
+
+
+def connect(port: int) -> Tuple[GameNetSocket, GameNetSocket]:
+    """
+    Return a server and a client socket connected over loopback, with logging off.
+    """
+    sockets = []
+    for addrPort in (("127.0.0.1", port), ("127.0.0.1", port + 1)):
+        sock = GameNetSocket()
+        for setEnable in (sock.setEnableLogSend, sock.setEnableLogRecv, sock.setEnableLogMetrics,
+                          sock.setEnableLogInfo):
+            setEnable(False)
+        sock.bind(addrPort)
+        sockets.append(sock)
+    server, client = sockets
+    server.listen()
+    accepting = threading.Thread(target=server.accept)
+    accepting.start()
+    client.connect(("127.0.0.1", port))
+    accepting.join()
+    return server, client
+
+
+def run(server: GameNetSocket, client: GameNetSocket, runId: int, size: int, rate: int, fraction: float,
+        duration: float) -> Dict[str, float]:
+    """
+    Send messages of 'size' bytes at 'rate' per second for 'duration' seconds, 'fraction' of them reliable,
+    and return what the receiver saw: messages and megabits per second delivered, delivery ratio, latency
+    percentiles in milliseconds and CPU time of the process in microseconds per message delivered.
+    """
+    total = int(rate * duration)
+    generator = random.Random(runId)
+    isReliable = [generator.random() < fraction for _ in range(total)]
+    padding = bytes(size - MESSAGE.size)
+    latencies = LogHistogram()
+    received = [0, 0.0]
+    """
+    Messages of this run received, and the time the last one was received at.
+    """
+    sending = threading.Event()
+
+    def receive():
+        deadline = time.perf_counter() + RUN_TIMEOUT
+        while received[0] < total and time.perf_counter() < deadline:
+            try:
+                data = server.recv(timeout=DRAIN_TIMEOUT)
+            except SocketTimeoutException:
+                if not sending.is_set():
+                    break
+                continue
+            messageRun, _, sentAt = MESSAGE.unpack_from(data)
+            # Late messages of a previous run are left out
+            if messageRun != runId:
+                continue
+            now = time.perf_counter()
+            latencies.add(now - sentAt)
+            received[0] += 1
+            received[1] = now
+
+    receiver = threading.Thread(target=receive)
+    sending.set()
+    receiver.start()
+    cpuStart = time.process_time()
+    start = time.perf_counter()
+    for index in range(total):
+        sendAt = start + index / rate
+        delay = sendAt - time.perf_counter()
+        if delay > 0.001:
+            time.sleep(delay)
+        client.send(MESSAGE.pack(runId, index, time.perf_counter()) + padding, isReliable[index])
+    sending.clear()
+    receiver.join()
+    cpu = time.process_time() - cpuStart
+
+    count, lastTime = received
+    elapsed = max(lastTime - start, duration) if count else duration
+    return {
+        "pps": count / elapsed,
+        "mbps": count * size * 8 / elapsed / 1e6,
+        "delivery": count / total,
+        "p50": latencies.percentile(50) * 1e3,
+        "p99": latencies.percentile(99) * 1e3,
+        "p999": latencies.percentile(99.9) * 1e3,
+        "cpu": cpu / count * 1e6 if count else 0.0,
+    }
+
+
+def runThroughput(duration: float = DURATION, port: int = PORT) -> Dict[str, Dict[str, float]]:
+    """
+    Return the results of every run of the sweep over one connection, keyed by run name.
+    """
+    server, client = connect(port)
+    results = {}
+    for runId, (size, rate, fraction) in enumerate(sweep()):
+        results[runName(size, rate, fraction)] = run(server, client, runId, size, rate, fraction, duration)
+    client.close()
+    server.close()
+    return results
+
+
+def main():
+    print(f"Messages sent over loopback for {DURATION:g} s per run, payload includes a {MESSAGE.size} B header, "
+          f"CPU of both sockets per message delivered")
+    print(f"{'Run':<24}{'Msg/s':>9}{'Mbps':>8}{'Delivered':>11}{'p50 (ms)':>10}{'p99 (ms)':>10}{'p99.9 (ms)':>12}"
+          f"{'CPU (us)':>10}")
+    for name, result in runThroughput().items():
+        print(f"{name:<24}{result['pps']:>9.0f}{result['mbps']:>8.2f}{result['delivery']:>11.1%}{result['p50']:>10.2f}"
+              f"{result['p99']:>10.2f}{result['p999']:>12.2f}{result['cpu']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import random
+import time
+from queue import PriorityQueue
+from common import RETRY_INCREMENT
+from timingwheel import TimingWheel
+
+OUTSTANDING_COUNTS = [1000, 4096, 16384]
+START_TIME = 1000.0
+STEP = 0.001
+DURATION = 1.0
+
+
+class Timer:
+    """
+    Stands in for SendingHUDPPacket, ordered by 'retryAt' for the PriorityQueue.
+    """
+
+    __slots__ = ("retryAt",)
+
+    def __init__(self, retryAt: float):
+        self.retryAt = retryAt
+
+    def __lt__(self, other: "Timer"):
+        return self.retryAt < other.retryAt
+
+
+def runPriorityQueue(timers) -> float:
+    """
+    Previous 'sendBuffer': pop every packet that timed out, put back the first one that did not.
+    """
+    sendBuffer = PriorityQueue()
+    start = time.perf_counter()
+    for timer in timers:
+        sendBuffer.put(timer)
+    currentTime = START_TIME
+    while currentTime < START_TIME + DURATION:
+        expired = []
+        while True:
+            timer = sendBuffer.get_nowait()
+            if timer.retryAt > currentTime:
+                sendBuffer.put(timer)
+                break
+            expired.append(timer)
+        for timer in expired:
+            timer.retryAt += RETRY_INCREMENT
+            sendBuffer.put(timer)
+        currentTime += STEP
+    return time.perf_counter() - start
+
+
+def runTimingWheel(timers) -> float:
+    sendBuffer = TimingWheel(currentTime=START_TIME)
+    start = time.perf_counter()
+    for timer in timers:
+        sendBuffer.schedule(timer, timer.retryAt)
+    currentTime = START_TIME
+    while currentTime < START_TIME + DURATION:
+        for timer in sendBuffer.expire(currentTime):
+            timer.retryAt += RETRY_INCREMENT
+            sendBuffer.schedule(timer, timer.retryAt)
+        currentTime += STEP
+    return time.perf_counter() - start
+
+
+def runCancel(count: int) -> float:
+    """
+    Return the time in microseconds to cancel one timer of the wheel, e.g. once its packet is ACKed.
+    """
+    sendBuffer = TimingWheel(currentTime=START_TIME)
+    timers = [Timer(START_TIME + random.random()) for _ in range(count)]
+    for timer in timers:
+        sendBuffer.schedule(timer, timer.retryAt)
+    start = time.perf_counter()
+    for timer in timers:
+        sendBuffer.cancel(timer)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    steps = round(DURATION / STEP)
+    print(f"Every packet is retransmitted each {RETRY_INCREMENT * 1000:.0f} ms, "
+          f"the sending loop runs every {STEP * 1000:.0f} ms for {DURATION:.0f} s")
+    print(f"{'Outstanding':>12}{'PriorityQueue (us/loop)':>26}{'TimingWheel (us/loop)':>24}"
+          f"{'Speedup':>10}{'Cancel (us)':>14}")
+    for count in OUTSTANDING_COUNTS:
+        random.seed(count)
+        retryAts = [START_TIME + random.random() * RETRY_INCREMENT for _ in range(count)]
+        queueTime = runPriorityQueue([Timer(retryAt) for retryAt in retryAts]) / steps * 1e6
+        wheelTime = runTimingWheel([Timer(retryAt) for retryAt in retryAts]) / steps * 1e6
+        print(f"{count:>12}{queueTime:>26.1f}{wheelTime:>24.1f}{queueTime / wheelTime:>9.1f}x"
+              f"{runCancel(count):>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
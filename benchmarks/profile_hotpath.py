@@ -0,0 +1,62 @@
+import json
+import sys
+import time
+from benchmarks.bench_throughput import connect
+from common import SocketTimeoutException
+from stageprofiler import PROFILER, StageProfiler
+
+MESSAGES = 20000
+SIZE = 200
+RELIABLE_EVERY = 2
+"""
+Loopback run profiled when no profile file is given: messages sent, their size, and one in how many is reliable.
+"""
+PORT = 47000
+
+
+def profileWorkload(port: int = PORT) -> StageProfiler:
+    """
+    Send MESSAGES messages between two GameNetSockets over loopback with the profiler on, and return the profiler.
+    """
+    server, client = connect(port)
+    PROFILER.reset()
+    PROFILER.enable()
+    payload = bytes(SIZE)
+    for index in range(MESSAGES):
+        client.send(payload, index % RELIABLE_EVERY == 0)
+        if index % 100 == 99:
+            # Paced a little, so that the unreliable messages are not dropped by the UDP buffers
+            time.sleep(0.001)
+    received = 0
+    try:
+        while received < MESSAGES:
+            server.recv(timeout=1.0)
+            received += 1
+    except SocketTimeoutException:
+        pass
+    PROFILER.disable()
+
+    client.close()
+    server.close()
+    return PROFILER
+
+
+def main():
+    """
+    Print the report of a profile saved through stageprofiler.PROFILE_OUTPUT_ENV, or of a loopback run if none
+    is given.
+    """
+    if len(sys.argv) > 2:
+        print("Usage: python3 -m benchmarks.profile_hotpath [profile file]", file=sys.stderr)
+        sys.exit(2)
+    if len(sys.argv) == 2:
+        with open(sys.argv[1]) as file:
+            profiler = StageProfiler.fromDict(json.load(file))
+    else:
+        print(f"{MESSAGES} messages of {SIZE} B over loopback, one in {RELIABLE_EVERY} reliable")
+        profiler = profileWorkload()
+    print(profiler.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import platform
+import sys
+from typing import Dict, List
+from benchmarks.bench_codec import runCodec
+from benchmarks.bench_throughput import DURATION, runThroughput
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+METRICS = {
+    "us": ("us", False, 0.20, 0.05),
+    "pps": ("msg/s", True, 0.05, 0.0),
+    "mbps": ("Mbps", True, 0.05, 0.0),
+    "delivery": ("delivered", True, 0.01, 0.0),
+    "p50": ("p50 ms", False, 0.50, 0.5),
+    "p99": ("p99 ms", False, 1.00, 5.0),
+    "p999": ("p99.9 ms", False, 2.00, 20.0),
+    "cpu": ("CPU us", False, 0.30, 10.0),
+}
+"""
+Metrics of the results by key: unit, whether higher is better, and the relative change and the absolute difference
+a result must both be worse than the baseline by to be a regression. Latencies over loopback are fractions of
+a millisecond whose tails jump by a few milliseconds whenever a thread is descheduled, hence their absolute slack.
+"""
+QUICK_DURATION = 0.5
+
+
+def environment() -> Dict[str, str]:
+    """
+    Return what the results depend on besides the code, stored with the baseline.
+    """
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "system": platform.system(), "processor": platform.processor(),
+            "cpus": str(os.cpu_count())}
+
+
+def runSuite(groups: List[str], duration: float) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Return the results of the groups of benchmarks, keyed by group, then benchmark, then metric.
+    """
+    results = {}
+    if "codec" in groups:
+        results["codec"] = {name: {"us": value} for name, value in runCodec().items()}
+    if "throughput" in groups:
+        results["throughput"] = runThroughput(duration)
+    return results
+
+
+def compare(results: dict, baseline: dict) -> int:
+    """
+    Print every result next to its baseline and return the number of regressions.
+    """
+    regressions = 0
+    for group, benchmarks in results.items():
+        print(f"\n[{group}]")
+        print(f"{'Benchmark':<26}{'Metric':>10}{'Result':>12}{'Baseline':>12}{'Change':>9}")
+        for name, metrics in benchmarks.items():
+            for key, value in metrics.items():
+                unit, higherIsBetter, tolerance, slack = METRICS[key]
+                expected = baseline.get(group, {}).get(name, {}).get(key)
+                if expected is None:
+                    print(f"{name:<26}{unit:>10}{value:>12.2f}{'-':>12}")
+                    continue
+                change = (value - expected) / expected if expected else 0.0
+                worsening = expected - value if higherIsBetter else value - expected
+                isRegression = worsening > slack and worsening > tolerance * abs(expected)
+                regressions += isRegression
+                print(f"{name:<26}{unit:>10}{value:>12.2f}{expected:>12.2f}{change:>+9.1%}"
+                      f"{'  REGRESSION' if isRegression else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks.suite",
+                                     description="Codec, state machine and loopback throughput benchmarks, "
+                                                 "compared against a stored baseline.")
+    parser.add_argument("--only", choices=["codec", "throughput"], help="run a single group of benchmarks")
+    parser.add_argument("--quick", action="store_true",
+                        help=f"send for {QUICK_DURATION:g} s per throughput run instead of {DURATION:g} s")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+    args = parser.parse_args()
+
+    groups = [args.only] if args.only else ["codec", "throughput"]
+    results = runSuite(groups, QUICK_DURATION if args.quick else DURATION)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    if baseline.get("environment", environment()) != environment():
+        print(f"Warning: the baseline was measured on another environment: {baseline['environment']}")
+    regressions = compare(results, baseline.get("results", {}))
+
+    if args.save:
+        # Groups that were not run keep their previous baseline
+        stored = dict(baseline.get("results", {}), **results)
+        with open(args.baseline, "w") as file:
+            json.dump({"environment": environment(), "results": stored}, file, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\nRegressions against {args.baseline}: {regressions}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
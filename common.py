@@ -3,12 +3,33 @@ from typing import Tuple
 CLIENT_PORT = 50000
 FORWARDER_PORT = 55000
 SERVER_PORT = 60000
+STATS_PORT = 9150
+"""
+Port number of the local HTTP endpoint serving the stats of sockets, see statsexport.StatsExporter
+"""
 
 MAX_SEND_WINDOW_SIZE = 4096
 """
 Maximum number of packets that can be sent at the same time
 """
 
+MAX_DATAGRAM_SIZE = 65507
+"""
+Largest UDP payload, and thus HUDP packet, that can be sent or received
+"""
+
+RECV_BATCH_SIZE = 16
+"""
+Maximum number of datagrams taken out of the UDP socket at once by a receiving thread
+"""
+
+RECV_SLOT_SIZE = 2048
+"""
+Bytes each datagram of a batch is received into, above FRAGMENT_MTU and COALESCING_MTU. A receiver drops a datagram
+that fills its slot, e.g. a large keyed update or a message sent without fragmentation, and grows its slots to
+MAX_DATAGRAM_SIZE
+"""
+
 MAX_RETRY = 10
 """
 Maximum number of times a packet get (re)transmitted
@@ -16,12 +37,23 @@ Maximum number of times a packet get (re)transmitted
 
 SKIP_AHEAD_TIMEOUT = 1.000
 """
-How long does it take to skip the current ACK if the socket is stuck there
+How long does it take to skip the current ACK, or the gap of a stream, if the socket is stuck there
 """
 
 RETRY_INCREMENT = 0.100
 """
-The time offset to retransmit this packet
+The time offset to retransmit this packet, until the RTO is estimated from the first RTT sample
+"""
+
+MIN_RTO = 0.020
+"""
+Lower bound of the estimated retransmission timeout
+"""
+
+MAX_RTO = 2.000
+"""
+Upper bound of the retransmission timeout, including the exponential backoff of a packet.
+Kept above the RTT of WAN and mobile paths, independently of SKIP_AHEAD_TIMEOUT
 """
 
 TIME_WAIT_TIME = 1.000
@@ -29,9 +61,200 @@ TIME_WAIT_TIME = 1.000
 The amount of time to wait for in TIME_WAIT
 """
 
+HANDSHAKE_TIMEOUT = 5.000
+"""
+How long a connection of GameNetServer may take to complete its 3-way handshake before it is dropped
+"""
+
+MAX_PENDING_CONNECTIONS = 1024
+"""
+Maximum number of connections of GameNetServer in their 3-way handshake at once. Further SYNs are dropped
+"""
+
+MAX_CONNECTIONS = 8192
+"""
+Maximum number of connections of GameNetServer at once, pending ones included. Further SYNs are dropped
+"""
+
+TIMER_RESOLUTION = 0.010
+"""
+Length of a tick of the retransmission timing wheel, i.e. how late a retransmission may be
+"""
+
+TIMER_SLOTS = 512
+"""
+Number of slots of the retransmission timing wheel. Timers further than one rotation away share slots
+"""
+
+CONGESTION_MSS = 1200
+"""
+Segment size in bytes that congestion windows are counted in
+"""
+
+INITIAL_CWND = 10 * CONGESTION_MSS
+"""
+Congestion window in bytes at the start of a connection, from RFC 6928
+"""
+
+MIN_CWND = 2 * CONGESTION_MSS
+"""
+Smallest congestion window in bytes after a loss
+"""
+
+PACING_BURST = 4 * CONGESTION_MSS
+"""
+Number of bytes the pacer lets through back-to-back
+"""
+
+COALESCING_MTU = 1200
+"""
+Default size in bytes, header included, of the packets that small messages are coalesced into
+"""
+
+FRAGMENT_MTU = 1200
+"""
+Default size in bytes, header included, of the packets that messages too large for a single one are fragmented into
+"""
+
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+"""
+Largest message in bytes that can be sent in fragments. The receiver drops fragments of larger messages
+"""
+
+FRAGMENT_TIMEOUT = 2.000
+"""
+Time an incomplete message is kept after its latest fragment arrived, before its fragments are dropped
+"""
+
+MAX_PARTIAL_MESSAGES = 64
+"""
+Number of incomplete messages kept per connection, beyond which the one updated least recently is dropped
+"""
+
+SNAPSHOT_HISTORY = 32
+"""
+Number of the latest snapshots kept by each side as baselines for delta encoding
+"""
+
+COMPRESSION_LEVEL = 6
+"""
+zlib level of compressed payloads, from 1 (fastest) to 9 (smallest)
+"""
+
+COMPRESSION_MIN_SIZE = 64
+"""
+Size in bytes below which payloads are sent uncompressed
+"""
+
+COMPRESSION_MIN_SAVING = 0.10
+"""
+Fraction of its size a payload must shrink by to be sent compressed
+"""
+
+ACK_EVERY = 1
+"""
+Default number of reliable data packets received after which an ACK is sent without waiting for 'ACK_DELAY'
+"""
+
+ACK_DELAY = 0.000
+"""
+Default time an ACK may wait to ride on an outgoing data packet before it is sent as a pure ACK
+"""
+
+DEFAULT_CONGESTION_CONTROL = "none"
+"""
+Name of the congestion control algorithm of new sockets, see congestion.CONGESTION_CONTROLS. None by default,
+so that sockets send as they did before congestion control was added unless they opt in
+"""
+
+PRIORITY_CRITICAL = 0
+"""
+Priority class of time-critical messages, e.g. player input
+"""
+
+PRIORITY_REALTIME = 1
+"""
+Priority class of regular game traffic, the default of send()
+"""
+
+PRIORITY_BULK = 2
+"""
+Priority class of transfers that can wait, e.g. assets or chat history
+"""
+
+PRIORITY_NAMES = ("critical", "realtime", "bulk")
+"""
+Name of each priority class, indexed by class
+"""
+
+PRIORITY_WEIGHTS = (8, 4, 1)
+"""
+Share of the sending rate of each priority class under weighted fair queuing, indexed by class
+"""
+
+DEFAULT_SCHEDULER = "strict"
+"""
+Name of the scheduler of new sockets, see scheduler.SCHEDULERS
+"""
+
+MAX_STREAMS = 1 << 16
+"""
+Number of streams of a connection. Stream IDs go from 0 to MAX_STREAMS - 1, and stream 0 is the default one
+"""
+
+CHANNEL_RELIABLE = 0
+CHANNEL_UNRELIABLE = 1
+CHANNEL_CONTROL = 2
+CHANNEL_NAMES = ("reliable", "unreliable", "control")
+"""
+Name of each channel packets are counted on in the stats, indexed by channel. Control packets carry no data,
+e.g. pure ACKs, SYN and FIN
+"""
+
+THROUGHPUT_WINDOW = 1.000
+"""
+Length of the sliding window the current throughput of a connection is measured over
+"""
+
+THROUGHPUT_SLOTS = 10
+"""
+Number of slots the throughput window is cut into. The window moves forward by one slot at a time
+"""
+
+LOG_RING_SIZE = 1024
+"""
+Number of events the log of a connection holds until the log writer thread drains it. Further events are dropped
+"""
+
+LOG_FLUSH_INTERVAL = 0.050
+"""
+How often the log writer thread drains the logs of every connection
+"""
+
+LOG_RENDER_HISTORY = 1 << 16
+"""
+Number of SEQ and packets remembered per connection when rendering the log, to take RTT samples and tag duplicates
+"""
+
+PROFILE_SAMPLE_EVERY = 16
+"""
+Number of calls of a hot path stage per call timed by the profiler, see stageprofiler.StageProfiler
+"""
+
 AddrPort = Tuple[str, int]
 
 
+class StreamMessage(bytes):
+    """
+    Data received from remote, as returned by recv(), with the ID of the stream it was sent on in 'stream'.
+    """
+
+    def __new__(cls, data: bytes, stream: int = 0):
+        message = super().__new__(cls, data)
+        message.stream = stream
+        return message
+
+
 class IllegalStateChangeException(Exception):
     def __init__(self, message: str):
         self.message = message
@@ -0,0 +1,96 @@
+from typing import Optional
+import zlib
+
+from common import COMPRESSION_LEVEL, COMPRESSION_MIN_SIZE, COMPRESSION_MIN_SAVING, FRAGMENT_MTU, MAX_DATAGRAM_SIZE
+
+MAX_WINDOW_BITS = 15
+"""
+Largest deflate window, 32 KiB. Payloads are decompressed with it, whatever window they were compressed with.
+"""
+
+MIN_WINDOW_BITS = 9
+"""
+Smallest deflate window of raw streams, 512 bytes.
+"""
+
+MEM_LEVEL = 4
+"""
+Memory level of the compression streams. Copying the template stream for every payload dominates the cost of
+compressing a small payload, and the default level 8 makes that copy 4 times larger for no gain on short payloads.
+"""
+
+
+class PayloadCompressor:
+    """
+    Compresses the payload of each packet on its own with zlib, primed with a preset dictionary shared by both hosts.
+
+    Game payloads are small and repetitive, e.g. the same field names in every message, so a dictionary of typical
+    payloads lets even a single packet refer back to them. Each packet is compressed independently so that losing
+    one does not prevent decompressing the next. The dictionary is loaded once into a template stream, which is
+    copied for every packet instead of priming a new stream each time. The window of the stream is only as large
+    as needed to cover the dictionary and a packet, since a smaller stream is cheaper to copy.
+    Streams are raw deflate: the zlib header and trailer would add 6 bytes to every packet,
+    and packets are already protected by their checksum.
+
+    Payloads smaller than 'minSize' bytes, or that do not shrink by at least 'minSaving' of their size,
+    are sent uncompressed.
+    """
+
+    def __init__(self, dictionary: bytes = b"", level: int = COMPRESSION_LEVEL, minSize: int = COMPRESSION_MIN_SIZE,
+                 minSaving: float = COMPRESSION_MIN_SAVING):
+        self.dictionary = dictionary
+        """
+        Preset dictionary, typically a concatenation of representative payloads. May be empty.
+        """
+
+        self.dictionaryId = zlib.adler32(dictionary)
+        """
+        Adler-32 of the dictionary, sent in the SYN so that remote only accepts compression with the same one.
+        """
+
+        self.minSize = minSize
+        """
+        Size in bytes below which payloads are not compressed.
+        """
+
+        self.minSaving = minSaving
+        """
+        Fraction of its size a payload must shrink by to be sent compressed.
+        """
+
+        options = {"zdict": dictionary} if dictionary else {}
+        # Large enough for a packet to refer back to the whole dictionary
+        windowBits = min(MAX_WINDOW_BITS, max(MIN_WINDOW_BITS, (len(dictionary) + FRAGMENT_MTU - 1).bit_length()))
+        self.template = zlib.compressobj(level, zlib.DEFLATED, -windowBits, MEM_LEVEL, **options)
+        """
+        Compression stream primed with the dictionary, copied for every payload.
+        """
+
+        self.decompressOptions = options
+        """
+        Arguments of the decompression stream of every payload.
+        """
+
+    def compress(self, data: bytes) -> Optional[bytes]:
+        """
+        Return the compressed payload, or None if it is too small or does not compress well enough.
+        """
+        if len(data) < self.minSize:
+            return None
+        stream = self.template.copy()
+        compressed = stream.compress(data) + stream.flush()
+        if len(compressed) > len(data) * (1 - self.minSaving):
+            return None
+        return compressed
+
+    def decompress(self, data: bytes) -> bytes:
+        """
+        Return the original payload. Raise zlib.error if the data is not a complete raw deflate stream, or if it would
+        expand beyond the size of a datagram. Raw streams carry no checksum, so a payload compressed with another
+        dictionary is not always detected: both hosts check the dictionary ID during the handshake instead.
+        """
+        stream = zlib.decompressobj(-MAX_WINDOW_BITS, **self.decompressOptions)
+        payload = stream.decompress(data, MAX_DATAGRAM_SIZE)
+        if not stream.eof:
+            raise zlib.error("Truncated or oversized payload")
+        return payload
@@ -0,0 +1,261 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from common import CONGESTION_MSS, INITIAL_CWND, MIN_CWND, PACING_BURST
+
+
+class CongestionControl(ABC):
+    """
+    Interface for the algorithm that decides how many bytes of reliable data may be in flight, i.e. sent
+    but not ACKed yet. It is driven by ACKs advancing and by reliable packets timing out.
+
+    Since every packet has its own retransmission timer, many packets may time out for the same congestion
+    event. Only the first loss is reported to the algorithm until the ACK passes 'recoveryPoint', the end of
+    the data in flight when that loss was detected, as in NewReno's fast recovery.
+    """
+
+    name: str = ""
+
+    def __init__(self):
+        self.cwnd: float = INITIAL_CWND
+        """
+        Congestion window in bytes.
+        """
+
+        self.ssthresh: float = float("inf")
+        """
+        Slow start threshold in bytes. The window grows exponentially below it and slowly above it.
+        """
+
+        self.recoveryPoint: Optional[int] = None
+        """
+        SEQ that the ACK must reach to end the current loss recovery, None if not recovering.
+        """
+
+    def canSend(self, bytesInFlight: int, size: int) -> bool:
+        """
+        Return True if a packet of 'size' bytes may be sent with 'bytesInFlight' bytes already in flight.
+        A packet is always allowed when nothing is in flight, so that a packet larger than the window is sent.
+        """
+        return bytesInFlight == 0 or bytesInFlight + size <= self.cwnd
+
+    def pacingGain(self) -> float:
+        """
+        Return the factor applied to cwnd / SRTT to get the pacing rate.
+        """
+        return 2.0 if self.cwnd < self.ssthresh else 1.25
+
+    def onAck(self, ack: int, ackedBytes: int, srtt: Optional[float], currentTime: float):
+        """
+        Called when the ACK from remote advances to 'ack', newly acknowledging 'ackedBytes' bytes.
+        """
+        if self.recoveryPoint is not None:
+            if ack < self.recoveryPoint:
+                return
+            self.recoveryPoint = None
+        self._increase(ackedBytes, srtt, currentTime)
+
+    def onLoss(self, sentSeq: int, currentTime: float):
+        """
+        Called when a reliable packet times out and is retransmitted. 'sentSeq' is the end of the data in flight.
+        """
+        if self.recoveryPoint is not None:
+            return
+        self.recoveryPoint = sentSeq
+        self._decrease(currentTime)
+
+    @abstractmethod
+    def _increase(self, ackedBytes: int, srtt: Optional[float], currentTime: float):
+        """
+        Grow the window after 'ackedBytes' bytes are acknowledged outside of loss recovery.
+        """
+        pass
+
+    @abstractmethod
+    def _decrease(self, currentTime: float):
+        """
+        Shrink the window at the start of a loss recovery.
+        """
+        pass
+
+
+class NoCongestionControl(CongestionControl):
+    """
+    Never limits the data in flight, i.e. the behaviour before congestion control was added.
+    """
+
+    name = "none"
+
+    def __init__(self):
+        super().__init__()
+        self.cwnd = float("inf")
+
+    def _increase(self, ackedBytes: int, srtt: Optional[float], currentTime: float):
+        pass
+
+    def _decrease(self, currentTime: float):
+        pass
+
+
+class NewReno(CongestionControl):
+    """
+    NewReno from RFC 5681 and RFC 6582: slow start, then one segment per RTT of congestion avoidance.
+    A loss halves the window. Since the per-packet timers play the role of fast retransmit here,
+    the window does not collapse to one segment on a timeout.
+    """
+
+    name = "newreno"
+
+    def _increase(self, ackedBytes: int, srtt: Optional[float], currentTime: float):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += min(ackedBytes, CONGESTION_MSS)
+        else:
+            self.cwnd += CONGESTION_MSS * min(ackedBytes, CONGESTION_MSS) / self.cwnd
+
+    def _decrease(self, currentTime: float):
+        self.ssthresh = max(self.cwnd / 2, MIN_CWND)
+        self.cwnd = self.ssthresh
+
+
+CUBIC_C = 0.4
+"""
+Scaling constant of CUBIC's window growth, from RFC 8312.
+"""
+
+CUBIC_BETA = 0.7
+"""
+Multiplicative decrease factor of CUBIC, from RFC 8312.
+"""
+
+
+class Cubic(CongestionControl):
+    """
+    CUBIC from RFC 8312. After a loss, the window grows along a cubic function of the time since the loss,
+    quickly back to the window at which the loss happened, then slowly around it and faster past it.
+    It never grows slower than NewReno would (the TCP-friendly region).
+    """
+
+    name = "cubic"
+
+    def __init__(self):
+        super().__init__()
+
+        self.wMax: float = 0.0
+        """
+        Window in segments right before the last loss.
+        """
+
+        self.k: float = 0.0
+        """
+        Time in seconds for the cubic function to grow back to 'wMax'.
+        """
+
+        self.epochStart: Optional[float] = None
+        """
+        Start of the current congestion avoidance epoch, None until the first ACK after a loss.
+        """
+
+    def _increase(self, ackedBytes: int, srtt: Optional[float], currentTime: float):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += min(ackedBytes, CONGESTION_MSS)
+            return
+
+        rtt = srtt or 0.0
+        cwnd = self.cwnd / CONGESTION_MSS
+        if self.epochStart is None:
+            self.epochStart = currentTime
+            if cwnd < self.wMax:
+                self.k = ((self.wMax - cwnd) / CUBIC_C) ** (1 / 3)
+            else:
+                self.k = 0.0
+                self.wMax = cwnd
+        t = currentTime - self.epochStart + rtt
+        target = CUBIC_C * (t - self.k) ** 3 + self.wMax
+        # Window NewReno would have reached in the same time
+        estimate = self.wMax * CUBIC_BETA + 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * t / max(rtt, 1e-3)
+        target = max(target, estimate)
+
+        ackedSegments = min(ackedBytes, CONGESTION_MSS) / CONGESTION_MSS
+        if target > cwnd:
+            # Grow by at most half a segment per ACKed segment, i.e. 1.5 times per RTT
+            cwnd += min((target - cwnd) / cwnd, 0.5) * ackedSegments
+        else:
+            cwnd += ackedSegments / (100 * cwnd)
+        self.cwnd = cwnd * CONGESTION_MSS
+
+    def _decrease(self, currentTime: float):
+        cwnd = self.cwnd / CONGESTION_MSS
+        # Fast convergence, release bandwidth for new flows if the window keeps shrinking
+        if cwnd < self.wMax:
+            self.wMax = cwnd * (1 + CUBIC_BETA) / 2
+        else:
+            self.wMax = cwnd
+        self.ssthresh = max(self.cwnd * CUBIC_BETA, MIN_CWND)
+        self.cwnd = self.ssthresh
+        self.epochStart = None
+
+
+class TokenBucketPacer:
+    """
+    Spreads the packets of a window over the RTT instead of sending them in one burst.
+
+    Tokens, in bytes, are refilled at the pacing rate up to 'burst' bytes, and sending a packet consumes
+    as many tokens as its size. A packet may be sent as soon as there is any token left, so the bucket
+    can go into debt by one packet and large packets are never blocked forever.
+    """
+
+    def __init__(self, burst: float = PACING_BURST):
+        self.burst = burst
+        """
+        Maximum number of bytes sent back-to-back.
+        """
+
+        self.rate: Optional[float] = None
+        """
+        Pacing rate in bytes per second, None if pacing is disabled until the RTT is known.
+        """
+
+        self.tokens: float = burst
+        """
+        Bytes that may be sent right now.
+        """
+
+        self.lastRefill: Optional[float] = None
+        """
+        Time at which 'tokens' was last refilled.
+        """
+
+    def setRate(self, rate: Optional[float]):
+        """
+        Change the pacing rate in bytes per second. None disables pacing.
+        """
+        self.rate = rate
+
+    def readyAt(self, currentTime: float) -> float:
+        """
+        Return the time at which the next packet may be sent.
+        """
+        self.__refill(currentTime)
+        if self.rate is None or self.tokens > 0:
+            return currentTime
+        return currentTime - self.tokens / self.rate
+
+    def consume(self, size: int, currentTime: float):
+        """
+        Take the tokens of a packet of 'size' bytes that is being sent.
+        """
+        self.__refill(currentTime)
+        self.tokens -= size
+
+    def __refill(self, currentTime: float):
+        if self.lastRefill is not None and self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (currentTime - self.lastRefill) * self.rate)
+        elif self.rate is None:
+            self.tokens = self.burst
+        self.lastRefill = currentTime
+
+
+CONGESTION_CONTROLS = {controller.name: controller for controller in (NoCongestionControl, NewReno, Cubic)}
+"""
+All available congestion control algorithms, keyed by name.
+"""
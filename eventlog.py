@@ -0,0 +1,369 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from datetime import datetime
+from threading import Lock, Thread
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+import atexit
+import itertools
+import struct
+import sys
+import time
+import weakref
+
+from common import LOG_FLUSH_INTERVAL, LOG_RENDER_HISTORY, LOG_RING_SIZE
+from hudp import HUDPFlags, HUDPPacket
+
+EVENT = struct.Struct("<BIdIIHHdI")
+"""
+Binary log event: kind, source (the logger it comes from) and time it was logged at, followed for packet events by
+the SEQ, ACK, checksum, flags, creation time and payload size of the packet. Text events only use the last field,
+for the size of the UTF-8 text that follows the event in a log file.
+"""
+
+EVENT_SEND = 1
+EVENT_RETRANSMIT = 2
+EVENT_RECV = 3
+EVENT_INFO = 4
+EVENT_METRIC = 5
+EVENT_DROPPED = 6
+"""
+Kinds of events. A dropped event counts in its size field the events lost because the ring was full.
+"""
+
+EVENT_KIND_MASK = 0x0F
+
+EVENT_HIDDEN = 0x10
+"""
+Set on the kind of a packet event recorded only to take RTT samples and tag duplicates, whose line is not shown.
+"""
+
+EVENT_RTT = 0x20
+"""
+Set on the kind of a received packet event whose ACK is shown as an RTT sample.
+"""
+
+TEXT_EVENTS = (EVENT_INFO, EVENT_METRIC)
+
+FILE_MAGIC = b"HLOG\x01"
+"""
+First bytes of a binary log file, followed by the events.
+"""
+
+
+class EventRing:
+    """
+    Fixed-size ring of the binary events of one logger, written by the threads of its connection and drained by
+    the log writer thread. Writing an event packs a few integers into a preallocated buffer, and formatting and
+    printing are left to the writer. Events written while the ring is full are dropped and counted instead of
+    blocking the connection.
+    """
+
+    def __init__(self, sink: LogSink, capacity: int = LOG_RING_SIZE):
+        self.buffer = bytearray(capacity * EVENT.size)
+        """
+        Memory of the events, EVENT.size bytes each.
+        """
+
+        self.texts: List[Optional[bytes]] = [None] * capacity
+        """
+        UTF-8 text of the text events, in the slot of their event.
+        """
+
+        self.capacity = capacity
+        self.head = 0
+        """
+        Number of events written so far. The next one goes to slot 'head' % 'capacity'.
+        """
+
+        self.tail = 0
+        """
+        Number of events drained so far.
+        """
+
+        self.dropped = 0
+        """
+        Number of events dropped since the last drain.
+        """
+
+        self.lock = Lock()
+        self.sink = sink
+        """
+        Where the writer thread hands the events over to.
+        """
+
+        self.source = next(SOURCE_IDS)
+        """
+        ID of this ring in the events, which tells the connections apart when they share a sink.
+        """
+
+    def write(self, kind: int, seq: int = 0, ack: int = 0, checksum: int = 0, flags: int = 0, packetTime: float = 0.0,
+              size: int = 0, text: Optional[bytes] = None):
+        """
+        Record an event logged now.
+        """
+        with self.lock:
+            if self.head - self.tail == self.capacity:
+                self.dropped += 1
+                return
+            slot = self.head % self.capacity
+            EVENT.pack_into(self.buffer, slot * EVENT.size, kind, self.source, time.time(), seq, ack, checksum, flags,
+                            packetTime, size)
+            self.texts[slot] = text
+            self.head += 1
+
+    def drain(self) -> List[tuple]:
+        """
+        Take out the events written since the last call, oldest first, as tuples of the EVENT fields followed by
+        their text, preceded by a dropped event if some were lost.
+        """
+        with self.lock:
+            head, tail, dropped = self.head, self.tail, self.dropped
+            start, end = tail % self.capacity, head % self.capacity
+            if head - tail == 0:
+                records, texts = b"", []
+            elif start < end:
+                records, texts = bytes(self.buffer[start * EVENT.size:end * EVENT.size]), self.texts[start:end]
+            else:
+                records = bytes(self.buffer[start * EVENT.size:]) + bytes(self.buffer[:end * EVENT.size])
+                texts = self.texts[start:] + self.texts[:end]
+            for slot in range(tail, head):
+                self.texts[slot % self.capacity] = None
+            self.tail = head
+            self.dropped = 0
+        events = [fields + (text,) for fields, text in zip(EVENT.iter_unpack(records), texts)]
+        if dropped:
+            events.insert(0, (EVENT_DROPPED, self.source, time.time(), 0, 0, 0, 0, 0.0, dropped, None))
+        return events
+
+
+class LogSink(ABC):
+    """
+    Interface for the destination of the events drained by the log writer thread.
+    """
+
+    @abstractmethod
+    def write(self, events: Iterable[tuple]):
+        """
+        Take in events, as returned by EventRing.drain().
+        """
+        pass
+
+
+class ConsoleSink(LogSink):
+    """
+    Prints the events to the standard output, rendered as human-readable lines.
+    """
+
+    def __init__(self):
+        self.renderer = EventRenderer()
+
+    def write(self, events: Iterable[tuple]):
+        lines = list(self.renderer.render(events))
+        if lines:
+            print("\n".join(lines), flush=True)
+
+
+class FileSink(LogSink):
+    """
+    Appends the events in binary to a file, to be rendered later with `python3 -m eventlog <file>`.
+    May be shared by many connections, as only the writer thread writes to it.
+    """
+
+    def __init__(self, path: str):
+        self.file: BinaryIO = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_MAGIC)
+
+    def write(self, events: Iterable[tuple]):
+        for event in events:
+            self.file.write(EVENT.pack(*event[:-1]))
+            if event[-1] is not None:
+                self.file.write(event[-1])
+        self.file.flush()
+
+
+class RenderState:
+    """
+    What the renderer remembers of the events of one source, bounded to LOG_RENDER_HISTORY entries each.
+    """
+
+    __slots__ = ("sendTimes", "received", "lastAck")
+
+    def __init__(self):
+        self.sendTimes: Dict[int, float] = {}
+        """
+        Creation time of the first reliable packet sent with each SEQ, to take RTT samples from the ACKs received.
+        """
+
+        self.received: Dict[tuple, None] = {}
+        """
+        Headers of the reliable packets received, to tag duplicates.
+        """
+
+        self.lastAck = 0
+        """
+        Largest ACK received.
+        """
+
+
+class EventRenderer:
+    """
+    Turns events back into the lines the logger prints: sent and received packets, retransmissions and duplicates,
+    RTT samples, information and metrics.
+    """
+
+    def __init__(self):
+        self.states: Dict[int, RenderState] = {}
+        """
+        What is remembered of each source.
+        """
+
+    def render(self, events: Iterable[tuple]) -> Iterator[str]:
+        """
+        Return the lines of events, as returned by EventRing.drain() or read from a log file.
+        """
+        for kind, source, loggedAt, seq, ack, checksum, flags, packetTime, size, text in events:
+            event = kind & EVENT_KIND_MASK
+            if event == EVENT_INFO:
+                yield self.__line(loggedAt, f"\033[100m INFO \033[0m {text.decode()}")
+            elif event == EVENT_METRIC:
+                yield self.__line(loggedAt, f"\033[45m MTRC \033[0m {text.decode()}")
+            elif event == EVENT_DROPPED:
+                yield self.__line(loggedAt, f"\033[100m INFO \033[0m {size} log events dropped, the log writer fell behind")
+            else:
+                state = self.states.get(source)
+                if state is None:
+                    state = self.states[source] = RenderState()
+                yield from self.__renderPacket(state, kind, loggedAt, seq, ack, checksum, flags, packetTime, size)
+
+    def __renderPacket(self, state: RenderState, kind: int, loggedAt: float, seq: int, ack: int, checksum: int,
+                       flags: int, packetTime: float, size: int) -> Iterator[str]:
+        event = kind & EVENT_KIND_MASK
+        isReliable = bool(flags & HUDPFlags.REL)
+        isDataPacket = size > 0 and not flags & (HUDPFlags.SACK | HUDPFlags.SNAPACK)
+        packet = HUDPPacket.describe(packetTime, seq, ack, flags, isDataPacket)
+        if event == EVENT_RECV:
+            message = f"\033[44m RECV \033[0m {packet} "
+            if isReliable:
+                header = (packetTime, seq, ack, checksum, flags)
+                if header in state.received:
+                    message += "duplicate "
+                else:
+                    remember(state.received, header, None)
+        else:
+            message = f"\033[42m SEND \033[0m {packet} "
+            if event == EVENT_RETRANSMIT:
+                message += "retransmit "
+            elif isReliable and seq not in state.sendTimes:
+                remember(state.sendTimes, seq, packetTime)
+        if not kind & EVENT_HIDDEN:
+            yield self.__line(loggedAt, message)
+
+        if event == EVENT_RECV and flags & HUDPFlags.ACK and ack > state.lastAck:
+            sentAt = state.sendTimes.get(state.lastAck)
+            if kind & EVENT_RTT and sentAt is not None:
+                rtt = round((loggedAt - sentAt) * 1000)
+                yield self.__line(loggedAt, f"\033[45m MTRC \033[0m SEQ {state.lastAck} -> {ack}: RTT ≈ {rtt} ms")
+            state.lastAck = ack
+
+    @staticmethod
+    def __line(loggedAt: float, message: str) -> str:
+        timeString = datetime.fromtimestamp(loggedAt).strftime("%M:%S:%f")[:-3]
+        return f"[{timeString}]: \033[43m API \033[0m {message}"
+
+
+def remember(history: dict, key, value):
+    """
+    Add an entry to a history of the renderer, forgetting the oldest one beyond LOG_RENDER_HISTORY entries.
+    """
+    if len(history) >= LOG_RENDER_HISTORY:
+        del history[next(iter(history))]
+    history[key] = value
+
+
+class LogWriter:
+    """
+    Background thread draining the rings of every logger into their sink every LOG_FLUSH_INTERVAL seconds, so that
+    formatting and writing the logs stays off the threads of the connections. A single thread serves all
+    connections, and is started with the first ring.
+    """
+
+    def __init__(self):
+        self.rings: weakref.WeakSet[EventRing] = weakref.WeakSet()
+        self.lock = Lock()
+        """
+        Held while draining, so that the events of a ring reach its sink in order.
+        """
+
+        self.thread: Optional[Thread] = None
+
+    def register(self, ring: EventRing):
+        """
+        Drain 'ring' from now on, until it is garbage collected.
+        """
+        with self.lock:
+            self.rings.add(ring)
+            if self.thread is None:
+                self.thread = Thread(target=self.__run, name="GNSLogWriter", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def flush(self, ring: Optional[EventRing] = None):
+        """
+        Drain 'ring' right away, or every ring if None.
+        """
+        with self.lock:
+            for ring in [ring] if ring is not None else list(self.rings):
+                ring.sink.write(ring.drain())
+
+    def __run(self):
+        while True:
+            time.sleep(LOG_FLUSH_INTERVAL)
+            self.flush()
+
+
+SOURCE_IDS = itertools.count()
+"""
+IDs of the rings created so far.
+"""
+
+CONSOLE_SINK = ConsoleSink()
+"""
+Default sink of the loggers.
+"""
+
+LOG_WRITER = LogWriter()
+"""
+The writer thread of the process.
+"""
+
+
+def readEvents(file: BinaryIO) -> Iterator[tuple]:
+    """
+    Return the events of a binary log file, as returned by EventRing.drain().
+    """
+    if file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+        raise ValueError("Not a GNS binary log file")
+    while True:
+        record = file.read(EVENT.size)
+        if len(record) < EVENT.size:
+            return
+        fields = EVENT.unpack(record)
+        text = file.read(fields[-1]) if fields[0] & EVENT_KIND_MASK in TEXT_EVENTS else None
+        yield fields + (text,)
+
+
+def main():
+    """
+    Render a binary log file written with setLogFile() to the standard output.
+    """
+    if len(sys.argv) != 2:
+        print("Usage: python3 -m eventlog <log file>", file=sys.stderr)
+        sys.exit(2)
+    with open(sys.argv[1], "rb") as file:
+        for line in EventRenderer().render(readEvents(file)):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
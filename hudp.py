@@ -1,90 +1,199 @@
 from __future__ import annotations
 from datetime import datetime
+from checksum import ONES_COMPLEMENT, CRC32
+from typing import List, Optional, Sequence, Tuple
 import struct
 import time
 
 
+HEADER = struct.Struct("!dIIHH")
+"""
+Precompiled layout of the HUDP header: timestamp, SEQ, ACK, checksum and flags.
+"""
+
+HEADER_SIZE = HEADER.size
+"""
+Size of the HUDP header in bytes.
+"""
+
+SACK_BLOCK = struct.Struct("!II")
+"""
+Layout of a SACK block in the header extension of a pure ACK: first SEQ held and SEQ right after the block.
+"""
+
+MAX_SACK_BLOCKS = 4
+"""
+Maximum number of SACK blocks carried by a pure ACK.
+"""
+
+MESSAGE_HEADER = struct.Struct("!H")
+"""
+Length prefix of each message in the payload of a coalesced packet.
+"""
+
+FRAGMENT_HEADER = struct.Struct("!III")
+"""
+Header extension of a fragment, before its data: ID of the message, size of the whole message and offset
+of the fragment's data in it.
+"""
+
+SNAPSHOT_ACK = struct.Struct("!I")
+"""
+Header extension of a pure ACK acknowledging a snapshot, before its SACK blocks if any: ID of the latest snapshot
+received.
+"""
+
+KEYED_HEADER = struct.Struct("!II")
+"""
+Header extension of a keyed update, before its data: key of the state it updates and counter of the update.
+"""
+
+STREAM_HEADER = struct.Struct("!HI")
+"""
+Header extension of a packet sent on a stream, before any other: ID of the stream and, for reliable packets,
+sequence number of the packet on its stream.
+"""
+
+
 class HUDPFlags:
     """
-    Represent the flags portion of the HUDP packet header.
+    Bits of the 16-bit flags portion of the HUDP packet header.
+    Packets keep all their flags in a single integer, these helpers build, convert and display it.
     """
 
-    def __init__(self, isReliable: bool, isAck: bool, isSyn: bool, isFin: bool, isRst: bool):
-        self.isReliable = isReliable
-        """True if the packet is on the reliable channel. False otherwise"""
+    RST = 0x0001
+    """Set if the packet is meant to reset the connection"""
 
-        self.isAck = isAck
-        """True if the ACK field is significant. False otherwise"""
+    FIN = 0x0002
+    """Set if the packet is trying to terminate connection"""
 
-        self.isSyn = isSyn
-        """True if the packet is trying to establish connection. False otherwise"""
+    SYN = 0x0004
+    """Set if the packet is trying to establish connection"""
 
-        self.isFin = isFin
-        """True if the packet is trying to terminate connection. False otherwise"""
+    ACK = 0x0008
+    """Set if the ACK field is significant"""
 
-        self.isRst = isRst
-        """True if the packet is meant to reset the connection. False otherwise"""
+    REL = 0x0010
+    """Set if the packet is on the reliable channel"""
 
-    @classmethod
-    def fromBytes(cls, data: bytes) -> HUDPFlags:
+    CRC = 0x0020
+    """Set if the checksum field holds a folded CRC32 instead of the 1s complement sum"""
+
+    SACK = 0x0040
+    """Set if the packet is followed by a header extension of SACK blocks instead of data"""
+
+    MSG = 0x0080
+    """Set if the payload is several length-prefixed messages coalesced into one packet"""
+
+    FRAG = 0x0100
+    """Set if the payload is a fragment of a message too large for one packet"""
+
+    KEY = 0x0200
+    """Set if the payload is the latest state of a key, of which only the newest update is delivered"""
+
+    SNAP = 0x0400
+    """Set if the payload is a snapshot, delta-encoded against a snapshot that remote acknowledged"""
+
+    SNAPACK = 0x0800
+    """Set if the header extension of a pure ACK starts with the ID of the latest snapshot received"""
+
+    ZIP = 0x1000
+    """Set if the payload is compressed. On a SYN, offers compression, on a SYN ACK, accepts it"""
+
+    STRM = 0x2000
+    """Set if the payload starts with a stream header, which every reliable data packet carries"""
+
+    @staticmethod
+    def fromBooleans(isReliable: bool, isAck: bool, isSyn: bool, isFin: bool, isRst: bool, isCrc: bool = False,
+                     isSack: bool = False, isCoalesced: bool = False, isFragment: bool = False,
+                     isKeyed: bool = False, isSnapshot: bool = False, isSnapshotAck: bool = False,
+                     isCompressed: bool = False, isStream: bool = False) -> int:
+        """
+        Build the 16-bit integer representation of the flags.
+        """
+        return ((isStream << 13)
+                | (isCompressed << 12)
+                | (isSnapshotAck << 11)
+                | (isSnapshot << 10)
+                | (isKeyed << 9)
+                | (isFragment << 8)
+                | (isCoalesced << 7)
+                | (isSack << 6)
+                | (isCrc << 5)
+                | (isReliable << 4)
+                | (isAck << 3)
+                | (isSyn << 2)
+                | (isFin << 1)
+                | int(isRst))
+
+    @staticmethod
+    def fromBytes(data: bytes) -> int:
         """
         Reconstruct flags from its bytes' representation.
         """
         assert (len(data) == 2)
-        integerValue = (data[0] << 8) + data[1]
-        return HUDPFlags(
-            bool((integerValue & 0x0010) >> 4),
-            bool((integerValue & 0x0008) >> 3),
-            bool((integerValue & 0x0004) >> 2),
-            bool((integerValue & 0x0002) >> 1),
-            bool(integerValue & 0x0001),
-        )
+        return (data[0] << 8) + data[1]
 
-    def toInteger(self) -> int:
+    @staticmethod
+    def toBytes(flags: int) -> bytes:
         """
-        Convert flags into its 16-bit integer representation.
+        Convert flags into its bytes' representation.
         """
-        return (self.isReliable << 4) + (self.isAck << 3) + (self.isSyn << 2) + (self.isFin << 1) + self.isRst
+        return flags.to_bytes(2, "big")
 
-    def toBytes(self) -> bytes:
+    @staticmethod
+    def toString(flags: int) -> str:
         """
-        Convert flags into its bytes' representation.
+        Convert flags into a colored, human-readable string.
         """
-        data = struct.pack("!H", self.toInteger())
-        assert (len(data) == 2)
-        return data
-
-    def __eq__(self, other: HUDPFlags):
-        if not isinstance(other, HUDPFlags):
-            return False
-
-        return (
-            self.isReliable == other.isReliable and
-            self.isAck == other.isAck and
-            self.isSyn == other.isSyn and
-            self.isFin == other.isFin and
-            self.isRst == other.isRst
-        )
-
-    def __str__(self):
-        string = "\033[96mREL \033[0m" if self.isReliable else "\033[90mUNR \033[0m"
-        if self.isAck:
+        string = "\033[96mREL \033[0m" if flags & HUDPFlags.REL else "\033[90mUNR \033[0m"
+        if flags & HUDPFlags.ACK:
             string += "\033[102m ACK \033[0m"
-        if self.isSyn:
+        if flags & HUDPFlags.SYN:
             string += "\033[105m SYN \033[0m"
-        if self.isFin:
+        if flags & HUDPFlags.FIN:
             string += "\033[101m FIN \033[0m"
-        if self.isRst:
+        if flags & HUDPFlags.RST:
             string += "\033[101m RST \033[0m"
+        if flags & HUDPFlags.SACK:
+            string += "\033[103m SACK \033[0m"
+        if flags & HUDPFlags.MSG:
+            string += "\033[106m MSG \033[0m"
+        if flags & HUDPFlags.FRAG:
+            string += "\033[106m FRAG \033[0m"
+        if flags & HUDPFlags.KEY:
+            string += "\033[106m KEY \033[0m"
+        if flags & HUDPFlags.SNAP:
+            string += "\033[106m SNAP \033[0m"
+        if flags & HUDPFlags.SNAPACK:
+            string += "\033[103m SNAPACK \033[0m"
+        if flags & HUDPFlags.ZIP:
+            string += "\033[106m ZIP \033[0m"
+        if flags & HUDPFlags.STRM:
+            string += "\033[106m STRM \033[0m"
         return string
 
 
+CONTROL_FLAGS_MASK = HUDPFlags.REL | HUDPFlags.ACK | HUDPFlags.SYN | HUDPFlags.FIN | HUDPFlags.RST
+"""
+Flags that decide the type of a packet. Other flags only describe how the packet is encoded.
+"""
+
+SYN_ACK_FLAGS = HUDPFlags.REL | HUDPFlags.SYN | HUDPFlags.ACK
+SYN_FLAGS = HUDPFlags.REL | HUDPFlags.SYN
+PURE_ACK_FLAGS = HUDPFlags.ACK
+FIN_FLAGS = HUDPFlags.REL | HUDPFlags.FIN
+RST_FLAGS = HUDPFlags.RST
+
+
 class HUDPPacket:
     """
     Represent the entire HUDP packet.
     """
 
-    def __init__(self, time: int, seq: int, ack: int, checksum: int, flags: HUDPFlags, content: bytes):
+    __slots__ = ("time", "seq", "ack", "checksum", "flags", "content")
+
+    def __init__(self, time: int, seq: int, ack: int, checksum: int, flags: int, content: bytes):
         self.time = time
         """ Timestamp in seconds when this packet was created """
 
@@ -98,7 +207,7 @@ class HUDPPacket:
         """ 16-bit 1s complement checksum of the packet """
 
         self.flags = flags
-        """ Flags of the packet """
+        """ Flags of the packet, as the 16-bit integer from the header """
 
         self.content = content
         """ Content of the packet in bytes """
@@ -108,106 +217,164 @@ class HUDPPacket:
         """
         Helper method for calculating 1s complement checksum
         """
-        sum16: int = 0
-        for i in range(len(data) // 2):
-            sum16 += (data[2 * i] << 8) + data[2 * i + 1]
-        while (sum16 >> 16) > 0:
-            sum16 = (sum16 & 0xFFFF) + (sum16 >> 16)
-        return 0xFFFF - sum16
+        return ONES_COMPLEMENT.compute(data)
 
     @staticmethod
     def verifyChecksum(data: bytes) -> bool:
         """
-        Helper method for validating 1s complement checksum
+        Helper method for validating the checksum, using CRC32 if the packet's CRC flag is set
+        and 1s complement otherwise.
         """
-        return HUDPPacket.checksum1s(data) == 0
+        if len(data) < HEADER_SIZE:
+            return False
+        if data[19] & HUDPFlags.CRC:
+            return CRC32.verify(data)
+        return ONES_COMPLEMENT.verify(data)
 
     @classmethod
     def fromBytes(cls, data: bytes) -> HUDPPacket:
         """
         Reconstruct the packet from its bytes' representation.
+        'data' may be any bytes-like object. The header is decoded in place and the content is
+        copied at most once, so the packet stays valid after the memory behind 'data' is reused.
         """
-        assert (len(data) >= 20)
-        flags = HUDPFlags.fromBytes(data[18:20])
-        packet = HUDPPacket(
-            struct.unpack("!d", data[0:8])[0],
-            struct.unpack("!I", data[8:12])[0],
-            struct.unpack("!I", data[12:16])[0],
-            struct.unpack("!H", data[16:18])[0],
-            flags,
-            data[20:]
-        )
-        return packet
+        assert (len(data) >= HEADER_SIZE)
+        time, seq, ack, checksum, flags = HEADER.unpack_from(data)
+        return HUDPPacket(time, seq, ack, checksum, flags, bytes(data[HEADER_SIZE:]))
+
+    @classmethod
+    def fromBuffer(cls, view: memoryview) -> HUDPPacket:
+        """
+        Reconstruct the packet from a memoryview without copying anything. The content is a memoryview
+        over the same memory, so the packet is only valid until that memory is reused.
+        """
+        assert (len(view) >= HEADER_SIZE)
+        time, seq, ack, checksum, flags = HEADER.unpack_from(view)
+        return HUDPPacket(time, seq, ack, checksum, flags, view[HEADER_SIZE:])
 
     @classmethod
     def create(cls, seq: int, ack: int, content: bytes = bytes(),
-               isReliable=False, isAck=False, isSyn=False, isFin=False, isRst=False) -> HUDPPacket:
+               isReliable=False, isAck=False, isSyn=False, isFin=False, isRst=False, isCrc=False,
+               isSack=False, isCoalesced=False, isFragment=False, isKeyed=False, isSnapshot=False,
+               isSnapshotAck=False, isCompressed=False, isStream=False) -> HUDPPacket:
         """
         Construct a HUDP packet, automatically filling in the current timestamp and checksum.
         Use this method over the __init__ method when creating a HUDP packet.
+        The checksum is a folded CRC32 if isCrc is True and a 1s complement sum otherwise.
         """
-        flags = HUDPFlags(isReliable, isAck, isSyn, isFin, isRst)
+        flags = HUDPFlags.fromBooleans(isReliable, isAck, isSyn, isFin, isRst, isCrc, isSack, isCoalesced, isFragment,
+                                       isKeyed, isSnapshot, isSnapshotAck, isCompressed, isStream)
         currentTime = time.time()
         packet = HUDPPacket(currentTime, seq, ack, 0, flags, content)
-        packet.checksum = HUDPPacket.checksum1s(packet.toBytes())
+        backend = CRC32 if isCrc else ONES_COMPLEMENT
+        header = HEADER.pack(currentTime, seq, ack, 0, flags)
+        packet.checksum = backend.compute(header, content)
         return packet
 
     @classmethod
-    def createPureAck(cls, seq: int, ack: int) -> HUDPPacket:
+    def createPureAck(cls, seq: int, ack: int, isCrc=False, sackBlocks: Sequence[Tuple[int, int]] = (),
+                      snapshotAck: Optional[int] = None) -> HUDPPacket:
         """
         Construct a Pure ACK packet, only meant for delivering ACK to remote.
+        'sackBlocks' are the (start, end) SEQ ranges received past the ACK, of which the first
+        MAX_SACK_BLOCKS are sent in the header extension, after 'snapshotAck' if it is not None.
         """
-        return HUDPPacket.create(seq, ack, bytes(), isAck=True)
+        if not sackBlocks and snapshotAck is None:
+            return HUDPPacket.create(seq, ack, bytes(), isAck=True, isCrc=isCrc)
+        extension = b"" if snapshotAck is None else SNAPSHOT_ACK.pack(snapshotAck)
+        extension += b"".join(SACK_BLOCK.pack(start, end) for start, end in sackBlocks[:MAX_SACK_BLOCKS])
+        return HUDPPacket.create(seq, ack, extension, isAck=True, isCrc=isCrc, isSack=len(sackBlocks) > 0,
+                                 isSnapshotAck=snapshotAck is not None)
+
+    def withContent(self, content: bytes) -> HUDPPacket:
+        """
+        Return a copy of the packet carrying 'content' instead, with the header as received,
+        e.g. once the payload is decompressed. The packet itself is left untouched.
+        """
+        return HUDPPacket(self.time, self.seq, self.ack, self.checksum, self.flags, content)
+
+    def updateAck(self, ack: int):
+        """
+        Make the packet carry 'ack' with the ACK flag set, e.g. to piggyback the latest ACK on a data packet
+        right before it is sent, and recompute its checksum.
+        """
+        self.ack = ack
+        self.flags |= HUDPFlags.ACK
+        backend = CRC32 if self.isCrc() else ONES_COMPLEMENT
+        self.checksum = backend.compute(HEADER.pack(self.time, self.seq, ack, 0, self.flags), self.content)
+
+    def updateSeq(self, seq: int):
+        """
+        Make the packet carry 'seq', e.g. to number a reliable packet right before its first transmission,
+        and recompute its checksum.
+        """
+        self.seq = seq
+        backend = CRC32 if self.isCrc() else ONES_COMPLEMENT
+        self.checksum = backend.compute(HEADER.pack(self.time, seq, self.ack, 0, self.flags), self.content)
 
     def toBytes(self) -> bytes:
         """
         Convert the packet into its bytes' representation.
         """
-        packet = (struct.pack("!dIIH", self.time, self.seq, self.ack, self.checksum) +
-                  self.flags.toBytes() + self.content)
-        assert (len(packet) >= 20)
-        return packet
+        return HEADER.pack(self.time, self.seq, self.ack, self.checksum, self.flags) + self.content
+
+    def packInto(self, buffer: bytearray) -> int:
+        """
+        Write the packet's bytes' representation to the start of a preallocated buffer.
+        Return the number of bytes written.
+        """
+        size = self.size()
+        HEADER.pack_into(buffer, 0, self.time, self.seq, self.ack, self.checksum, self.flags)
+        buffer[HEADER_SIZE:size] = self.content
+        return size
+
+    def size(self) -> int:
+        """
+        Return the size of the packet's bytes' representation.
+        """
+        return HEADER_SIZE + len(self.content)
 
     def isReliable(self) -> bool:
         """
         Return True if packet is reliable. False otherwise.
         """
-        return self.flags.isReliable
+        return (self.flags & HUDPFlags.REL) != 0
 
     def isSynAck(self) -> bool:
         """
         SYN ACK packets in the 3-way handshake have the reliable, syn and ack flags set
         and only those 3. Return True if this packet is a SYN ACK packet. False otherwise.
         """
-        return self.flags.toInteger() == 0b0001_1100
+        return (self.flags & CONTROL_FLAGS_MASK) == SYN_ACK_FLAGS
 
     def isSyn(self) -> bool:
         """
         SYN packets in the 3-way handshake have the reliable and syn flags set
         and only those 2. Return True if this packet is a SYN packet. False otherwise.
         """
-        return self.flags.toInteger() == 0b0001_0100
+        return (self.flags & CONTROL_FLAGS_MASK) == SYN_FLAGS
 
     def isPureAck(self) -> bool:
         """
         Pure ACK packets are packets that are only meant to deliver the ACK back to remote.
-        They only have the ack flag set. Return True if this packet is a pure ACK packet. False otherwise.
+        They only have the ack flag set and carry no data, unlike unreliable data packets with a piggybacked ACK.
+        Return True if this packet is a pure ACK packet. False otherwise.
         """
-        return self.flags.toInteger() == 0b0000_1000
+        return (self.flags & CONTROL_FLAGS_MASK) == PURE_ACK_FLAGS and not self.isDataPacket()
 
     def isFin(self) -> bool:
         """
         FIN packets in the 4-way termination handshake have the reliable and fin flags set
         and only those 2. Return True if this packet is a FIN packet. False otherwise.
         """
-        return self.flags.toInteger() == 0b0001_0010
+        return (self.flags & CONTROL_FLAGS_MASK) == FIN_FLAGS
 
     def isRst(self) -> bool:
         """
         RST packets serve to reset the connection with remote. They only have the rst flag set.
         Return True if this packet is a RST packet. False otherwise.
         """
-        return self.flags.toInteger() == 0b0000_0001
+        return (self.flags & CONTROL_FLAGS_MASK) == RST_FLAGS
 
     def calculateAck(self) -> int:
         """
@@ -215,17 +382,169 @@ class HUDPPacket:
         """
         return self.seq + len(self.content)
 
+    def isAck(self) -> bool:
+        """
+        Return True if the ACK field of the packet is significant. False otherwise.
+        """
+        return (self.flags & HUDPFlags.ACK) != 0
+
+    def isCrc(self) -> bool:
+        """
+        Return True if the packet is protected by a CRC32 checksum. False otherwise.
+        """
+        return (self.flags & HUDPFlags.CRC) != 0
+
+    def isSack(self) -> bool:
+        """
+        Return True if the packet carries SACK blocks. False otherwise.
+        """
+        return (self.flags & HUDPFlags.SACK) != 0
+
+    def sackBlocks(self) -> List[Tuple[int, int]]:
+        """
+        Return the (start, end) SEQ ranges that remote holds past the ACK, as carried by a pure ACK.
+        """
+        if not self.isSack():
+            return []
+        blocks = self.content[SNAPSHOT_ACK.size:] if self.isSnapshotAck() else self.content
+        return list(SACK_BLOCK.iter_unpack(blocks[:len(blocks) - len(blocks) % SACK_BLOCK.size]))
+
+    def isCoalesced(self) -> bool:
+        """
+        Return True if the payload holds several coalesced messages. False otherwise.
+        """
+        return (self.flags & HUDPFlags.MSG) != 0
+
+    @staticmethod
+    def coalesce(messages: Sequence[bytes]) -> bytes:
+        """
+        Build the payload of a coalesced packet, each message prefixed by its length.
+        """
+        return b"".join(MESSAGE_HEADER.pack(len(message)) + message for message in messages)
+
+    def messages(self) -> List[bytes]:
+        """
+        Return the messages carried by this data packet, split back apart if they were coalesced.
+        """
+        if not self.isCoalesced():
+            return [self.content]
+        messages = []
+        offset = 0
+        while offset + MESSAGE_HEADER.size <= len(self.content):
+            size, = MESSAGE_HEADER.unpack_from(self.content, offset)
+            offset += MESSAGE_HEADER.size
+            messages.append(bytes(self.content[offset:offset + size]))
+            offset += size
+        return messages
+
+    def isFragment(self) -> bool:
+        """
+        Return True if the payload is a fragment of a larger message. False otherwise.
+        """
+        return (self.flags & HUDPFlags.FRAG) != 0
+
+    @staticmethod
+    def fragment(messageId: int, message: bytes, fragmentSize: int) -> List[bytes]:
+        """
+        Build the payloads of the fragments of a message, each holding at most 'fragmentSize' bytes of it.
+        """
+        view = memoryview(message)
+        return [FRAGMENT_HEADER.pack(messageId, len(message), offset) + view[offset:offset + fragmentSize]
+                for offset in range(0, len(message), fragmentSize)]
+
+    def fragmentHeader(self) -> Tuple[int, int, int]:
+        """
+        Return the ID of the message this fragment belongs to, the size of the whole message
+        and the offset of the fragment's data in it.
+        """
+        return FRAGMENT_HEADER.unpack_from(self.content)
+
+    def fragmentData(self) -> memoryview:
+        """
+        Return the part of the message carried by this fragment, without copying it.
+        """
+        return memoryview(self.content)[FRAGMENT_HEADER.size:]
+
+    def isCompressed(self) -> bool:
+        """
+        Return True if the payload is compressed, or for a SYN and SYN ACK, if compression is offered. False otherwise.
+        """
+        return (self.flags & HUDPFlags.ZIP) != 0
+
+    def isSnapshot(self) -> bool:
+        """
+        Return True if the payload is a delta-encoded snapshot, or a fragment of one. False otherwise.
+        """
+        return (self.flags & HUDPFlags.SNAP) != 0
+
+    def isSnapshotAck(self) -> bool:
+        """
+        Return True if the pure ACK acknowledges a snapshot. False otherwise.
+        """
+        return (self.flags & HUDPFlags.SNAPACK) != 0
+
+    def snapshotAck(self) -> int:
+        """
+        Return the ID of the latest snapshot remote received, as carried by a pure ACK.
+        """
+        return SNAPSHOT_ACK.unpack_from(self.content)[0]
+
+    def isKeyed(self) -> bool:
+        """
+        Return True if the payload is a keyed update. False otherwise.
+        """
+        return (self.flags & HUDPFlags.KEY) != 0
+
+    def keyedHeader(self) -> Tuple[int, int]:
+        """
+        Return the key this update is for and its counter.
+        """
+        return KEYED_HEADER.unpack_from(self.content)
+
+    def keyedData(self) -> bytes:
+        """
+        Return the state carried by this keyed update.
+        """
+        return bytes(self.content[KEYED_HEADER.size:])
+
+    @staticmethod
+    def isNewerCounter(counter: int, lastCounter: int) -> bool:
+        """
+        Return True if the update 'counter' of a key was queued after 'lastCounter', allowing for the wrap-around
+        of 32-bit counters as long as fewer than 2^31 updates separate them. False otherwise.
+        """
+        return 0 < (counter - lastCounter) % (1 << 32) < (1 << 31)
+
+    def isStream(self) -> bool:
+        """
+        Return True if the payload starts with a stream header. False otherwise.
+        """
+        return (self.flags & HUDPFlags.STRM) != 0
+
+    def streamHeader(self) -> Tuple[int, int]:
+        """
+        Return the ID of the stream this packet was sent on and its sequence number on the stream.
+        """
+        return STREAM_HEADER.unpack_from(self.content)
+
+    def streamData(self) -> bytes:
+        """
+        Return the payload that follows the stream header.
+        """
+        return self.content[STREAM_HEADER.size:]
+
     def isUnreliable(self) -> bool:
         """
         Return True if the packet is unreliable. False otherwise.
         """
-        return not self.flags.isReliable
+        return (self.flags & HUDPFlags.REL) == 0
 
     def isDataPacket(self):
         """
         Return True if the packet transfer data. False otherwise.
+        The header extension of a pure ACK is not data.
         """
-        return len(self.content) > 0
+        return len(self.content) > 0 and not self.flags & (HUDPFlags.SACK | HUDPFlags.SNAPACK)
 
     def __eq__(self, other: HUDPPacket):
         if not isinstance(other, HUDPPacket):
@@ -240,11 +559,17 @@ class HUDPPacket:
         )
 
     def __str__(self):
-        time = datetime.fromtimestamp(self.time)
-        timeString = time.strftime("%M:%S:%f")[:-3]
+        return HUDPPacket.describe(self.time, self.seq, self.ack, self.flags, self.isDataPacket())
+
+    @staticmethod
+    def describe(time: float, seq: int, ack: int, flags: int, isDataPacket: bool) -> str:
+        """
+        Return the human-readable form of a packet from its header, e.g. as recorded by the logger.
+        """
+        timeString = datetime.fromtimestamp(time).strftime("%M:%S:%f")[:-3]
         return (
-            f"[{timeString}] SEQ: {self.seq:>5} ACK: "
-            f'{self.ack:>5} Flags: {self.flags}\033[100m{" DATA " if self.isDataPacket() else ""}\033[0m'
+            f"[{timeString}] SEQ: {seq:>5} ACK: "
+            f'{ack:>5} Flags: {HUDPFlags.toString(flags)}\033[100m{" DATA " if isDataPacket else ""}\033[0m'
         )
 
     def __lt__(self, other: HUDPPacket):
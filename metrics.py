@@ -0,0 +1,172 @@
+from typing import Dict, List
+import math
+
+from common import THROUGHPUT_SLOTS, THROUGHPUT_WINDOW
+
+HISTOGRAM_UNIT = 1e-6
+"""
+Smallest value told apart by the histograms, 1 us for values in seconds. Smaller values share the first bucket.
+"""
+
+HISTOGRAM_SUB_BUCKETS = 64
+"""
+Buckets each power of two of HISTOGRAM_UNIT is cut into, which bounds the relative error of a percentile to 1/64.
+"""
+
+
+class RunningStats:
+    """
+    Count, mean, variance, minimum and maximum of a series of values, updated in O(1) time and memory per value
+    with Welford's algorithm, which stays accurate where a running sum of squares would cancel out.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        """
+        Sum of the squared differences of the values from the running mean.
+        """
+
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        """
+        Take in a value.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def variance(self) -> float:
+        """
+        Return the sample variance of the values, 0 with fewer than 2 values.
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def stddev(self) -> float:
+        """
+        Return the sample standard deviation of the values, 0 with fewer than 2 values.
+        """
+        return math.sqrt(self.variance())
+
+
+class LogHistogram:
+    """
+    Distribution of non-negative values, e.g. latencies in seconds, for percentiles in O(1) time per value,
+    as in HdrHistogram: each power of two of HISTOGRAM_UNIT is cut into HISTOGRAM_SUB_BUCKETS linear buckets,
+    so that every bucket is about as wide relative to the values it counts. Only the buckets that counted a value
+    are kept, at most a few hundred for values from 1 us to hours.
+
+    Values are added by a single thread. Percentiles may be read from any other thread meanwhile.
+    """
+
+    __slots__ = ("counts", "count")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        """
+        Number of values counted by each bucket, by index.
+        """
+
+        self.count = 0
+        """
+        Number of values.
+        """
+
+    def add(self, value: float):
+        """
+        Take in a value.
+        """
+        scaled = value / HISTOGRAM_UNIT
+        if scaled < 1:
+            index = 0
+        else:
+            mantissa, exponent = math.frexp(scaled)
+            index = exponent * HISTOGRAM_SUB_BUCKETS + int((mantissa * 2 - 1) * HISTOGRAM_SUB_BUCKETS)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+
+    def percentile(self, percent: float) -> float:
+        """
+        Return the value below which 'percent' % of the values fall, to the middle of its bucket, or 0 if there is
+        no value.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(percent / 100 * self.count))
+        # Copied at once, as the adding thread may create a bucket meanwhile
+        buckets = sorted(list(self.counts.items()))
+        seen = 0
+        for index, count in buckets:
+            seen += count
+            if seen >= rank:
+                return LogHistogram.__middle(index)
+        return LogHistogram.__middle(buckets[-1][0])
+
+    @staticmethod
+    def __middle(index: int) -> float:
+        """
+        Return the value in the middle of a bucket.
+        """
+        if index == 0:
+            return HISTOGRAM_UNIT / 2
+        exponent, subBucket = divmod(index, HISTOGRAM_SUB_BUCKETS)
+        return math.ldexp((0.5 + (subBucket + 0.5) / (2 * HISTOGRAM_SUB_BUCKETS)) * HISTOGRAM_UNIT, exponent)
+
+
+class SlidingWindowCounter:
+    """
+    Sum of the amounts, e.g. bytes, counted over the last 'window' seconds, in O(1) time per amount and constant
+    memory: the window is cut into 'slotCount' slots, each reused once the window has moved past it.
+    The sum thus covers between 'window' minus a slot and 'window' seconds.
+
+    Amounts are added by a single thread. The sum may be read from any other thread meanwhile.
+    """
+
+    __slots__ = ("window", "slotLength", "amounts", "slotIds")
+
+    def __init__(self, window: float = THROUGHPUT_WINDOW, slotCount: int = THROUGHPUT_SLOTS):
+        self.window = window
+        self.slotLength = window / slotCount
+        self.amounts: List[int] = [0] * slotCount
+        """
+        Amount counted in each slot.
+        """
+
+        self.slotIds: List[int] = [-1] * slotCount
+        """
+        Number of slot lengths since the epoch at which each slot started, to tell whether it is still in the window.
+        """
+
+    def add(self, amount: int, currentTime: float):
+        """
+        Count 'amount' at 'currentTime'.
+        """
+        slotId = int(currentTime / self.slotLength)
+        slot = slotId % len(self.amounts)
+        if self.slotIds[slot] != slotId:
+            self.slotIds[slot] = slotId
+            self.amounts[slot] = 0
+        self.amounts[slot] += amount
+
+    def total(self, currentTime: float) -> int:
+        """
+        Return the sum of the amounts counted in the window ending at 'currentTime'.
+        """
+        oldest = int(currentTime / self.slotLength) - len(self.amounts)
+        return sum(amount for amount, slotId in zip(self.amounts, self.slotIds) if slotId > oldest)
+
+    def rate(self, currentTime: float) -> float:
+        """
+        Return the amount counted per second over the window ending at 'currentTime'.
+        """
+        return self.total(currentTime) / self.window
@@ -0,0 +1,289 @@
+from __future__ import annotations
+from threading import Lock
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from common import FRAGMENT_TIMEOUT, MAX_MESSAGE_SIZE, MAX_PARTIAL_MESSAGES, SKIP_AHEAD_TIMEOUT
+from hudp import HUDPPacket
+
+if TYPE_CHECKING:
+    from api.gnscontext import RecvingHUDPPacket
+
+
+class ReassemblyBuffer:
+    """
+    Reliable data packets received out-of-order, waiting for the packets before them, keyed by their SEQ.
+
+    Inserting a packet is O(1) and drops it if a packet with the same SEQ is already waiting, so duplicates
+    never pile up. Once the missing packet arrives, the contiguous run after it is taken out in a single pass
+    by following the SEQ each packet ends at. Unreliable and control packets never go through it.
+    It only holds back the ACK: packets sent on a stream are delivered by the StreamBuffer as they arrive.
+
+    Packets are inserted by the routine thread, while the SACK blocks may be collected by the sending thread,
+    so it is thread-safe.
+    """
+
+    def __init__(self):
+        self.segments: Dict[int, RecvingHUDPPacket] = {}
+        """
+        Waiting packets, keyed by SEQ.
+        """
+
+        self.mutex = Lock()
+        """
+        Protects 'segments'.
+        """
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def insert(self, recvingPacket: RecvingHUDPPacket, ack: int) -> bool:
+        """
+        Keep a packet that is past 'ack', the next SEQ expected in order.
+        Return True if it was kept. False if it is a duplicate or was already delivered.
+        """
+        seq = recvingPacket.packet.seq
+        if seq < ack:
+            return False
+        with self.mutex:
+            if seq in self.segments:
+                return False
+            self.segments[seq] = recvingPacket
+            return True
+
+    def popContiguous(self, ack: int) -> List[RecvingHUDPPacket]:
+        """
+        Take out the run of packets that starts exactly at 'ack' and continues without gap, in order.
+        """
+        run = []
+        with self.mutex:
+            recvingPacket = self.segments.pop(ack, None)
+            while recvingPacket is not None:
+                run.append(recvingPacket)
+                recvingPacket = self.segments.pop(recvingPacket.packet.calculateAck(), None)
+        return run
+
+    def firstSeq(self) -> Optional[int]:
+        """
+        Return the lowest SEQ waiting, or None if the buffer is empty.
+        """
+        with self.mutex:
+            return min(self.segments) if self.segments else None
+
+    def ranges(self) -> List[Tuple[int, int]]:
+        """
+        Return the (start, end) SEQ ranges of the waiting packets, merged and in order.
+        """
+        with self.mutex:
+            segments = sorted((seq, recvingPacket.packet.calculateAck())
+                              for seq, recvingPacket in self.segments.items())
+        ranges: List[Tuple[int, int]] = []
+        for start, end in segments:
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+            else:
+                ranges.append((start, end))
+        return ranges
+
+
+class OrderedStream:
+    """
+    Delivery order of the reliable packets received on one stream.
+    """
+
+    __slots__ = ("nextSeq", "waiting", "stalledSince")
+
+    def __init__(self):
+        self.nextSeq = 0
+        """
+        Sequence number on the stream of the next packet to be delivered.
+        """
+
+        self.waiting: Dict[int, HUDPPacket] = {}
+        """
+        Packets received past 'nextSeq', keyed by their sequence number on the stream.
+        """
+
+        self.stalledSince: Optional[float] = None
+        """
+        Time since which packets are waiting without the stream moving forward, None if none are waiting.
+        """
+
+
+class StreamBuffer:
+    """
+    Reliable data packets waiting to be delivered in the order of their stream, keyed by stream ID.
+
+    Each stream numbers its packets on its own, so a packet is delivered as soon as the packets sent before it
+    on the same stream were, whatever the connection's ACK. A packet lost on one stream thus only holds back
+    the later packets of that stream. A stream that stays stuck on a gap for 'timeout' seconds skips it,
+    as the ACK does. Only used by the routine thread.
+    """
+
+    def __init__(self, timeout: float = SKIP_AHEAD_TIMEOUT):
+        self.timeout = timeout
+        """
+        Time in seconds a stream waits for a missing packet before skipping it.
+        """
+
+        self.streams: Dict[int, OrderedStream] = {}
+        """
+        Every stream that received a packet, keyed by ID.
+        """
+
+        self.skips = 0
+        """
+        Number of gaps skipped so far, over all streams.
+        """
+
+    def offer(self, stream: int, streamSeq: int, packet: HUDPPacket, currentTime: float) -> List[HUDPPacket]:
+        """
+        Take in a packet received on 'stream' with sequence number 'streamSeq'.
+        Return the packets of the stream that are now in order, possibly none. Duplicates are dropped.
+        """
+        orderedStream = self.streams.get(stream)
+        if orderedStream is None:
+            orderedStream = self.streams[stream] = OrderedStream()
+        distance = (streamSeq - orderedStream.nextSeq) % (1 << 32)
+        if distance >= 1 << 31 or streamSeq in orderedStream.waiting:
+            # Delivered or skipped before, or already waiting
+            return []
+        if distance > 0:
+            orderedStream.waiting[streamSeq] = packet
+            if orderedStream.stalledSince is None:
+                orderedStream.stalledSince = currentTime
+            return []
+        return self.__release(orderedStream, packet, currentTime)
+
+    def skipStalled(self, currentTime: float) -> List[HUDPPacket]:
+        """
+        Give up on the gap of every stream stuck on it for 'timeout' seconds by 'currentTime'.
+        Return the packets that follow the gaps, in the order of their streams.
+        """
+        released = []
+        for orderedStream in self.streams.values():
+            if orderedStream.waiting and currentTime - orderedStream.stalledSince > self.timeout:
+                nextSeq = orderedStream.nextSeq
+                orderedStream.nextSeq = min(orderedStream.waiting,
+                                            key=lambda streamSeq: (streamSeq - nextSeq) % (1 << 32))
+                packet = orderedStream.waiting.pop(orderedStream.nextSeq)
+                self.skips += 1
+                released.extend(self.__release(orderedStream, packet, currentTime))
+        return released
+
+    def deadline(self) -> Optional[float]:
+        """
+        Return the time at which the first stream stuck on a gap skips it, or None if no stream is stuck.
+        """
+        stalledSince = [orderedStream.stalledSince for orderedStream in self.streams.values() if orderedStream.waiting]
+        return min(stalledSince) + self.timeout if stalledSince else None
+
+    @staticmethod
+    def __release(orderedStream: OrderedStream, packet: HUDPPacket, currentTime: float) -> List[HUDPPacket]:
+        """
+        Deliver the packet expected next on the stream and the run of waiting packets that follows it.
+        """
+        released = [packet]
+        orderedStream.nextSeq = (orderedStream.nextSeq + 1) % (1 << 32)
+        while orderedStream.nextSeq in orderedStream.waiting:
+            released.append(orderedStream.waiting.pop(orderedStream.nextSeq))
+            orderedStream.nextSeq = (orderedStream.nextSeq + 1) % (1 << 32)
+        # A gap left behind counts as stalled from now on
+        orderedStream.stalledSince = currentTime if orderedStream.waiting else None
+        return released
+
+
+class PartialMessage:
+    """
+    A message being rebuilt from its fragments.
+    """
+
+    __slots__ = ("buffer", "received", "offsets", "deadline")
+
+    def __init__(self, size: int, deadline: float):
+        self.buffer = bytearray(size)
+        """
+        The whole message, allocated once at its final size. Each fragment is copied into place.
+        """
+
+        self.received = 0
+        """
+        Number of bytes of the message received so far.
+        """
+
+        self.offsets: Set[int] = set()
+        """
+        Offsets of the fragments received so far, to ignore duplicates.
+        """
+
+        self.deadline = deadline
+        """
+        Time at which the message is dropped unless another of its fragments arrives.
+        """
+
+
+class FragmentAssembler:
+    """
+    Rebuilds the messages that were sent in fragments because they did not fit in a single packet.
+
+    Reliable fragments are handed over in order by the StreamBuffer, unreliable ones as they arrive, in any
+    order. Every fragment is copied once into a buffer of the message's full size, so a message is rebuilt in
+    linear time however many fragments it has. A message that misses a fragment for 'timeout' seconds, e.g. an
+    unreliable fragment that was lost or a reliable one that was skipped, is dropped, and so is the message
+    updated least recently once 'maxMessages' are incomplete. Only used by the routine thread.
+    """
+
+    def __init__(self, timeout: float = FRAGMENT_TIMEOUT, maxMessages: int = MAX_PARTIAL_MESSAGES):
+        self.timeout = timeout
+        """
+        Time in seconds an incomplete message is kept after its latest fragment arrived.
+        """
+
+        self.maxMessages = maxMessages
+        """
+        Maximum number of incomplete messages kept at once.
+        """
+
+        self.partials: Dict[Tuple[bool, int], PartialMessage] = {}
+        """
+        Incomplete messages keyed by channel and message ID, from the least to the most recently updated.
+        """
+
+    def __len__(self) -> int:
+        return len(self.partials)
+
+    def add(self, packet: HUDPPacket, currentTime: float) -> Optional[bytes]:
+        """
+        Copy a fragment into its message. Return the message if it is now complete, None otherwise.
+        Fragments that do not fit the size of their message are dropped.
+        """
+        messageId, size, offset = packet.fragmentHeader()
+        data = packet.fragmentData()
+        if size > MAX_MESSAGE_SIZE or offset + len(data) > size:
+            return None
+        key = (packet.isReliable(), messageId)
+        partial = self.partials.pop(key, None)
+        if partial is None:
+            self.__evict(currentTime)
+            partial = PartialMessage(size, currentTime + self.timeout)
+        elif len(partial.buffer) != size:
+            self.partials[key] = partial
+            return None
+        if offset not in partial.offsets:
+            partial.offsets.add(offset)
+            partial.buffer[offset:offset + len(data)] = data
+            partial.received += len(data)
+        if partial.received >= size:
+            return bytes(partial.buffer)
+        partial.deadline = currentTime + self.timeout
+        # Reinserted last, so that 'partials' stays ordered by deadline
+        self.partials[key] = partial
+        return None
+
+    def __evict(self, currentTime: float):
+        """
+        Drop the incomplete messages that timed out, and the least recently updated ones to make room for a new one.
+        """
+        for key, partial in list(self.partials.items()):
+            if partial.deadline > currentTime and len(self.partials) < self.maxMessages:
+                break
+            del self.partials[key]
@@ -0,0 +1,139 @@
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from common import RETRY_INCREMENT, MIN_RTO, MAX_RTO, TIMER_RESOLUTION
+
+RTT_ALPHA = 1 / 8
+"""
+Gain of the smoothed RTT, from RFC 6298.
+"""
+
+RTT_BETA = 1 / 4
+"""
+Gain of the RTT variation, from RFC 6298.
+"""
+
+RTT_K = 4
+"""
+Number of RTT variations added to the smoothed RTT to get the retransmission timeout, from RFC 6298.
+"""
+
+
+class RttEstimator:
+    """
+    Retransmission timeout (RTO) computed from round-trip time samples as in RFC 6298.
+
+    A sample is taken when an ACK covers a reliable packet, from the time that packet was transmitted. It is not
+    taken from the header timestamp, which also counts the time the packet waited for the congestion window.
+    Following Karn's rule, packets that were retransmitted never give a sample, since the ACK cannot tell
+    which transmission it answers. Packets held out-of-order by remote are sampled when they first show up
+    in a SACK block rather than when the cumulative ACK finally covers them, which would count the recovery
+    of the packets before them. Each retransmission of a packet doubles its own timeout.
+
+    A timeout also doubles the RTO itself, at most once per RTO, and the backed-off RTO is kept until a valid sample
+    replaces it, as in RFC 6298 sections 5.5 and 5.7. Otherwise, on a path whose RTT exceeds the initial RTO, every
+    packet would time out before its ACK and Karn's rule would discard every sample.
+
+    Packets are recorded by the sending thread and ACKs arrive on the receiving thread, so it is thread-safe.
+    """
+
+    def __init__(self):
+        self.srtt: Optional[float] = None
+        """
+        Smoothed round-trip time in seconds, None until the first sample.
+        """
+
+        self.rttvar: Optional[float] = None
+        """
+        Round-trip time variation in seconds, None until the first sample.
+        """
+
+        self.rto: float = RETRY_INCREMENT
+        """
+        Current retransmission timeout in seconds.
+        """
+
+        self.backedOffAt: float = float("-inf")
+        """
+        Time at which 'rto' was last doubled on a timeout.
+        """
+
+        self.pending: Dict[int, float] = {}
+        """
+        Transmission time of the reliable packets that were only transmitted once and are neither ACKed
+        nor SACKed yet, keyed by the ACK that covers them. Ordered by SEQ since packets are first sent in order.
+        """
+
+        self.highestSack: int = 0
+        """
+        Largest end of the SACK blocks received so far.
+        """
+
+        self.mutex = Lock()
+        """
+        Protects 'pending', which is shared by the sending and receiving threads.
+        """
+
+    def timeout(self, attempts: int) -> float:
+        """
+        Return the timeout of a packet that has already been transmitted 'attempts' times before.
+        """
+        return min(MAX_RTO, self.rto * (1 << attempts))
+
+    def onTransmit(self, expectedAck: int, sentAt: float, isRetransmission: bool):
+        """
+        Record the transmission of a reliable packet that is ACKed by 'expectedAck'.
+        """
+        with self.mutex:
+            if isRetransmission:
+                # Karn's rule, the ACK of a retransmitted packet gives no sample
+                self.pending.pop(expectedAck, None)
+                # Packets timing out together are a single timeout of the RTO
+                if sentAt - self.backedOffAt >= self.rto:
+                    self.rto = min(MAX_RTO, self.rto * 2)
+                    self.backedOffAt = sentAt
+            else:
+                self.pending[expectedAck] = sentAt
+
+    def onAck(self, ack: int, currentTime: float):
+        """
+        Take a sample if 'ack' covers a packet that was only transmitted once, and forget all packets it covers.
+        """
+        with self.mutex:
+            sentAt = self.pending.pop(ack, None)
+            while self.pending:
+                expectedAck = next(iter(self.pending))
+                if expectedAck > ack:
+                    break
+                del self.pending[expectedAck]
+        if sentAt is not None:
+            self.addSample(currentTime - sentAt)
+
+    def onSack(self, sackBlocks: List[Tuple[int, int]], currentTime: float):
+        """
+        Take a sample if the SACK blocks were extended by a packet that was only transmitted once,
+        and forget all packets they cover.
+        """
+        sentAt = None
+        with self.mutex:
+            for start, end in sackBlocks:
+                if end > self.highestSack:
+                    self.highestSack = end
+                    sentAt = self.pending.get(end, sentAt)
+                for expectedAck in [expectedAck for expectedAck in self.pending if start < expectedAck <= end]:
+                    del self.pending[expectedAck]
+        if sentAt is not None:
+            self.addSample(currentTime - sentAt)
+
+    def addSample(self, rtt: float):
+        """
+        Update the smoothed RTT, its variation and the RTO with a new sample in seconds.
+        """
+        rtt = max(0.0, rtt)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + max(TIMER_RESOLUTION, RTT_K * self.rttvar)))
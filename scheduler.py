@@ -0,0 +1,155 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import TYPE_CHECKING, Deque, List, Optional, Sequence
+
+from common import CONGESTION_MSS, PRIORITY_NAMES, PRIORITY_WEIGHTS
+
+if TYPE_CHECKING:
+    from api.gnscontext import SendingHUDPPacket
+
+
+class PacketScheduler(ABC):
+    """
+    Reliable packets due for their first transmission but held back by the congestion window or the pacer,
+    in one FIFO queue per priority class, and the order in which the classes take turns to send.
+
+    Packets of a class keep the order they were queued in. Reliable control packets, e.g. a FIN, must not
+    overtake data held back before them, so they wait until every class is empty. Only used by the sending thread.
+    """
+
+    name: str = ""
+
+    def __init__(self, weights: Sequence[int] = PRIORITY_WEIGHTS):
+        if len(weights) != len(PRIORITY_NAMES) or min(weights) <= 0:
+            raise ValueError(f"Expected a positive weight for each of {', '.join(PRIORITY_NAMES)}")
+        self.queues: List[Deque[SendingHUDPPacket]] = [deque() for _ in weights]
+        """
+        Data packets waiting, one queue per priority class.
+        """
+
+        self.trailing: Deque[SendingHUDPPacket] = deque()
+        """
+        Control packets waiting for every queue of 'queues' to be empty.
+        """
+
+        self.length = 0
+        """
+        Number of packets waiting, in 'queues' and 'trailing'.
+        """
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, sendingPacket: SendingHUDPPacket):
+        """
+        Queue a packet at the back of its priority class.
+        """
+        if sendingPacket.packet.isDataPacket():
+            self.queues[sendingPacket.priority].append(sendingPacket)
+        else:
+            self.trailing.append(sendingPacket)
+        self.length += 1
+
+    def peek(self) -> Optional[SendingHUDPPacket]:
+        """
+        Return the packet to be sent next without taking it out, or None if none is waiting.
+        """
+        priority = self._select()
+        if priority is not None:
+            return self.queues[priority][0]
+        return self.trailing[0] if self.trailing else None
+
+    def popleft(self) -> SendingHUDPPacket:
+        """
+        Take out the packet returned by peek(). At least one packet must be waiting.
+        """
+        priority = self._select()
+        self.length -= 1
+        if priority is None:
+            return self.trailing.popleft()
+        sendingPacket = self.queues[priority].popleft()
+        self._onSent(priority, sendingPacket)
+        return sendingPacket
+
+    @abstractmethod
+    def _select(self) -> Optional[int]:
+        """
+        Return the priority class whose first packet is sent next, or None if every class is empty.
+        Calling it again before popleft() returns the same class.
+        """
+        pass
+
+    def _onSent(self, priority: int, sendingPacket: SendingHUDPPacket):
+        """
+        Called when the first packet of class 'priority' is taken out to be sent.
+        """
+        pass
+
+
+class StrictPriorityScheduler(PacketScheduler):
+    """
+    Always sends the packets of the most important class first. A class only sends once every class before it
+    is empty, so bulk transfers never delay critical messages, but may starve under a constant stream of them.
+    """
+
+    name = "strict"
+
+    def _select(self) -> Optional[int]:
+        for priority, queue in enumerate(self.queues):
+            if queue:
+                return priority
+        return None
+
+
+class WeightedFairScheduler(PacketScheduler):
+    """
+    Shares the sending rate between the classes in proportion to their weight, as weighted fair queuing,
+    with deficit round robin: each class in turn sends packets as long as its credit in bytes covers them,
+    and gets 'weight' segments of credit at the start of its turn. Every class thus keeps a share of the
+    congestion window, in O(1) per packet. An empty class gives up its credit so that it cannot burst later.
+    """
+
+    name = "wfq"
+
+    def __init__(self, weights: Sequence[int] = PRIORITY_WEIGHTS):
+        super().__init__(weights)
+        self.quanta = [weight * CONGESTION_MSS for weight in weights]
+        """
+        Credit in bytes each class gets at the start of its turn.
+        """
+
+        self.deficits = [0] * len(weights)
+        """
+        Credit in bytes each class has left in the current round.
+        """
+
+        # The first packet queued starts a round, from the most important class
+        self.current = len(weights) - 1
+        """
+        Class whose turn it is.
+        """
+
+    def _select(self) -> Optional[int]:
+        if self.length == len(self.trailing):
+            return None
+        while True:
+            queue = self.queues[self.current]
+            if queue and self.deficits[self.current] >= queue[0].packet.size():
+                return self.current
+            if not queue:
+                self.deficits[self.current] = 0
+            self.current = (self.current + 1) % len(self.queues)
+            if self.queues[self.current]:
+                self.deficits[self.current] += self.quanta[self.current]
+
+    def _onSent(self, priority: int, sendingPacket: SendingHUDPPacket):
+        self.deficits[priority] -= sendingPacket.packet.size()
+        if not self.queues[priority]:
+            self.deficits[priority] = 0
+
+
+SCHEDULERS = {scheduler.name: scheduler for scheduler in (StrictPriorityScheduler, WeightedFairScheduler)}
+"""
+Schedulers of the packets held back for their first transmission, by name.
+"""
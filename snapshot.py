@@ -0,0 +1,187 @@
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+import struct
+
+from common import SNAPSHOT_HISTORY
+
+Snapshot = Dict[int, bytes]
+"""
+State of the world at one tick: the encoded state of each entity, keyed by entity ID.
+"""
+
+SNAPSHOT_HEADER = struct.Struct("!II")
+"""
+Header of an encoded snapshot: its ID and the ID of the baseline it is a delta against, NO_BASELINE if none.
+"""
+
+ENTITY_HEADER = struct.Struct("!IH")
+"""
+Header of each entity that changed since the baseline: its ID and the size of its state.
+"""
+
+COUNT = struct.Struct("!I")
+"""
+Number of entities that changed, or were removed, since the baseline.
+"""
+
+NO_BASELINE = 0
+"""
+Baseline ID of a snapshot encoded in full. Snapshot IDs start at 1 and skip it when they wrap around.
+"""
+
+
+def isNewerSnapshot(snapshotId: int, lastId: int) -> bool:
+    """
+    Return True if snapshot 'snapshotId' was encoded after 'lastId', allowing for the wrap-around of 32-bit IDs.
+    False otherwise.
+    """
+    return 0 < (snapshotId - lastId) % (1 << 32) < (1 << 31)
+
+
+class SnapshotEncoder:
+    """
+    Encodes the snapshots sent to remote as deltas against the latest snapshot that remote acknowledged.
+
+    A delta lists the entities whose state differs from the baseline, in full, and the IDs of the entities that
+    are no longer present. Until remote acknowledges a snapshot, or once its baseline is older than the last
+    'historySize' snapshots, snapshots are encoded in full. The snapshots are sent unreliably: a lost snapshot is
+    never retransmitted, the next one is simply encoded against an older baseline.
+
+    Snapshots are encoded by the user and acknowledged by the receiving thread, so it is thread-safe.
+    """
+
+    def __init__(self, historySize: int = SNAPSHOT_HISTORY):
+        self.historySize = historySize
+        """
+        Number of the latest snapshots kept as potential baselines.
+        """
+
+        self.history: Dict[int, Snapshot] = {}
+        """
+        Latest snapshots sent, keyed by ID, from the oldest to the newest.
+        """
+
+        self.nextId = 1
+        """
+        ID of the next snapshot.
+        """
+
+        self.ackedId = NO_BASELINE
+        """
+        ID of the latest snapshot that remote acknowledged, NO_BASELINE if none.
+        """
+
+        self.mutex = Lock()
+        """
+        Protects 'history' and 'ackedId'.
+        """
+
+    def encode(self, snapshot: Snapshot) -> bytes:
+        """
+        Return the encoded delta of 'snapshot' against the latest acknowledged baseline, and keep it as a baseline.
+        """
+        with self.mutex:
+            snapshotId = self.nextId
+            self.nextId = self.nextId % ((1 << 32) - 1) + 1
+            baselineId = self.ackedId if self.ackedId in self.history else NO_BASELINE
+            baseline = self.history.get(baselineId, {})
+            self.history[snapshotId] = dict(snapshot)
+            while len(self.history) > self.historySize:
+                del self.history[next(iter(self.history))]
+
+        changes = [(entityId, state) for entityId, state in snapshot.items() if baseline.get(entityId) != state]
+        removals = [entityId for entityId in baseline if entityId not in snapshot]
+        parts = [SNAPSHOT_HEADER.pack(snapshotId, baselineId), COUNT.pack(len(changes))]
+        for entityId, state in changes:
+            parts.append(ENTITY_HEADER.pack(entityId, len(state)))
+            parts.append(state)
+        parts.append(COUNT.pack(len(removals)))
+        parts.extend(COUNT.pack(entityId) for entityId in removals)
+        return b"".join(parts)
+
+    def onAck(self, snapshotId: int):
+        """
+        Use snapshot 'snapshotId' as the baseline of the next snapshots, if remote acknowledged it
+        after the current baseline.
+        """
+        with self.mutex:
+            if self.ackedId == NO_BASELINE or isNewerSnapshot(snapshotId, self.ackedId):
+                self.ackedId = snapshotId
+
+
+class SnapshotDecoder:
+    """
+    Rebuilds the snapshots sent by a SnapshotEncoder of remote from their deltas.
+
+    Keeps the last 'historySize' snapshots decoded as the baselines remote may use. A snapshot that arrives after
+    a newer one, or whose baseline is unknown, is dropped. Only used by the routine thread.
+    """
+
+    def __init__(self, historySize: int = SNAPSHOT_HISTORY):
+        self.historySize = historySize
+        """
+        Number of the latest snapshots kept as potential baselines.
+        """
+
+        self.history: Dict[int, Snapshot] = {}
+        """
+        Latest snapshots decoded, keyed by ID, from the oldest to the newest.
+        """
+
+        self.latestId: Optional[int] = None
+        """
+        ID of the latest snapshot decoded, None if none.
+        """
+
+    def decode(self, data: bytes) -> Optional[Tuple[int, Snapshot]]:
+        """
+        Return the ID and the rebuilt snapshot of an encoded delta, or None if it is stale or cannot be decoded.
+        """
+        try:
+            snapshotId, baselineId, changes, removals = SnapshotDecoder.__parse(data)
+        except struct.error:
+            # Truncated or malformed, e.g. by a buggy or hostile remote, since the checksum only catches corruption
+            return None
+        if self.latestId is not None and not isNewerSnapshot(snapshotId, self.latestId):
+            return None
+        if baselineId == NO_BASELINE:
+            snapshot = {}
+        elif baselineId in self.history:
+            snapshot = dict(self.history[baselineId])
+        else:
+            return None
+
+        snapshot.update(changes)
+        for entityId in removals:
+            snapshot.pop(entityId, None)
+
+        self.latestId = snapshotId
+        self.history[snapshotId] = snapshot
+        while len(self.history) > self.historySize:
+            del self.history[next(iter(self.history))]
+        return snapshotId, dict(snapshot)
+
+    @staticmethod
+    def __parse(data: bytes) -> Tuple[int, int, Snapshot, List[int]]:
+        """
+        Return the snapshot ID, the baseline ID, the entities that changed and the IDs of those removed of an encoded
+        delta. Raise struct.error if it is truncated.
+        """
+        snapshotId, baselineId = SNAPSHOT_HEADER.unpack_from(data)
+        offset = SNAPSHOT_HEADER.size
+        changeCount, = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        changes: Snapshot = {}
+        for _ in range(changeCount):
+            entityId, size = ENTITY_HEADER.unpack_from(data, offset)
+            offset += ENTITY_HEADER.size
+            if offset + size > len(data):
+                raise struct.error(f"Entity {entityId} truncated")
+            changes[entityId] = bytes(data[offset:offset + size])
+            offset += size
+        removalCount, = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        if offset + removalCount * COUNT.size > len(data):
+            raise struct.error("Removals truncated")
+        removals = [entityId for entityId, in COUNT.iter_unpack(data[offset:offset + removalCount * COUNT.size])]
+        return snapshotId, baselineId, changes, removals
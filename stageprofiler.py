@@ -0,0 +1,230 @@
+from typing import Dict, Optional
+import atexit
+import json
+import os
+import sys
+
+from common import PROFILE_SAMPLE_EVERY
+from metrics import LogHistogram, RunningStats
+
+PROFILE_ENV = "GNS_PROFILE"
+"""
+Environment variable turning the profiler on when the first connection is created: "1", or the number of calls of a stage
+per timed one. Its report is printed to the standard error when the process exits.
+"""
+
+PROFILE_OUTPUT_ENV = "GNS_PROFILE_OUTPUT"
+"""
+Environment variable naming a file the profiler is saved to as JSON when the process exits, instead of printing
+its report. Render it later with
+`python3 -m benchmarks.profile_hotpath <file>`.
+"""
+
+SIDE_RECV = "recv"
+SIDE_SEND = "send"
+SIDE_WAIT = "wait"
+"""
+Sides of the stages. The time of a stage is spread over the datagrams received or sent, and waits are not CPU time.
+"""
+
+STAGES = [
+    ("checksum", SIDE_RECV, "Checksum of a datagram received"),
+    ("parse", SIDE_RECV, "Parsing a datagram and taking in its ACK and SACK blocks, logs and counters included"),
+    ("enqueue", SIDE_RECV, "Putting a batch of packets into 'recvWindow' and waking up the state machine"),
+    ("process", SIDE_RECV, "GNSState.process() on a run of the state machine, transitions included"),
+    ("pack", SIDE_SEND, "Piggybacking the ACK and packing a packet into the datagram buffer, logs included"),
+    ("sendto", SIDE_SEND, "The sendto() syscall, or handing the datagram over to the asyncio transport"),
+    ("recvQueue", SIDE_WAIT, "Time a packet received waited in 'recvWindow' for the state machine"),
+    ("sendQueue", SIDE_WAIT, "Time a data packet waited from being queued to its first transmission"),
+]
+"""
+Stages of the hot path timed by the profiler: name, side and description.
+"""
+
+
+class StageProfiler:
+    """
+    Sampled timers of the stages of the hot path of every connection in the process: the receiving, state machine
+    and sending threads, or their asyncio counterparts. Every call of a stage is counted, but only one in
+    'sampleEvery' is timed, and its duration folds into a histogram of the stage.
+
+    Hooks check 'enabled' before anything else, so that the profiler costs a single attribute check per stage while
+    it is off. Stages may be timed by several threads at once, e.g. the receiving threads of two sockets, in which
+    case a few samples may be lost, which a sampled profile tolerates.
+    """
+
+    def __init__(self, sampleEvery: int = PROFILE_SAMPLE_EVERY):
+        self.enabled = False
+        """
+        Whether the hooks count and time the stages.
+        """
+
+        self.sampleEvery = sampleEvery
+        """
+        Number of calls of a stage per timed one.
+        """
+
+        self.calls: Dict[str, int] = {}
+        """
+        Number of calls of each stage while enabled.
+        """
+
+        self.durations: Dict[str, RunningStats] = {}
+        """
+        Mean, minimum and maximum of the durations timed for each stage, in seconds.
+        """
+
+        self.histograms: Dict[str, LogHistogram] = {}
+        """
+        Distribution of the durations timed for each stage, for percentiles.
+        """
+
+        self.reset()
+
+    def enable(self, sampleEvery: Optional[int] = None):
+        """
+        Start counting and timing the stages, one call in 'sampleEvery' if given.
+        """
+        if sampleEvery is not None:
+            if sampleEvery < 1:
+                raise ValueError(f"Invalid sampling: one call in {sampleEvery}")
+            self.sampleEvery = sampleEvery
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stop counting and timing the stages. What was recorded is kept until reset().
+        """
+        self.enabled = False
+
+    def reset(self):
+        """
+        Forget everything recorded so far.
+        """
+        self.calls = {stage: 0 for stage, _, _ in STAGES}
+        self.durations = {stage: RunningStats() for stage, _, _ in STAGES}
+        self.histograms = {stage: LogHistogram() for stage, _, _ in STAGES}
+
+    def sample(self, stage: str) -> bool:
+        """
+        Count a call of 'stage' and return True if it is to be timed.
+        """
+        calls = self.calls[stage] + 1
+        self.calls[stage] = calls
+        return calls % self.sampleEvery == 0
+
+    def record(self, stage: str, duration: float):
+        """
+        Take in the duration in seconds of a timed call of 'stage'.
+        """
+        self.durations[stage].add(duration)
+        self.histograms[stage].add(duration)
+
+    def toDict(self) -> dict:
+        """
+        Return what was recorded as a dict that can be turned into JSON.
+        """
+        return {
+            "sampleEvery": self.sampleEvery,
+            "stages": {stage: {
+                "calls": self.calls[stage],
+                "durations": {field: getattr(self.durations[stage], field) for field in RunningStats.__slots__},
+                "histogram": {str(index): count for index, count in self.histograms[stage].counts.items()},
+            } for stage, _, _ in STAGES},
+        }
+
+    @staticmethod
+    def fromDict(data: dict) -> "StageProfiler":
+        """
+        Return a disabled profiler holding what was recorded in a dict returned by toDict().
+        """
+        profiler = StageProfiler(data["sampleEvery"])
+        for stage, recorded in data["stages"].items():
+            if stage not in profiler.calls:
+                continue
+            profiler.calls[stage] = recorded["calls"]
+            for field, value in recorded["durations"].items():
+                setattr(profiler.durations[stage], field, value)
+            histogram = profiler.histograms[stage]
+            histogram.counts = {int(index): count for index, count in recorded["histogram"].items()}
+            histogram.count = sum(histogram.counts.values())
+        return profiler
+
+    def save(self, path: str):
+        """
+        Write what was recorded to a JSON file, to be rendered with
+        `python3 -m benchmarks.profile_hotpath <file>`.
+        """
+        with open(path, "w") as file:
+            json.dump(self.toDict(), file)
+
+    def report(self) -> str:
+        """
+        Return a table of where the time goes per datagram: for every stage, its calls, the durations timed,
+        its estimated time per datagram received or sent and its share of the CPU time of all stages.
+        """
+        packets = {SIDE_RECV: self.calls["checksum"], SIDE_SEND: self.calls["sendto"]}
+        totals = {stage: self.durations[stage].mean * self.calls[stage] for stage, _, _ in STAGES}
+        cpuTotal = sum(totals[stage] for stage, side, _ in STAGES if side != SIDE_WAIT)
+        lines = [f"{packets[SIDE_RECV]} datagrams received and {packets[SIDE_SEND]} sent, "
+                 f"one call in {self.sampleEvery} timed",
+                 f"{'Stage':<10}{'Calls':>10}{'Timed':>8}{'Mean (us)':>11}{'p50 (us)':>10}{'p99 (us)':>10}"
+                 f"{'Max (us)':>10}{'Per packet (us)':>17}{'Share':>8}"]
+        for stage, side, _ in STAGES:
+            durations, histogram = self.durations[stage], self.histograms[stage]
+            if side == SIDE_WAIT:
+                perPacket, share = durations.mean, ""
+            else:
+                perPacket = totals[stage] / packets[side] if packets[side] else 0.0
+                share = f"{totals[stage] / cpuTotal:.1%}" if cpuTotal else ""
+            maxDuration = durations.max if durations.count else 0.0
+            # The middle of the bucket of a percentile may lie past the largest duration
+            p50, p99 = (min(histogram.percentile(percent), maxDuration) for percent in (50, 99))
+            lines.append(f"{stage:<10}{self.calls[stage]:>10}{durations.count:>8}{durations.mean * 1e6:>11.1f}"
+                         f"{p50 * 1e6:>10.1f}{p99 * 1e6:>10.1f}"
+                         f"{maxDuration * 1e6:>10.1f}{perPacket * 1e6:>17.2f}{share:>8}")
+        for side in (SIDE_RECV, SIDE_SEND):
+            perPacket = sum(totals[stage] for stage, stageSide, _ in STAGES if stageSide == side) / packets[side] \
+                if packets[side] else 0.0
+            lines.append(f"CPU per datagram {'received' if side == SIDE_RECV else 'sent'}: {perPacket * 1e6:.2f} us")
+        return "\n".join(lines)
+
+
+PROFILER = StageProfiler()
+"""
+The profiler of the process, shared by all connections.
+"""
+
+
+environmentChecked = False
+"""
+Whether enableFromEnvironment() already ran, so that the exit report is registered once.
+"""
+
+
+def exitReport():
+    """
+    Save or print the profile at exit when it was turned on through PROFILE_ENV.
+    """
+    path = os.environ.get(PROFILE_OUTPUT_ENV)
+    if path:
+        PROFILER.save(path)
+    else:
+        print(PROFILER.report(), file=sys.stderr)
+
+
+def enableFromEnvironment():
+    """
+    Turn the profiler on if asked to through PROFILE_ENV, once per process. Called when a connection is created,
+    so that importing this module has no side effect.
+    """
+    global environmentChecked
+    if environmentChecked:
+        return
+    environmentChecked = True
+    value = os.environ.get(PROFILE_ENV, "").strip()
+    if not value or value == "0":
+        return
+    PROFILER.enable(int(value) if value.isdigit() and int(value) > 1 else None)
+    atexit.register(exitReport)
+
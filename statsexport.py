@@ -0,0 +1,129 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import json
+import math
+
+from common import AddrPort, STATS_PORT
+
+PROMETHEUS_METRICS = [
+    ("state", "gns_connection_state", "gauge", "Current state of the connection, always 1", ("state",)),
+    ("packetsSent", "gns_packets_sent_total", "counter", "Datagrams sent, retransmissions included", ("channel",)),
+    ("bytesSent", "gns_bytes_sent_total", "counter", "Bytes of the datagrams sent, headers included", ("channel",)),
+    ("packetsReceived", "gns_packets_received_total", "counter", "Valid datagrams received, duplicates included",
+     ("channel",)),
+    ("bytesReceived", "gns_bytes_received_total", "counter", "Bytes of the valid datagrams received, headers included",
+     ("channel",)),
+    ("retransmits", "gns_retransmits_total", "counter", "Retransmissions of reliable packets", ()),
+    ("duplicates", "gns_duplicates_total", "counter", "Reliable packets received more than once", ()),
+    ("checksumFailures", "gns_checksum_failures_total", "counter", "Datagrams dropped on a checksum mismatch", ()),
+    ("addressMismatches", "gns_address_mismatches_total", "counter",
+     "Datagrams dropped because they came from another address than remote", ()),
+    ("skipAheads", "gns_skip_aheads_total", "counter", "Times the ACK gave up on missing packets", ()),
+    ("streamSkips", "gns_stream_skips_total", "counter", "Times a stream gave up on a missing packet", ()),
+    ("rtt", "gns_rtt_seconds", "gauge", "Smoothed RTT, RTT variation and retransmission timeout", ("estimate",)),
+    ("congestionWindow", "gns_congestion_window_bytes", "gauge", "Congestion window of reliable packets", ()),
+    ("queues", "gns_queue_depth", "gauge", "Packets or messages waiting in each queue of the connection", ("queue",)),
+    ("latency", "gns_latency_seconds", "gauge", "Latency of the packets received, mean and percentiles",
+     ("channel", "stat")),
+    ("throughput", "gns_throughput_bytes_per_second", "gauge", "Bytes received per second over the last second",
+     ("channel",)),
+]
+"""
+Stats exported in the Prometheus text format: key in stats(), metric name, type, help, and the labels named by the
+keys of the nested dicts under the key. Every metric is also labelled with its connection.
+"""
+
+
+def flatten(value, path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], float]]:
+    """
+    Return the numbers found under a stat, with the keys leading to them. A string counts as a label value
+    of the number 1, and None is left out.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, path + (str(key),))
+    elif isinstance(value, str):
+        yield path + (value,), 1
+    elif value is not None:
+        yield path, value
+
+
+def toPrometheus(connections: Dict[str, dict]) -> str:
+    """
+    Return the stats of each connection, keyed by its label, in the Prometheus text exposition format.
+    """
+    lines: List[str] = []
+    for key, name, kind, description, labels in PROMETHEUS_METRICS:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for connection, stats in connections.items():
+            for labelValues, value in flatten(stats.get(key)):
+                labelText = ",".join(f'{label}="{labelValue}"' for label, labelValue
+                                     in zip(("connection",) + labels, (connection,) + labelValues))
+                number = "+Inf" if value == math.inf else repr(float(value)) if isinstance(value, float) else str(value)
+                lines.append(f"{name}{{{labelText}}} {number}")
+    return "\n".join(lines) + "\n"
+
+
+class StatsExporter:
+    """
+    Local HTTP endpoint serving the stats of connections while they run, e.g. to be scraped by Prometheus:
+    `GET /metrics` in the Prometheus text format and `GET /stats` as JSON. Stats are collected on every request,
+    on a thread of the HTTP server, so that a connection does nothing until they are asked for.
+    """
+
+    def __init__(self, collect: Callable[[], Dict[str, dict]], addrPort: AddrPort = ("127.0.0.1", STATS_PORT)):
+        self.collect = collect
+        """
+        Returns the stats() of every connection to export, keyed by a label telling them apart, e.g. remote's address.
+        """
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body, contentType = toPrometheus(exporter.collect()), "text/plain; version=0.0.4"
+                elif path == "/stats":
+                    body, contentType = json.dumps(exporter.collect()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", contentType)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(addrPort, Handler)
+        self.server.daemon_threads = True
+        self.thread: Optional[Thread] = None
+
+    def start(self) -> "StatsExporter":
+        """
+        Serve requests in a background thread.
+        """
+        self.thread = Thread(target=self.server.serve_forever, name="GNSStatsExporter", daemon=True)
+        self.thread.start()
+        return self
+
+    def addrPort(self) -> AddrPort:
+        """
+        Return the address and port number the endpoint is bound to, e.g. when bound to port 0.
+        """
+        return self.server.server_address[:2]
+
+    def close(self):
+        """
+        Stop serving and release the port.
+        """
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
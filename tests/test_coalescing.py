@@ -0,0 +1,70 @@
+import unittest
+
+from api.gnsconnection import GNSConnection
+from common import PRIORITY_REALTIME
+from hudp import HEADER_SIZE, MESSAGE_HEADER, STREAM_HEADER, HUDPPacket
+
+LATENCY_BUDGET = 0.005
+MTU = 200
+
+
+class CoalescingTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = GNSConnection()
+        self.connection.setCoalescing(LATENCY_BUDGET, MTU)
+
+    def tearDown(self):
+        self.connection.context.sock.close()
+
+    def queued(self):
+        return [sendingPacket.packet for sendingPacket in self.connection.context.newPackets]
+
+    def test_payload_round_trip(self):
+        messages = [b"move", b"", b"x" * 300]
+        packet = HUDPPacket.create(1, 0, HUDPPacket.coalesce(messages), isCoalesced=True)
+        self.assertEqual(HUDPPacket.fromBytes(packet.toBytes()).messages(), messages)
+
+    def test_messages_wait_for_latency_budget(self):
+        for message in (b"a", b"bb", b"ccc"):
+            self.connection._queueData(message, False)
+        self.assertEqual(self.queued(), [])
+        batch = self.connection.context.coalescingBatches[(False, 0, PRIORITY_REALTIME)]
+        self.connection._flushBatches(batch.deadline - LATENCY_BUDGET / 2)
+        self.assertEqual(self.queued(), [])
+        self.connection._flushBatches(batch.deadline)
+        packets = self.queued()
+        self.assertEqual(len(packets), 1)
+        self.assertTrue(packets[0].isCoalesced())
+        self.assertEqual(packets[0].messages(), [b"a", b"bb", b"ccc"])
+
+    def test_single_message_is_not_framed(self):
+        self.connection._queueData(b"alone", False)
+        self.connection._flushBatches()
+        packet, = self.queued()
+        self.assertFalse(packet.isCoalesced())
+        self.assertEqual(packet.content, b"alone")
+
+    def test_full_batch_is_sent_before_it_overflows(self):
+        message = b"m" * (MTU // 3)
+        fitting = (MTU - HEADER_SIZE - STREAM_HEADER.size) // (MESSAGE_HEADER.size + len(message))
+        for _ in range(fitting + 1):
+            self.connection._queueData(message, False)
+        packet, = self.queued()
+        self.assertEqual(packet.messages(), [message] * fitting)
+        self.assertLessEqual(packet.size(), MTU)
+
+    def test_large_message_keeps_order(self):
+        self.connection._queueData(b"small", False)
+        self.connection._queueData(b"L" * MTU, False)
+        self.assertEqual([packet.messages() for packet in self.queued()], [[b"small"], [b"L" * MTU]])
+
+    def test_channels_are_batched_apart(self):
+        self.connection._queueData(b"unreliable", False)
+        self.connection._queueData(b"reliable", True)
+        self.connection._flushBatches()
+        packets = self.queued()
+        self.assertEqual(sorted(packet.isReliable() for packet in packets), [False, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import unittest
+import zlib
+
+from api.gnscontext import GNSContext, RecvingHUDPPacket
+from api.states.gnssaccept import GNSStateAccept
+from api.states.gnssestablished import GNSStateEstablished
+from common import MAX_DATAGRAM_SIZE
+from compression import PayloadCompressor
+from hudp import HUDPPacket
+
+DICTIONARY = b"".join(json.dumps({"type": "move", "player": i, "x": i * 1.5, "y": -i, "health": 100}).encode()
+                      for i in range(8))
+PAYLOAD = json.dumps({"type": "move", "player": 42, "x": 12.25, "y": -3.0, "health": 87}).encode()
+
+
+class PayloadCompressorTest(unittest.TestCase):
+    def test_round_trip_with_dictionary(self):
+        compressor = PayloadCompressor(DICTIONARY)
+        compressed = compressor.compress(PAYLOAD)
+        self.assertLess(len(compressed), len(PayloadCompressor().compress(PAYLOAD)))
+        self.assertEqual(compressor.decompress(compressed), PAYLOAD)
+        # Every payload is compressed on its own
+        self.assertEqual(compressor.compress(PAYLOAD), compressed)
+
+    def test_small_or_incompressible_payload_is_sent_as_is(self):
+        compressor = PayloadCompressor(DICTIONARY)
+        self.assertIsNone(compressor.compress(PAYLOAD[:compressor.minSize - 1]))
+        self.assertIsNone(compressor.compress(bytes(range(256))))
+
+    def test_dictionaries_have_their_own_id(self):
+        dictionaryId = PayloadCompressor(DICTIONARY).dictionaryId
+        self.assertNotEqual(PayloadCompressor(DICTIONARY[::-1]).dictionaryId, dictionaryId)
+        self.assertEqual(PayloadCompressor(DICTIONARY, 9).dictionaryId, dictionaryId)
+
+    def test_truncated_payload_is_rejected(self):
+        compressor = PayloadCompressor(DICTIONARY)
+        compressed = compressor.compress(PAYLOAD)
+        with self.assertRaises(zlib.error):
+            compressor.decompress(compressed[:len(compressed) // 2])
+
+    def test_payload_larger_than_datagram_is_rejected(self):
+        compressor = PayloadCompressor()
+        stream = zlib.compressobj(9, zlib.DEFLATED, -15)
+        bomb = stream.compress(bytes(MAX_DATAGRAM_SIZE * 4)) + stream.flush()
+        with self.assertRaises(zlib.error):
+            compressor.decompress(bomb)
+
+
+class CompressionNegotiationTest(unittest.TestCase):
+    def setUp(self):
+        self.context = GNSContext()
+        self.addCleanup(self.context.sock.close)
+        self.context.compressor = PayloadCompressor(DICTIONARY)
+
+    def accept(self, dictionaryId: int) -> HUDPPacket:
+        syn = HUDPPacket.create(0, dictionaryId, isReliable=True, isSyn=True, isCompressed=True)
+        self.context.recvWindow.put(RecvingHUDPPacket(syn, ("127.0.0.1", 20000)))
+        GNSStateAccept().process(self.context)
+        return self.context.sendWindow.get_nowait().packet
+
+    def test_same_dictionary_is_accepted(self):
+        synAck = self.accept(self.context.compressor.dictionaryId)
+        self.assertTrue(self.context.useCompression)
+        self.assertTrue(synAck.isCompressed())
+
+    def test_other_dictionary_is_declined(self):
+        synAck = self.accept(PayloadCompressor(DICTIONARY[::-1]).dictionaryId)
+        self.assertFalse(self.context.useCompression)
+        self.assertFalse(synAck.isCompressed())
+
+    def test_compressed_payload_is_dropped_unless_agreed(self):
+        packet = HUDPPacket.create(0, 0, self.context.compressor.compress(PAYLOAD), isCompressed=True)
+        state = GNSStateEstablished()
+        state.deliver(self.context, packet)
+        self.assertTrue(self.context.recvBuffer.empty())
+        self.context.useCompression = True
+        state.deliver(self.context, packet)
+        self.assertEqual(self.context.recvBuffer.get_nowait(), PAYLOAD)
+
+
+if __name__ == "__main__":
+    unittest.main()
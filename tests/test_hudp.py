@@ -0,0 +1,40 @@
+import unittest
+
+from hudp import MAX_SACK_BLOCKS, HUDPPacket
+
+
+class SackBlockTest(unittest.TestCase):
+    def test_round_trip(self):
+        blocks = [(1200, 2400), (3600, 4000)]
+        packet = HUDPPacket.fromBytes(HUDPPacket.createPureAck(1, 100, sackBlocks=blocks).toBytes())
+        self.assertTrue(packet.isSack())
+        self.assertTrue(packet.isPureAck())
+        self.assertFalse(packet.isDataPacket())
+        self.assertEqual(packet.sackBlocks(), blocks)
+
+    def test_without_blocks(self):
+        packet = HUDPPacket.createPureAck(1, 100)
+        self.assertFalse(packet.isSack())
+        self.assertEqual(packet.content, b"")
+        self.assertEqual(packet.sackBlocks(), [])
+
+    def test_only_first_blocks_are_sent(self):
+        blocks = [(start, start + 10) for start in range(100, 1000, 100)]
+        packet = HUDPPacket.createPureAck(1, 50, sackBlocks=blocks)
+        self.assertEqual(packet.sackBlocks(), blocks[:MAX_SACK_BLOCKS])
+
+    def test_after_snapshot_ack(self):
+        blocks = [(300, 400)]
+        packet = HUDPPacket.fromBytes(HUDPPacket.createPureAck(1, 100, sackBlocks=blocks, snapshotAck=7).toBytes())
+        self.assertTrue(packet.isSnapshotAck())
+        self.assertEqual(packet.snapshotAck(), 7)
+        self.assertEqual(packet.sackBlocks(), blocks)
+
+    def test_partial_block_is_ignored(self):
+        packet = HUDPPacket.createPureAck(1, 100, sackBlocks=[(300, 400)])
+        packet.content += b"\x00\x00\x01"
+        self.assertEqual(packet.sackBlocks(), [(300, 400)])
+
+
+if __name__ == "__main__":
+    unittest.main()
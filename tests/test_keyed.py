@@ -0,0 +1,45 @@
+import unittest
+
+from api.gnsconnection import GNSConnection
+from api.gnscontext import GNSContext
+from api.states.gnssestablished import GNSStateEstablished
+from hudp import KEYED_HEADER, HUDPPacket
+
+
+def keyedUpdate(key: int, counter: int, data: bytes) -> HUDPPacket:
+    return HUDPPacket.create(0, 0, KEYED_HEADER.pack(key, counter) + data, isKeyed=True)
+
+
+class KeyedUpdateTest(unittest.TestCase):
+    def test_newer_counter_wraps_around(self):
+        self.assertTrue(HUDPPacket.isNewerCounter(1, 0))
+        self.assertFalse(HUDPPacket.isNewerCounter(0, 0))
+        self.assertFalse(HUDPPacket.isNewerCounter(0, 1))
+        self.assertTrue(HUDPPacket.isNewerCounter(0, (1 << 32) - 1))
+        self.assertFalse(HUDPPacket.isNewerCounter((1 << 32) - 1, 0))
+
+    def test_unsent_update_is_replaced(self):
+        connection = GNSConnection()
+        self.addCleanup(connection.context.sock.close)
+        connection.setCoalescing(0.005)
+        for data in (b"x=1", b"x=2", b"x=3"):
+            connection._queueKeyed(7, data)
+        connection._queueKeyed(8, b"y=1")
+        connection._flushKeyedUpdates()
+        packets = [sendingPacket.packet for sendingPacket in connection.context.newPackets]
+        self.assertEqual([(packet.keyedHeader(), packet.keyedData()) for packet in packets],
+                         [((7, 2), b"x=3"), ((8, 0), b"y=1")])
+
+    def test_stale_update_is_not_delivered(self):
+        context = GNSContext()
+        self.addCleanup(context.sock.close)
+        state = GNSStateEstablished()
+        for counter, data in ((1, b"x=1"), (3, b"x=3"), (2, b"x=2"), (3, b"x=3")):
+            state.deliver(context, keyedUpdate(7, counter, data))
+        state.deliver(context, keyedUpdate(8, 0, b"y=0"))
+        delivered = [context.recvBuffer.get_nowait() for _ in range(context.recvBuffer.qsize())]
+        self.assertEqual(delivered, [b"x=1", b"x=3", b"y=0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import unittest
+from typing import List
+
+from api.gnscontext import GNSContext, RecvingHUDPPacket
+from api.states.gnssestablished import GNSStateEstablished
+from common import SKIP_AHEAD_TIMEOUT
+from hudp import FRAGMENT_HEADER, HUDPPacket
+from reassembly import FragmentAssembler, OrderedStream, ReassemblyBuffer, StreamBuffer
+
+ADDR_PORT = ("127.0.0.1", 20000)
+PAYLOAD_SIZE = 100
+FIRST_SEQ = 1000
+FRAGMENT_SIZE = 10
+MESSAGE = bytes(range(45))
+
+
+def seqOf(index: int) -> int:
+    """
+    SEQ of the index-th reliable packet from FIRST_SEQ.
+    """
+    return FIRST_SEQ + index * PAYLOAD_SIZE
+
+
+def reliable(index: int) -> RecvingHUDPPacket:
+    """
+    The index-th reliable packet from FIRST_SEQ, of PAYLOAD_SIZE bytes starting with its index, without a stream header.
+    """
+    data = b"%03d" % index + bytes(PAYLOAD_SIZE - 3)
+    return RecvingHUDPPacket(HUDPPacket.create(seqOf(index), 0, data, isReliable=True), ADDR_PORT)
+
+
+def fragments(messageId: int, message: bytes, isReliable: bool = False) -> List[HUDPPacket]:
+    """
+    The fragments of a message, of FRAGMENT_SIZE bytes of it each.
+    """
+    return [HUDPPacket.create(0, 0, data, isReliable=isReliable, isFragment=True)
+            for data in HUDPPacket.fragment(messageId, message, FRAGMENT_SIZE)]
+
+
+class ReassemblyBufferTest(unittest.TestCase):
+    def test_out_of_order_run_is_taken_out_once_gap_is_filled(self):
+        buffer = ReassemblyBuffer()
+        for index in (3, 1, 2, 5):
+            self.assertTrue(buffer.insert(reliable(index), seqOf(0)))
+        self.assertEqual(buffer.popContiguous(seqOf(0)), [])
+        self.assertEqual(buffer.firstSeq(), seqOf(1))
+        run = buffer.popContiguous(seqOf(1))
+        self.assertEqual([recvingPacket.packet.seq for recvingPacket in run], [seqOf(1), seqOf(2), seqOf(3)])
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(buffer.firstSeq(), seqOf(5))
+
+    def test_duplicates_are_dropped(self):
+        buffer = ReassemblyBuffer()
+        self.assertTrue(buffer.insert(reliable(2), seqOf(0)))
+        self.assertFalse(buffer.insert(reliable(2), seqOf(0)))
+        # Already delivered
+        self.assertFalse(buffer.insert(reliable(0), seqOf(1)))
+        self.assertEqual(len(buffer), 1)
+
+    def test_ranges_are_merged_in_order(self):
+        buffer = ReassemblyBuffer()
+        for index in (7, 2, 3, 5, 4, 9):
+            buffer.insert(reliable(index), seqOf(0))
+        self.assertEqual(buffer.ranges(), [(seqOf(2), seqOf(6)), (seqOf(7), seqOf(8)), (seqOf(9), seqOf(10))])
+        self.assertEqual(ReassemblyBuffer().ranges(), [])
+
+    def test_ack_skips_ahead_after_timeout(self):
+        context = GNSContext()
+        self.addCleanup(context.sock.close)
+        context.ack = seqOf(0)
+        state = GNSStateEstablished()
+        for index in (2, 3, 5):
+            context.recvWindow.put(reliable(index))
+        state.process(context)
+        self.assertEqual(context.ack, seqOf(0))
+        self.assertTrue(context.recvBuffer.empty())
+
+        state.timeOnCurrentAck -= SKIP_AHEAD_TIMEOUT + 1
+        state.process(context)
+        # Packets 0 and 1 are given up on, 2 and 3 are delivered and 5 waits for 4
+        self.assertEqual(context.ack, seqOf(4))
+        self.assertEqual(context.counters.skipAheads, 1)
+        delivered = [context.recvBuffer.get_nowait()[:3] for _ in range(context.recvBuffer.qsize())]
+        self.assertEqual(delivered, [b"002", b"003"])
+        self.assertEqual(context.reassembly.firstSeq(), seqOf(5))
+
+
+class StreamBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.buffer = StreamBuffer(timeout=1.0)
+        self.packets = [reliable(index).packet for index in range(6)]
+
+    def test_out_of_order_packets_wait_for_their_stream(self):
+        self.assertEqual(self.buffer.offer(1, 1, self.packets[1], 0.0), [])
+        self.assertEqual(self.buffer.offer(1, 2, self.packets[2], 0.0), [])
+        # Stream 2 is not held back by the gap on stream 1
+        self.assertEqual(self.buffer.offer(2, 0, self.packets[3], 0.0), [self.packets[3]])
+        self.assertEqual(self.buffer.offer(1, 0, self.packets[0], 0.0), self.packets[:3])
+        self.assertIsNone(self.buffer.deadline())
+
+    def test_duplicates_are_dropped(self):
+        self.assertEqual(self.buffer.offer(1, 0, self.packets[0], 0.0), [self.packets[0]])
+        self.assertEqual(self.buffer.offer(1, 0, self.packets[0], 0.0), [])
+        self.assertEqual(self.buffer.offer(1, 2, self.packets[2], 0.0), [])
+        self.assertEqual(self.buffer.offer(1, 2, self.packets[2], 0.0), [])
+        self.assertEqual(self.buffer.offer(1, 1, self.packets[1], 0.0), self.packets[1:3])
+
+    def test_stalled_stream_skips_gap_after_timeout(self):
+        self.buffer.offer(1, 2, self.packets[2], 0.0)
+        self.buffer.offer(1, 3, self.packets[3], 0.5)
+        self.buffer.offer(1, 5, self.packets[5], 0.5)
+        self.assertEqual(self.buffer.deadline(), 1.0)
+        self.assertEqual(self.buffer.skipStalled(1.0), [])
+        self.assertEqual(self.buffer.skipStalled(1.5), self.packets[2:4])
+        self.assertEqual(self.buffer.skips, 1)
+        # The gap left before packet 5 counts from the skip
+        self.assertEqual(self.buffer.deadline(), 2.5)
+        # Skipped packets arriving late are dropped
+        self.assertEqual(self.buffer.offer(1, 0, self.packets[0], 2.0), [])
+        self.assertEqual(self.buffer.offer(1, 4, self.packets[4], 2.0), self.packets[4:6])
+
+    def test_stream_sequence_wraps_around(self):
+        last = (1 << 32) - 1
+        self.buffer.streams[1] = OrderedStream()
+        self.buffer.streams[1].nextSeq = last
+        self.assertEqual(self.buffer.offer(1, 0, self.packets[1], 0.0), [])
+        self.assertEqual(self.buffer.offer(1, last, self.packets[0], 0.0), self.packets[:2])
+        self.assertEqual(self.buffer.streams[1].nextSeq, 1)
+
+
+class FragmentAssemblerTest(unittest.TestCase):
+    def test_fragments_out_of_order(self):
+        assembler = FragmentAssembler()
+        parts = fragments(1, MESSAGE)
+        for packet in reversed(parts[1:]):
+            self.assertIsNone(assembler.add(packet, 0.0))
+        self.assertEqual(assembler.add(parts[0], 0.0), MESSAGE)
+        self.assertEqual(len(assembler), 0)
+
+    def test_duplicate_fragments_are_ignored(self):
+        assembler = FragmentAssembler()
+        first, *rest = fragments(1, MESSAGE)
+        self.assertIsNone(assembler.add(first, 0.0))
+        self.assertIsNone(assembler.add(first, 0.0))
+        for packet in rest[:-1]:
+            self.assertIsNone(assembler.add(packet, 0.0))
+        self.assertEqual(assembler.add(rest[-1], 0.0), MESSAGE)
+
+    def test_channels_do_not_mix(self):
+        assembler = FragmentAssembler()
+        unreliable, reliable = fragments(1, MESSAGE), fragments(1, MESSAGE[::-1], True)
+        for packet in unreliable[:-1] + reliable[:-1]:
+            self.assertIsNone(assembler.add(packet, 0.0))
+        self.assertEqual(assembler.add(reliable[-1], 0.0), MESSAGE[::-1])
+        self.assertEqual(assembler.add(unreliable[-1], 0.0), MESSAGE)
+
+    def test_incomplete_message_times_out(self):
+        assembler = FragmentAssembler(timeout=1.0)
+        lost = fragments(1, MESSAGE)
+        self.assertIsNone(assembler.add(lost[0], 0.0))
+        # The next message drops the one whose latest fragment is older than the timeout
+        self.assertIsNone(assembler.add(fragments(2, MESSAGE)[0], 2.0))
+        self.assertEqual(len(assembler), 1)
+        for packet in lost[1:]:
+            self.assertIsNone(assembler.add(packet, 2.0))
+
+    def test_least_recently_updated_message_is_evicted(self):
+        assembler = FragmentAssembler(maxMessages=2)
+        for messageId in (1, 2, 3):
+            self.assertIsNone(assembler.add(fragments(messageId, MESSAGE)[0], 0.0))
+        self.assertEqual(len(assembler), 2)
+        self.assertEqual(sorted(messageId for _, messageId in assembler.partials), [2, 3])
+
+    def test_fragment_past_message_size_is_dropped(self):
+        assembler = FragmentAssembler()
+        packet = HUDPPacket.create(0, 0, FRAGMENT_HEADER.pack(1, 8, 4) + bytes(FRAGMENT_SIZE), isFragment=True)
+        self.assertIsNone(assembler.add(packet, 0.0))
+        self.assertEqual(len(assembler), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import heapq
+import unittest
+
+from rtt import RttEstimator
+
+PATH_RTT = 0.300
+SEND_INTERVAL = 0.020
+PACKET_COUNT = 200
+PACKET_SIZE = 100
+
+
+def simulate(estimator: RttEstimator):
+    """
+    Send PACKET_COUNT reliable packets every SEND_INTERVAL over a lossless path of PATH_RTT, retransmitting each
+    packet whose timeout expires before its ACK, as the sending thread does.
+    Return the number of transmissions of each packet.
+    """
+    transmissions = [0] * PACKET_COUNT
+    acked = [False] * PACKET_COUNT
+    # (time, kind, packet index, attempts before this one), ACKs first on a tie
+    events = [(i * SEND_INTERVAL, 1, i, 0) for i in range(PACKET_COUNT)]
+    heapq.heapify(events)
+    while events:
+        currentTime, kind, index, attempts = heapq.heappop(events)
+        expectedAck = (index + 1) * PACKET_SIZE
+        if kind == 0:
+            acked[index] = True
+            estimator.onAck(expectedAck, currentTime)
+        elif not acked[index]:
+            estimator.onTransmit(expectedAck, currentTime, attempts > 0)
+            transmissions[index] += 1
+            heapq.heappush(events, (currentTime + PATH_RTT, 0, index, attempts))
+            heapq.heappush(events, (currentTime + estimator.timeout(attempts), 1, index, attempts + 1))
+    return transmissions
+
+
+class RttEstimatorTest(unittest.TestCase):
+    def test_converges_on_path_slower_than_initial_rto(self):
+        estimator = RttEstimator()
+        self.assertLess(estimator.rto, PATH_RTT)
+        transmissions = simulate(estimator)
+
+        self.assertIsNotNone(estimator.srtt)
+        self.assertAlmostEqual(estimator.srtt, PATH_RTT, delta=0.01)
+        self.assertGreater(estimator.rto, PATH_RTT)
+        # Once the RTO backed off past the RTT, packets are sent once and give samples
+        self.assertEqual(transmissions[PACKET_COUNT // 2:], [1] * (PACKET_COUNT - PACKET_COUNT // 2))
+
+    def test_backs_off_once_per_timeout(self):
+        estimator = RttEstimator()
+        initialRto = estimator.rto
+        for index in range(10):
+            estimator.onTransmit((index + 1) * PACKET_SIZE, 1.0, True)
+        self.assertEqual(estimator.rto, initialRto * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
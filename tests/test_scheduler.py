@@ -0,0 +1,104 @@
+import unittest
+from typing import List
+
+from api.gnscontext import SendingHUDPPacket
+from common import CONGESTION_MSS, PRIORITY_BULK, PRIORITY_CRITICAL, PRIORITY_REALTIME, PRIORITY_WEIGHTS
+from hudp import HEADER_SIZE, HUDPPacket
+from scheduler import PacketScheduler, StrictPriorityScheduler, WeightedFairScheduler
+
+
+def dataPacket(priority: int, size: int = CONGESTION_MSS) -> SendingHUDPPacket:
+    """
+    A reliable data packet of class 'priority', 'size' bytes on the wire.
+    """
+    return SendingHUDPPacket(HUDPPacket.create(0, 0, bytes(size - HEADER_SIZE), isReliable=True), priority)
+
+
+def drain(scheduler: PacketScheduler, count: int) -> List[int]:
+    """
+    Take out 'count' packets and return their classes, in the order they are sent.
+    """
+    return [scheduler.popleft().priority for _ in range(count)]
+
+
+class WeightedFairSchedulerTest(unittest.TestCase):
+    def test_classes_share_rounds_by_weight(self):
+        scheduler = WeightedFairScheduler()
+        for priority in (PRIORITY_BULK, PRIORITY_REALTIME, PRIORITY_CRITICAL):
+            for _ in range(100):
+                scheduler.append(dataPacket(priority))
+        rounds = 5
+        sent = drain(scheduler, rounds * sum(PRIORITY_WEIGHTS))
+        # A round starts from the most important class, each class sending 'weight' full-sized packets
+        self.assertEqual(sent[:sum(PRIORITY_WEIGHTS)], [priority for priority, weight in enumerate(PRIORITY_WEIGHTS)
+                                                        for _ in range(weight)])
+        self.assertEqual([sent.count(priority) for priority in range(len(PRIORITY_WEIGHTS))],
+                         [rounds * weight for weight in PRIORITY_WEIGHTS])
+
+    def test_credit_is_counted_in_bytes(self):
+        scheduler = WeightedFairScheduler((1, 1, 1))
+        for _ in range(100):
+            scheduler.append(dataPacket(PRIORITY_CRITICAL))
+            scheduler.append(dataPacket(PRIORITY_BULK, CONGESTION_MSS // 4))
+        sent = drain(scheduler, 50)
+        # Four small packets fit in the quantum of a full-sized one
+        self.assertEqual(sent[:5], [PRIORITY_CRITICAL] + [PRIORITY_BULK] * 4)
+        self.assertEqual(sent.count(PRIORITY_BULK), 4 * sent.count(PRIORITY_CRITICAL))
+
+    def test_unused_credit_carries_over_while_class_is_backlogged(self):
+        scheduler = WeightedFairScheduler((1, 1, 1))
+        packetSize = CONGESTION_MSS * 3 // 4
+        for _ in range(100):
+            scheduler.append(dataPacket(PRIORITY_CRITICAL))
+            scheduler.append(dataPacket(PRIORITY_BULK, packetSize))
+        sent = drain(scheduler, 70)
+        self.assertEqual(sent[:2], [PRIORITY_CRITICAL, PRIORITY_BULK])
+        # Both classes end up sending as many bytes, within a packet
+        criticalBytes = sent.count(PRIORITY_CRITICAL) * CONGESTION_MSS
+        bulkBytes = sent.count(PRIORITY_BULK) * packetSize
+        self.assertLessEqual(abs(criticalBytes - bulkBytes), CONGESTION_MSS)
+
+    def test_empty_class_gives_up_its_credit(self):
+        scheduler = WeightedFairScheduler()
+        scheduler.append(dataPacket(PRIORITY_CRITICAL, CONGESTION_MSS // 2))
+        for _ in range(20):
+            scheduler.append(dataPacket(PRIORITY_BULK))
+        self.assertEqual(drain(scheduler, 2), [PRIORITY_CRITICAL, PRIORITY_BULK])
+        self.assertEqual(scheduler.deficits[PRIORITY_CRITICAL], 0)
+        # Once back, the class gets a single quantum, not the credit it left unused
+        for _ in range(20):
+            scheduler.append(dataPacket(PRIORITY_CRITICAL))
+        weight = PRIORITY_WEIGHTS[PRIORITY_CRITICAL]
+        self.assertEqual(drain(scheduler, weight + 1), [PRIORITY_CRITICAL] * weight + [PRIORITY_BULK])
+
+    def test_control_packets_wait_for_every_class(self):
+        scheduler = WeightedFairScheduler()
+        fin = SendingHUDPPacket(HUDPPacket.create(0, 0, isReliable=True, isFin=True))
+        scheduler.append(dataPacket(PRIORITY_BULK))
+        scheduler.append(fin)
+        scheduler.append(dataPacket(PRIORITY_CRITICAL))
+        self.assertEqual(len(scheduler), 3)
+        self.assertEqual(drain(scheduler, 2), [PRIORITY_CRITICAL, PRIORITY_BULK])
+        self.assertIs(scheduler.peek(), fin)
+        self.assertIs(scheduler.popleft(), fin)
+        self.assertEqual(len(scheduler), 0)
+        self.assertIsNone(scheduler.peek())
+
+    def test_weights_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            WeightedFairScheduler((1, 0, 1))
+        with self.assertRaises(ValueError):
+            WeightedFairScheduler((1, 1))
+
+
+class StrictPrioritySchedulerTest(unittest.TestCase):
+    def test_most_important_class_goes_first(self):
+        scheduler = StrictPriorityScheduler()
+        for priority in (PRIORITY_BULK, PRIORITY_REALTIME, PRIORITY_CRITICAL, PRIORITY_REALTIME):
+            scheduler.append(dataPacket(priority))
+        self.assertEqual(drain(scheduler, 4), [PRIORITY_CRITICAL, PRIORITY_REALTIME, PRIORITY_REALTIME,
+                                               PRIORITY_BULK])
+
+
+if __name__ == "__main__":
+    unittest.main()
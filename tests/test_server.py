@@ -0,0 +1,63 @@
+import time
+import unittest
+
+from api.gnsserver import GameNetServer
+from hudp import HUDPPacket
+
+SYN = HUDPPacket.create(0, 0, isReliable=True, isSyn=True).toBytes()
+
+
+def createServer() -> GameNetServer:
+    server = GameNetServer()
+    for setEnable in (server.setEnableLogSend, server.setEnableLogRecv, server.setEnableLogMetrics,
+                      server.setEnableLogInfo):
+        setEnable(False)
+    # Datagrams are injected with _dispatch() and the connections are driven with _step() from this thread
+    server.isListening = True
+    return server
+
+
+class GameNetServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = createServer()
+
+    def tearDown(self):
+        self.server.sock.close()
+
+    def test_syn_flood_is_bounded_by_pending_limit(self):
+        self.server.setConnectionLimits(maxPending=16, maxConnections=64)
+        for port in range(20000, 20100):
+            self.server._dispatch(SYN, ("127.0.0.1", port))
+        self.assertEqual(len(self.server.connections), 16)
+        self.assertEqual(self.server.pendingCount, 16)
+        self.assertEqual(self.server.droppedSyns, 84)
+
+    def test_half_open_connections_are_dropped_after_handshake_timeout(self):
+        self.server.setConnectionLimits(handshakeTimeout=0.05)
+        for port in range(20000, 20010):
+            self.server._dispatch(SYN, ("127.0.0.1", port))
+        self.server._step(time.time())
+        self.assertEqual(len(self.server.connections), 10)
+
+        self.server._step(time.time() + 0.1)
+        self.assertEqual(len(self.server.connections), 0)
+        self.assertEqual(self.server.pendingCount, 0)
+        # Room was made for new remotes
+        self.assertTrue(self.server._dispatch(SYN, ("127.0.0.1", 20000)))
+
+    def test_completed_handshakes_leave_pending_count(self):
+        self.server.setConnectionLimits(maxPending=1, maxConnections=2)
+        for port in (20000, 20001):
+            addrPort = ("127.0.0.1", port)
+            self.assertTrue(self.server._dispatch(SYN, addrPort))
+            self.server._step(time.time())
+            self.server._dispatch(HUDPPacket.createPureAck(1, 1).toBytes(), addrPort)
+            self.server._step(time.time())
+            self.assertEqual(self.server.pendingCount, 0)
+        self.assertEqual(self.server.acceptQueue.qsize(), 2)
+        # Both connections are up, the total limit is reached
+        self.assertFalse(self.server._dispatch(SYN, ("127.0.0.1", 20002)))
+
+
+if __name__ == "__main__":
+    unittest.main()
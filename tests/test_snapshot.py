@@ -0,0 +1,69 @@
+import unittest
+
+from snapshot import COUNT, NO_BASELINE, SNAPSHOT_HEADER, SnapshotDecoder, SnapshotEncoder
+
+
+class SnapshotDecoderTest(unittest.TestCase):
+    def test_round_trip(self):
+        encoder, decoder = SnapshotEncoder(), SnapshotDecoder()
+        snapshot = {1: b"player", 2: b"crate"}
+        snapshotId, decoded = decoder.decode(encoder.encode(snapshot))
+        self.assertEqual(decoded, snapshot)
+
+    def test_truncated_delta_is_not_decoded(self):
+        data = SnapshotEncoder().encode({1: b"player", 2: b"crate"})
+        for size in range(len(data)):
+            decoder = SnapshotDecoder()
+            self.assertIsNone(decoder.decode(data[:size]), f"{size} of {len(data)} bytes")
+            # A malformed delta leaves the decoder as it was
+            self.assertIsNone(decoder.latestId)
+        self.assertIsNotNone(SnapshotDecoder().decode(data))
+
+    def test_garbage_is_not_decoded(self):
+        self.assertIsNone(SnapshotDecoder().decode(b"\x00\x00\x00\x01\x00\x00\x00\x00\xff\xff\xff\xff"))
+
+
+class SnapshotDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.encoder, self.decoder = SnapshotEncoder(historySize=4), SnapshotDecoder(historySize=4)
+        self.baseline = {1: b"player", 2: b"crate", 3: b"door"}
+        baselineId, _ = self.decoder.decode(self.encoder.encode(self.baseline))
+        self.encoder.onAck(baselineId)
+
+    def test_delta_round_trip(self):
+        snapshot = {1: b"player moved", 3: b"door", 4: b"rocket"}
+        data = self.encoder.encode(snapshot)
+        self.assertNotEqual(SNAPSHOT_HEADER.unpack_from(data)[1], NO_BASELINE)
+        # Only the entities that changed are sent
+        self.assertNotIn(b"door", data)
+        self.assertEqual(self.decoder.decode(data)[1], snapshot)
+
+    def test_unchanged_snapshot_is_empty_delta(self):
+        data = self.encoder.encode(self.baseline)
+        self.assertEqual(len(data), SNAPSHOT_HEADER.size + 2 * COUNT.size)
+        self.assertEqual(self.decoder.decode(data)[1], self.baseline)
+
+    def test_lost_snapshots_are_skipped(self):
+        self.encoder.encode({1: b"lost"})
+        snapshot = {1: b"player", 2: b"crate moved"}
+        self.assertEqual(self.decoder.decode(self.encoder.encode(snapshot))[1], snapshot)
+
+    def test_stale_snapshot_is_dropped(self):
+        older = self.encoder.encode({1: b"older"})
+        newer = self.encoder.encode({1: b"newer"})
+        self.assertIsNotNone(self.decoder.decode(newer))
+        self.assertIsNone(self.decoder.decode(older))
+
+    def test_unknown_baseline_is_dropped(self):
+        self.assertIsNone(SnapshotDecoder().decode(self.encoder.encode({1: b"player"})))
+
+    def test_full_snapshot_once_baseline_is_forgotten(self):
+        for _ in range(4):
+            self.encoder.encode(self.baseline)
+        data = self.encoder.encode(self.baseline)
+        self.assertEqual(SNAPSHOT_HEADER.unpack_from(data)[1], NO_BASELINE)
+        self.assertEqual(SnapshotDecoder().decode(data)[1], self.baseline)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+from __future__ import annotations
+from threading import Lock
+from typing import Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+import math
+import time
+
+from common import TIMER_RESOLUTION, TIMER_SLOTS
+
+T = TypeVar("T", bound=Hashable)
+
+
+class TimingWheel(Generic[T]):
+    """
+    Hashed timing wheel holding the retransmission deadlines of packets.
+
+    Time is cut into ticks of 'resolution' seconds and every timer is placed in the slot of its tick, modulo
+    the number of slots, so arming and cancelling a timer are O(1). Expiring only visits the slots of the ticks
+    that passed since the last call, and within them the timers that fire, plus the few that are due in a later
+    rotation of the wheel. A timer never fires before its deadline and at most one tick after it.
+    Timers of the same tick fire in the order they were armed, so packets queued together are sent in order.
+
+    """
+
+    def __init__(self, resolution: float = TIMER_RESOLUTION, slotCount: int = TIMER_SLOTS,
+                 currentTime: Optional[float] = None):
+        self.resolution = resolution
+        """
+        Length of a tick in seconds.
+        """
+
+        self.slotCount = slotCount
+        """
+        Number of slots of the wheel. The timers of tick t are in slot t % slotCount.
+        """
+
+        self.slots: Dict[int, Dict[T, None]] = {}
+        """
+        Timers of each non-empty slot, in the order they were armed. Empty slots are removed,
+        so that a connection with no packet in flight does not pay for the whole wheel.
+        """
+
+        self.ticks: Dict[T, int] = {}
+        """
+        Tick at which each armed timer fires.
+        """
+
+        self.lastTick = self.__tickOf(time.time() if currentTime is None else currentTime) - 1
+        """
+        Last tick whose timers were expired.
+        """
+
+        self.mutex = Lock()
+        """
+        Protects the slots, since timers are armed by the user and expired by the sending thread.
+        """
+
+    def __len__(self) -> int:
+        return len(self.ticks)
+
+    def schedule(self, item: T, at: float):
+        """
+        Arm a timer for 'item' firing at time 'at', replacing its previous timer if any.
+        Timers in the past fire on the next call to expire().
+        """
+        with self.mutex:
+            tick = max(math.ceil(at / self.resolution), self.lastTick + 1)
+            previousTick = self.ticks.get(item)
+            if previousTick is not None:
+                self.__discard(item, previousTick)
+            self.ticks[item] = tick
+            slot = self.slots.get(tick % self.slotCount)
+            if slot is None:
+                slot = self.slots[tick % self.slotCount] = {}
+            slot[item] = None
+
+    def cancel(self, item: T) -> bool:
+        """
+        Disarm the timer of 'item'. Return True if it was armed. False otherwise.
+        """
+        with self.mutex:
+            tick = self.ticks.pop(item, None)
+            if tick is None:
+                return False
+            self.__discard(item, tick)
+            return True
+
+    def expire(self, currentTime: float) -> List[T]:
+        """
+        Disarm and return the items whose timer fired by 'currentTime', ordered by deadline.
+        """
+        currentTick = self.__tickOf(currentTime)
+        expired: List[Tuple[int, T]] = []
+        with self.mutex:
+            if currentTick <= self.lastTick:
+                return []
+            # After a full rotation every slot has been visited, the remaining ticks would only revisit them
+            for tick in range(self.lastTick + 1, min(currentTick, self.lastTick + self.slotCount) + 1):
+                slot = self.slots.get(tick % self.slotCount)
+                if slot is None:
+                    continue
+                fired = [(self.ticks[item], item) for item in slot if self.ticks[item] <= currentTick]
+                for _, item in fired:
+                    del slot[item]
+                    del self.ticks[item]
+                if not slot:
+                    del self.slots[tick % self.slotCount]
+                expired.extend(fired)
+            self.lastTick = currentTick
+        # Slots are visited in order of their tick, so this is only needed after a wrap-around
+        expired.sort(key=lambda timer: timer[0])
+        return [item for _, item in expired]
+
+    def nextExpiry(self) -> Optional[float]:
+        """
+        Return the time at which expire() should next be called, or None if no timer is armed.
+        It may be earlier than the first deadline if that deadline is more than one rotation away.
+        """
+        with self.mutex:
+            if not self.ticks:
+                return None
+            for tick in range(self.lastTick + 1, self.lastTick + self.slotCount + 1):
+                if tick % self.slotCount in self.slots:
+                    return tick * self.resolution
+            return min(self.ticks.values()) * self.resolution
+
+    def __discard(self, item: T, tick: int):
+        """
+        Remove 'item' from the slot of 'tick', and the slot itself if it becomes empty.
+        """
+        slot = self.slots[tick % self.slotCount]
+        del slot[item]
+        if not slot:
+            del self.slots[tick % self.slotCount]
+
+    def __tickOf(self, currentTime: float) -> int:
+        """
+        Return the last tick that started at or before 'currentTime'.
+        """
+        # Tolerate the rounding error of tick * resolution, as returned by nextExpiry()
+        return math.floor(currentTime / self.resolution + 1e-6)